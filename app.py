@@ -6,20 +6,42 @@
 """
 
 
-import boto3 #To access AWS resources
-
-from fastapi import FastAPI #To create the FastAPI app
-from fastapi.responses import JSONResponse #To return json response
+from contextlib import asynccontextmanager, aclosing, AsyncExitStack #To manage clients lifetime
+from fastapi import FastAPI, Header, Request, WebSocket, WebSocketDisconnect #To create the FastAPI app
+from fastapi.responses import JSONResponse, Response, StreamingResponse #To return json, metrics or streamed response
+from starlette.background import BackgroundTask #To release the session lock after a stream
 
+import asyncio #To handle stream cancellation
 import json #Json manipulation
+import logging #Leveled logs, written by lib.AsyncLogging
+import math #To round the Retry-After delays
 import os #To access environement variables
 from pydantic import BaseModel #To hanlde ChatRequest
 import time #To trace execution time
 
+from lib.AdmissionControl import AdmissionControl, AdmissionRejected #To bound the requests waiting for Gemini
+from lib.AsyncLogging import setupLogging, getPayloadLogger #To write the logs off the event loop
 from lib.ChatContent import ChatContent #To manage history chat
-from lib.DynamoWrapper import DynamoWrapper #To communicate with dynamodb
-from lib.GeminiWrapper import GeminiWrapper #To communicate with Gemini
+from lib.ChatSessionPool import ChatSessionPool #To reuse the live histories of the active sessions
+from lib.ContextPolicy import ContextPolicy #To bound the history sent to Gemini
+from lib.CircuitBreaker import CircuitBreaker, CircuitOpenError #To fail fast while Gemini is unhealthy
+from lib.HistoryCache import HistoryCache #To cache the histories read from the store
+from lib.HistoryCodec import HistoryCodec #To compress the stored messages
+from lib.MemoryHistoryStore import MemoryHistoryStore #To keep the histories in memory
+from lib.SqliteHistoryStore import SqliteHistoryStore #To keep the histories in a SQLite file
+from lib.HistoryWriter import HistoryWriter #To write the histories off the response path
+from lib.IdempotencyStore import IdempotencyStore, IdempotencyConflict #To run the retried requests once
+from lib.Metrics import Metrics, MetricsMiddleware #To expose Prometheus metrics
+from lib.ResponseCache import ResponseCache #To reuse the replies of identical requests
+from lib.SessionLocks import SessionLocks #To run the requests of a session in order
+#The SDKs are imported on demand: aiobotocore, boto3 (lib.AsyncDynamoWrapper, lib.S3BlockStore) with
+#HISTORY_STORE=dynamodb only, google.generativeai (lib.AsyncGeminiWrapper, lib.CallPolicy) by the
+#warm-up started by the lifespan, so the app starts without waiting for them
+
 
+logger = logging.getLogger(__name__)
+#Prompts, replies and histories, only logged with LOG_PAYLOADS=true
+payload_logger = getPayloadLogger(__name__)
 
 #Set region if nessary
 #if not os.getenv("AWS_REGION"):
@@ -33,76 +55,749 @@ class ChatRequest(BaseModel):
     prompt: str
     session_id: str
 
+# Pydantic model for the body of /chat/batch
+class BatchChatRequest(BaseModel):
+    requests: list[ChatRequest]
+
 
-#DynamoDb table
+#Backend of the histories: "dynamodb", "sqlite" (single node, WAL file) or "memory" (single node, not persisted)
+HISTORY_STORE=os.getenv('HISTORY_STORE', "dynamodb").lower()
+HISTORY_SQLITE_PATH=os.getenv('HISTORY_SQLITE_PATH', "history.db")
+#Encoding of the stored messages: "none" (json string) or "zlib" (compressed Binary above HISTORY_COMPRESSION_MIN_BYTES),
+#both formats are always read
+HISTORY_COMPRESSION=os.getenv('HISTORY_COMPRESSION', "none").lower()
+HISTORY_COMPRESSION_MIN_BYTES=int(os.getenv('HISTORY_COMPRESSION_MIN_BYTES', 256))
+#S3 bucket of the turns too large for a DynamoDb item (empty to disable), size threshold
+#of the encoded turns and size of the cache of the downloaded blocks
+HISTORY_OVERFLOW_BUCKET=os.getenv('HISTORY_OVERFLOW_BUCKET', "")
+HISTORY_OVERFLOW_BYTES=int(os.getenv('HISTORY_OVERFLOW_BYTES', 300*1024))
+HISTORY_OVERFLOW_CACHE_BYTES=int(os.getenv('HISTORY_OVERFLOW_CACHE_BYTES', 32*1024*1024))
+
+#DynamoDb tables (table names of the other stores)
+#Per-turn history (session_id hash key, turn sort key)
+TABLE_HISTORY_TURNS=os.getenv('TABLE_HISTORY_TURNS', "ChatHistoryTurns")
+#Legacy single-blob history, sessions are migrated to TABLE_HISTORY_TURNS on first read
 TABLE_HISTORY=os.getenv('TABLE_HISTORY', "ChatHistory")
-# FastAPI app initialization
-app = FastAPI()
+#Number of turns sent back to Gemini, 0 to send the whole history
+HISTORY_MAX_TURNS=int(os.getenv('HISTORY_MAX_TURNS', 0))
+#History cache limits
+HISTORY_CACHE_MAX_ENTRIES=int(os.getenv('HISTORY_CACHE_MAX_ENTRIES', 1024))
+HISTORY_CACHE_MAX_BYTES=int(os.getenv('HISTORY_CACHE_MAX_BYTES', 64*1024*1024))
+#Write-behind of the history (the response doesn't wait for the store)
+HISTORY_WRITE_BEHIND=os.getenv('HISTORY_WRITE_BEHIND', "true").lower() == "true"
+HISTORY_WRITE_QUEUE_SIZE=int(os.getenv('HISTORY_WRITE_QUEUE_SIZE', 10000))
+HISTORY_WRITE_MAX_RETRIES=int(os.getenv('HISTORY_WRITE_MAX_RETRIES', 3))
+#Context sent to Gemini: token budget (0 for no budget), token counter ("estimate" or "gemini")
+CONTEXT_MAX_TOKENS=int(os.getenv('CONTEXT_MAX_TOKENS', 0))
+CONTEXT_TOKEN_COUNTER=os.getenv('CONTEXT_TOKEN_COUNTER', "estimate")
+#Rolling summary of the turns left out of the context
+CONTEXT_SUMMARY=os.getenv('CONTEXT_SUMMARY', "false").lower() == "true"
+CONTEXT_SUMMARY_EVERY=int(os.getenv('CONTEXT_SUMMARY_EVERY', 4))
+#Pool of the live chat histories of the active sessions (the next turn skips their conversion),
+#limits and time an unused history is kept in seconds
+CHAT_POOL=os.getenv('CHAT_POOL', "true").lower() == "true"
+CHAT_POOL_MAX_ENTRIES=int(os.getenv('CHAT_POOL_MAX_ENTRIES', 1024))
+CHAT_POOL_MAX_BYTES=int(os.getenv('CHAT_POOL_MAX_BYTES', 64*1024*1024))
+CHAT_POOL_TTL=float(os.getenv('CHAT_POOL_TTL', 600))
+#Cache of the replies of identical requests (same model, config, history and prompt)
+RESPONSE_CACHE=os.getenv('RESPONSE_CACHE', "false").lower() == "true"
+RESPONSE_CACHE_TTL=int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+RESPONSE_CACHE_MAX_ENTRIES=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+#Optional table of the store to share the cached replies (between nodes with DynamoDb)
+TABLE_RESPONSE_CACHE=os.getenv('TABLE_RESPONSE_CACHE', "")
+#Idempotency-Key of /chat/: time a result is kept in seconds and maximum number in memory
+IDEMPOTENCY=os.getenv('IDEMPOTENCY', "true").lower() == "true"
+IDEMPOTENCY_TTL=int(os.getenv('IDEMPOTENCY_TTL', 3600))
+IDEMPOTENCY_MAX_ENTRIES=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', 10000))
+#Optional table of the store to share the keys between nodes, maximum wait of a duplicate for the
+#node running the request and time the claim of a crashed node is kept in seconds
+TABLE_IDEMPOTENCY=os.getenv('TABLE_IDEMPOTENCY', "")
+IDEMPOTENCY_MAX_WAIT=float(os.getenv('IDEMPOTENCY_MAX_WAIT', 30))
+IDEMPOTENCY_PENDING_TTL=int(os.getenv('IDEMPOTENCY_PENDING_TTL', 120))
+
+#Maximum wait of a request for the previous request of its session in seconds (0 to wait forever),
+#then it runs concurrently and the store merges the turns
+SESSION_LOCK_TIMEOUT=float(os.getenv('SESSION_LOCK_TIMEOUT', 60))
+
+#Admission control in front of Gemini: turns running at the same time (0 for no limit),
+#turns waiting for a slot and maximum wait in seconds, beyond them the request gets a 429 / 503
+GEMINI_MAX_CONCURRENCY=int(os.getenv('GEMINI_MAX_CONCURRENCY', 32))
+GEMINI_MAX_QUEUE=int(os.getenv('GEMINI_MAX_QUEUE', 64))
+GEMINI_MAX_QUEUE_WAIT=float(os.getenv('GEMINI_MAX_QUEUE_WAIT', 10))
+
+#Gemini calls: deadline of an attempt in seconds (until the first chunk of a stream), deadline of a
+#whole stream, attempts of a call on retryable errors (unavailable, internal, timeouts)
+GEMINI_TIMEOUT=float(os.getenv('GEMINI_TIMEOUT', 30))
+GEMINI_STREAM_TIMEOUT=float(os.getenv('GEMINI_STREAM_TIMEOUT', 300))
+GEMINI_MAX_ATTEMPTS=int(os.getenv('GEMINI_MAX_ATTEMPTS', 3))
+#Hedged requests: a second attempt is sent after the p95 latency (at least GEMINI_HEDGE_MIN_DELAY seconds)
+GEMINI_HEDGE=os.getenv('GEMINI_HEDGE', "false").lower() == "true"
+GEMINI_HEDGE_MIN_DELAY=float(os.getenv('GEMINI_HEDGE_MIN_DELAY', 1.0))
+#Circuit breaker: opens when at least GEMINI_CIRCUIT_FAILURES (0 to disable) of the last 20 calls failed
+#and they are GEMINI_CIRCUIT_FAILURE_RATIO of them, tries again after GEMINI_CIRCUIT_RESET seconds
+GEMINI_CIRCUIT_FAILURES=int(os.getenv('GEMINI_CIRCUIT_FAILURES', 5))
+GEMINI_CIRCUIT_FAILURE_RATIO=float(os.getenv('GEMINI_CIRCUIT_FAILURE_RATIO', 0.5))
+GEMINI_CIRCUIT_RESET=float(os.getenv('GEMINI_CIRCUIT_RESET', 30))
+
+#Batch chat: maximum number of prompts per request and prompts sent to Gemini at the same time
+CHAT_BATCH_MAX_ITEMS=int(os.getenv('CHAT_BATCH_MAX_ITEMS', 1000))
+CHAT_BATCH_CONCURRENCY=int(os.getenv('CHAT_BATCH_CONCURRENCY', 16))
+
+#Http pools of the DynamoDb and S3 clients: connections (default: two per turn running at the same time,
+#a read and a write), idle time before a pooled connection is closed (below the 20 s of AWS),
+#connect / read timeouts in seconds, retry mode ("standard", "adaptive" or "legacy") and attempts
+DYNAMODB_MAX_POOL_CONNECTIONS=int(os.getenv('DYNAMODB_MAX_POOL_CONNECTIONS', 0)) or 2*max(GEMINI_MAX_CONCURRENCY,CHAT_BATCH_CONCURRENCY,32)
+DYNAMODB_KEEPALIVE_TIMEOUT=float(os.getenv('DYNAMODB_KEEPALIVE_TIMEOUT', 12))
+DYNAMODB_CONNECT_TIMEOUT=float(os.getenv('DYNAMODB_CONNECT_TIMEOUT', 2))
+DYNAMODB_READ_TIMEOUT=float(os.getenv('DYNAMODB_READ_TIMEOUT', 5))
+DYNAMODB_RETRY_MODE=os.getenv('DYNAMODB_RETRY_MODE', "standard")
+DYNAMODB_MAX_ATTEMPTS=int(os.getenv('DYNAMODB_MAX_ATTEMPTS', 3))
+
+#Websocket chat: a connection idle for WS_IDLE_TIMEOUT seconds is closed (0 to keep it open)
+WS_IDLE_TIMEOUT=float(os.getenv('WS_IDLE_TIMEOUT', 600))
 
-# LocalStack DynamoDB connection
-dynamodb = boto3.resource(
-    "dynamodb", 
-    endpoint_url= os.getenv('DYNAMODB_ENDPOINT', 'http://localhost:4566'),
-    region_name=region)
+#Logs: level, payload dumps (prompts, replies, histories), maximum message length,
+#ratio of the records below WARNING kept and format ("json" or "text")
+LOG_LEVEL=os.getenv('LOG_LEVEL', "INFO")
+LOG_PAYLOADS=os.getenv('LOG_PAYLOADS', "false").lower() == "true"
+LOG_MAX_LENGTH=int(os.getenv('LOG_MAX_LENGTH', 1000))
+LOG_SAMPLE_RATE=float(os.getenv('LOG_SAMPLE_RATE', 1.0))
+LOG_FORMAT=os.getenv('LOG_FORMAT', "json")
 
 #Get Gemini key (see docker-compose file)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY",None)
+#Several Gemini keys, comma separated (GEMINI_API_KEY if empty): the calls are spread on one client per key,
+#chosen by GEMINI_KEY_SELECTION ("least_loaded" or "round_robin")
+GEMINI_API_KEYS = [key.strip() for key in os.getenv("GEMINI_API_KEYS","").split(",") if key.strip()]
+GEMINI_KEY_SELECTION = os.getenv("GEMINI_KEY_SELECTION","least_loaded")
+#Calls per minute of a key (0 for no limit), time a key leaves the rotation after a quota error without
+#retry delay from Gemini and maximum wait of a call for an available key in seconds
+GEMINI_KEY_RPM = float(os.getenv("GEMINI_KEY_RPM",0))
+GEMINI_KEY_COOLDOWN = float(os.getenv("GEMINI_KEY_COOLDOWN",60))
+GEMINI_KEY_MAX_WAIT = float(os.getenv("GEMINI_KEY_MAX_WAIT",1))
+#Optional grpc endpoint of Gemini, e.g. http://127.0.0.1:50051 for the bench stand-in (bench/FakeGemini.py)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT","")
+#Model of the chats
+GEMINI_MODEL = os.getenv("GEMINI_MODEL","gemini-2.0-flash")
+#Interval of the keepalive pings of the Gemini channel while calls are running in seconds (0 to disable)
+GEMINI_KEEPALIVE = float(os.getenv("GEMINI_KEEPALIVE",60))
+#Maximum time spent by the warm-up opening the channel to Gemini in seconds (0 to skip it),
+#the app is ready without the channel
+GEMINI_WARMUP_TIMEOUT = float(os.getenv("GEMINI_WARMUP_TIMEOUT",5))
+#/ready: the history store is probed again when it didn't answer for READY_CHECK_MAX_AGE seconds
+READY_CHECK_MAX_AGE = float(os.getenv("READY_CHECK_MAX_AGE",30))
 
-#Helper to communicate with gemini
+#Helper to communicate with gemini, configured once and shared by every request,
+#None until the warm-up is done (see getGemini)
 gemini_wrapper = None
 
-#Helper to communicate with dynamodb on Localstack
-dynamodb_wrapper = DynamoWrapper(dynamodb)
+#Warm-up task of the Gemini client, and whether it opened the channel
+gemini_warmup = None
+gemini_connected = False
+
+#Keys of the Gemini calls with GEMINI_API_KEYS or GEMINI_KEY_RPM, None otherwise
+gemini_keys = None
+
+#Store of the histories (HISTORY_STORE), AsyncDynamoWrapper on Localstack by default
+history_store = None
+
+#Encoding of the messages written by history_store
+history_codec = None
+
+#S3 blocks of the large turns, None if disabled
+block_store = None
+
+#Cache of the session histories, in front of history_store
+history_cache = None
+
+#Write-behind queue of the history turns
+history_writer = None
+
+#Live chat histories of the sessions, None if disabled
+chat_pool = None
+
+#Choose the part of the history sent to Gemini
+context_policy = None
+
+#Results of the requests with an Idempotency-Key, None if disabled
+idempotency = None
+
+#Cache of the replies, None if disabled
+response_cache = None
+
+#Prometheus metrics
+metrics = Metrics(model_name=GEMINI_MODEL)
 
+#Requests of a session run one after the other in this process
+session_locks = SessionLocks(timeout=SESSION_LOCK_TIMEOUT)
+
+#Retries, deadlines, hedging (CallPolicy, created by the warm-up) and circuit breaker of the Gemini calls
+gemini_breaker = CircuitBreaker(failure_threshold=GEMINI_CIRCUIT_FAILURES,
+                                failure_ratio=GEMINI_CIRCUIT_FAILURE_RATIO,
+                                reset_timeout=GEMINI_CIRCUIT_RESET)
+gemini_policy = None
+
+#Slots of the turns calling Gemini, with a bounded wait queue
+admission = AdmissionControl(max_concurrency=GEMINI_MAX_CONCURRENCY,
+                             max_queue=GEMINI_MAX_QUEUE,
+                             max_wait=GEMINI_MAX_QUEUE_WAIT)
+
+#Websocket chat connections: open, opened and messages received
+websocket_stats = {"connections": 0, "opened": 0, "messages": 0}
+
+#Sessions with a summary being updated, and the running background tasks
+summarizing = set()
+background_tasks = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the async clients on startup and close them on shutdown
+
+    The clients hold the connection pools and the models, they are
+    shared by every request running on the event loop. The Gemini
+    client is created by a background warm-up so the app (/health,
+    /ready) is up while the SDK is loading.
+    """
+    global gemini_warmup
+    global history_store
+    global history_codec
+    global block_store
+    global history_cache
+    global history_writer
+    global chat_pool
+    global context_policy
+    global response_cache
+    global idempotency
+
+    async with AsyncExitStack() as stack:
+        #Logs are written by a listener thread, stopped last to flush the queue
+        log_listener = setupLogging(LOG_LEVEL,
+                                    payloads=LOG_PAYLOADS,
+                                    max_length=LOG_MAX_LENGTH,
+                                    sample_rate=LOG_SAMPLE_RATE,
+                                    json_format=LOG_FORMAT == "json")
+        stack.callback(log_listener.stop)
+
+        history_codec = HistoryCodec(HISTORY_COMPRESSION,min_bytes=HISTORY_COMPRESSION_MIN_BYTES)
+        if HISTORY_STORE == "memory":
+            history_store = MemoryHistoryStore()
+        elif HISTORY_STORE == "sqlite":
+            history_store = SqliteHistoryStore(HISTORY_SQLITE_PATH,codec=history_codec)
+            stack.callback(history_store.close)
+        elif HISTORY_STORE == "dynamodb":
+            from lib.AsyncDynamoWrapper import AsyncDynamoWrapper #To communicate with dynamodb
+            from lib.S3BlockStore import S3BlockStore #To offload the large turns to S3
+            # LocalStack DynamoDB connection
+            dynamodb = await stack.enter_async_context(awsSession().create_client(
+                "dynamodb",
+                endpoint_url= os.getenv('DYNAMODB_ENDPOINT', 'http://localhost:4566'),
+                region_name=region,
+                config=awsConfig("dynamodb")))
+            if HISTORY_OVERFLOW_BUCKET:
+                s3 = await stack.enter_async_context(awsSession().create_client(
+                    "s3",
+                    endpoint_url= os.getenv('S3_ENDPOINT', os.getenv('DYNAMODB_ENDPOINT', 'http://localhost:4566')),
+                    region_name=region,
+                    config=awsConfig("s3",s3={"addressing_style": "path"})))
+                block_store = S3BlockStore(s3,HISTORY_OVERFLOW_BUCKET,max_bytes=HISTORY_OVERFLOW_CACHE_BYTES)
+            history_store = AsyncDynamoWrapper(dynamodb,
+                                               codec=history_codec,
+                                               block_store=block_store,
+                                               overflow_bytes=HISTORY_OVERFLOW_BYTES)
+        else:
+            raise ValueError(f"Unknown HISTORY_STORE {HISTORY_STORE!r}, expected dynamodb, sqlite or memory")
+        logger.info("lifespan:: history store : %s",HISTORY_STORE)
+
+        if HISTORY_WRITE_BEHIND:
+            history_writer = HistoryWriter(history_store,
+                                           max_queue=HISTORY_WRITE_QUEUE_SIZE,
+                                           max_retries=HISTORY_WRITE_MAX_RETRIES,
+                                           flush_callback=historyWritten)
+            history_writer.start()
+            #Flush the queued turns on shutdown, before the store is closed
+            stack.push_async_callback(history_writer.stop)
+
+        if RESPONSE_CACHE:
+            response_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL,
+                                           max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                                           history_store=history_store,
+                                           table_name=TABLE_RESPONSE_CACHE)
+
+        if IDEMPOTENCY:
+            idempotency = IdempotencyStore(ttl=IDEMPOTENCY_TTL,
+                                           max_entries=IDEMPOTENCY_MAX_ENTRIES,
+                                           max_wait=IDEMPOTENCY_MAX_WAIT,
+                                           pending_ttl=IDEMPOTENCY_PENDING_TTL,
+                                           history_store=history_store,
+                                           table_name=TABLE_IDEMPOTENCY)
+
+        history_cache = HistoryCache(history_store,
+                                     max_entries=HISTORY_CACHE_MAX_ENTRIES,
+                                     max_bytes=HISTORY_CACHE_MAX_BYTES,
+                                     max_turns=HISTORY_MAX_TURNS,
+                                     writer=history_writer)
+
+        if CHAT_POOL:
+            chat_pool = ChatSessionPool(max_entries=CHAT_POOL_MAX_ENTRIES,
+                                        max_bytes=CHAT_POOL_MAX_BYTES,
+                                        ttl=CHAT_POOL_TTL)
+
+        gemini_warmup = asyncio.create_task(warmUpGemini())
+
+        metrics.addStats("history_cache",history_cache.stats)
+        metrics.addStats("history_codec",history_codec.stats)
+        metrics.addStats("session_locks",session_locks.stats)
+        metrics.addStats("admission",admission.stats)
+        metrics.addStats("gemini_circuit",gemini_breaker.stats)
+        metrics.addStats("websocket",websocket_stats.copy)
+        if block_store != None:
+            metrics.addStats("history_blocks",block_store.stats)
+        if history_writer != None:
+            metrics.addStats("history_writer",history_writer.stats)
+        if response_cache != None:
+            metrics.addStats("response_cache",response_cache.stats)
+        if idempotency != None:
+            metrics.addStats("idempotency",idempotency.stats)
+        if chat_pool != None:
+            metrics.addStats("chat_pool",chat_pool.stats)
+
+        context_policy = ContextPolicy(
+            max_turns=HISTORY_MAX_TURNS,
+            max_tokens=CONTEXT_MAX_TOKENS,
+            summarize=CONTEXT_SUMMARY,
+            summary_every=CONTEXT_SUMMARY_EVERY,
+            token_counter=countTokens if CONTEXT_TOKEN_COUNTER == "gemini" else None)
+        #Stop the background tasks (summaries) before the clients are closed
+        stack.callback(cancelBackgroundTasks)
+        stack.push_async_callback(stopGemini)
+
+        yield
+
+# FastAPI app initialization
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware,metrics=metrics,router=app.router)
+
+
+def awsSession():
+    """
+    aiobotocore session of the DynamoDb and S3 clients
+    """
+    from aiobotocore.session import get_session #To access AWS resources asynchronously
+    return get_session()
+
+def awsConfig(service:str,**kwargs):
+    """
+    Config of a DynamoDb or S3 client: pool of DYNAMODB_MAX_POOL_CONNECTIONS
+    kept-alive connections, timeouts and retries. The use of the pool is
+    exported as the "<service>_pool" stats and "<service>_pool_wait" phase
+
+    Args:
+        service (str): "dynamodb" or "s3"
+        kwargs: other options of the config
+
+    Returns:
+        AioConfig: the config
+    """
+    from aiobotocore.config import AioConfig #To configure the clients
+    from lib.PoolMonitor import PoolMonitor #To export the use of the connection pools
+
+    monitor = PoolMonitor(DYNAMODB_MAX_POOL_CONNECTIONS,
+                          wait_callback=lambda start: metrics.observePhase(f"{service}_pool_wait",start))
+    metrics.addStats(f"{service}_pool",monitor.stats)
+    return AioConfig(max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+                     connector_args={"keepalive_timeout": DYNAMODB_KEEPALIVE_TIMEOUT},
+                     connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+                     read_timeout=DYNAMODB_READ_TIMEOUT,
+                     retries={"mode": DYNAMODB_RETRY_MODE, "total_max_attempts": DYNAMODB_MAX_ATTEMPTS},
+                     http_session_cls=monitor.sessionClass(),
+                     **kwargs)
+
+def importGemini() -> tuple:
+    """
+    Import the Gemini SDK and its wrappers, run in a thread by warmUpGemini
+    (google.generativeai is the slowest import of the app)
+
+    Returns:
+        (AsyncGeminiWrapper, CallPolicy, GeminiKeyPool) (tuple): the classes
+    """
+    from lib.AsyncGeminiWrapper import AsyncGeminiWrapper #To communicate with Gemini
+    from lib.CallPolicy import CallPolicy #Deadlines, retries and hedging of the Gemini calls
+    from lib.GeminiKeyPool import GeminiKeyPool #To spread the Gemini calls on several keys
+    return AsyncGeminiWrapper, CallPolicy, GeminiKeyPool
+
+async def warmUpGemini() -> None:
+    """
+    Create the Gemini client off the startup path: import the SDK, create
+    the client and the model, then open the channel (DNS, TCP and TLS) so
+    the first request doesn't pay for it
+    """
+    global gemini_wrapper
+    global gemini_policy
+    global gemini_keys
+    global gemini_connected
+
+    start = time.perf_counter()
+    try:
+        AsyncGeminiWrapper, CallPolicy, GeminiKeyPool = await asyncio.to_thread(importGemini)
+        gemini_policy = CallPolicy(timeout=GEMINI_TIMEOUT,
+                                   max_attempts=GEMINI_MAX_ATTEMPTS,
+                                   hedge=GEMINI_HEDGE,
+                                   hedge_min_delay=GEMINI_HEDGE_MIN_DELAY,
+                                   breaker=gemini_breaker)
+        keys = GEMINI_API_KEYS or [GEMINI_API_KEY]
+        key_pool = None
+        if len(keys) > 1 or GEMINI_KEY_RPM:
+            key_pool = GeminiKeyPool([AsyncGeminiWrapper.createAsyncClient(key,GEMINI_API_ENDPOINT,GEMINI_KEEPALIVE)
+                                      for key in keys],
+                                     rpm=GEMINI_KEY_RPM,
+                                     strategy=GEMINI_KEY_SELECTION,
+                                     cooldown=GEMINI_KEY_COOLDOWN,
+                                     max_wait=GEMINI_KEY_MAX_WAIT)
+        wrapper = AsyncGeminiWrapper(keys[0],
+                                     model_name=GEMINI_MODEL,
+                                     api_endpoint=GEMINI_API_ENDPOINT,
+                                     call_policy=gemini_policy,
+                                     stream_timeout=GEMINI_STREAM_TIMEOUT,
+                                     keepalive=GEMINI_KEEPALIVE,
+                                     key_pool=key_pool)
+        wrapper.getModel()
+    except Exception as e:
+        #The app stays up but not ready
+        logger.error("warmUpGemini:: exception : %s",e)
+        metrics.observeError("gemini_warmup")
+        return
+    metrics.addStats("gemini_calls",gemini_policy.stats)
+    if key_pool != None:
+        metrics.addStats("gemini_keys",key_pool.stats)
+    gemini_keys = key_pool
+    gemini_wrapper = wrapper
+    logger.info("warmUpGemini:: client ready in %.3f s (%d keys)",time.perf_counter()-start,len(keys))
+
+    if GEMINI_WARMUP_TIMEOUT:
+        #One channel per key
+        channels = [asyncio.ensure_future(client.transport.grpc_channel.channel_ready()) for client in geminiClients()]
+        try:
+            done, pending = await asyncio.wait(channels,timeout=GEMINI_WARMUP_TIMEOUT)
+            errors = [task.exception() for task in done if task.exception() != None]
+            if len(errors) > 0:
+                logger.warning("warmUpGemini:: channel exception : %s",errors[0])
+            elif len(pending) > 0:
+                logger.warning("warmUpGemini:: channel not ready after %s s, connecting on first call",GEMINI_WARMUP_TIMEOUT)
+            else:
+                gemini_connected = True
+                logger.info("warmUpGemini:: channel ready in %.3f s",time.perf_counter()-start)
+        finally:
+            for task in channels:
+                task.cancel()
+
+def geminiConnected() -> bool:
+    """
+    Check the channels of the Gemini keys (on each /ready): a channel that
+    didn't connect during the warm-up is asked to connect, a channel that
+    connected once is still counted while idle (grpc closes the unused
+    connections) but not while its connection fails
+
+    Returns:
+        bool: True if Gemini is reachable
+    """
+    global gemini_connected
+    if gemini_wrapper == None:
+        return False
+    #Only reached once the SDK was imported by the warm-up
+    import grpc #States of the Gemini channels
+
+    states = [client.transport.grpc_channel.get_state(try_to_connect=True) for client in geminiClients()]
+    if all(state == grpc.ChannelConnectivity.READY for state in states):
+        gemini_connected = True
+        return True
+    return gemini_connected and all(state in (grpc.ChannelConnectivity.IDLE,grpc.ChannelConnectivity.CONNECTING,
+                                              grpc.ChannelConnectivity.READY) for state in states)
+
+def geminiClients() -> list:
+    """
+    The async clients of the Gemini keys, one per key
+    """
+    if gemini_keys != None:
+        return gemini_keys.clients()
+    return [gemini_wrapper.async_client]
+
+async def getGemini():
+    """
+    The Gemini client, waits for the warm-up if it is still running
+
+    Returns:
+        AsyncGeminiWrapper: the client
+
+    Raises:
+        Exception: the error of the warm-up if it failed
+    """
+    if gemini_wrapper == None:
+        #Shielded, a cancelled request doesn't cancel the warm-up
+        await asyncio.shield(gemini_warmup)
+        if gemini_wrapper == None:
+            raise RuntimeError("Gemini client not available")
+    return gemini_wrapper
+
+async def countTokens(messages:list) -> int:
+    """
+    Token counter of the context policy (CONTEXT_TOKEN_COUNTER=gemini)
+    """
+    return await (await getGemini()).countTokens(messages)
 
-def startChat(prompt:str,session_id:int,history=None) -> str:
+async def stopGemini() -> None:
+    """
+    Stop the warm-up if it is still running and close the Gemini channel (called on shutdown)
+    """
+    if gemini_warmup != None and not gemini_warmup.done():
+        gemini_warmup.cancel()
+        await asyncio.gather(gemini_warmup,return_exceptions=True)
+    if gemini_wrapper != None:
+        for client in geminiClients():
+            await client.transport.close()
+
+def cancelBackgroundTasks() -> None:
+    """
+    Cancel the background tasks still running (called on shutdown)
+    """
+    for task in background_tasks:
+        task.cancel()
+
+async def lockSession(session_id:str):
+    """
+    Wait for the previous requests of a session and record the wait
+
+    Returns:
+        release: function releasing the lock of the session
+    """
+    start = time.perf_counter()
+    release = await session_locks.acquire(session_id)
+    metrics.observePhase("session_wait",start)
+    return release
+
+async def admitTurn(session_id:str):
+    """
+    Wait for the previous requests of the session then for a Gemini slot
+
+    Returns:
+        release: function releasing the slot and the lock of the session
+
+    Raises:
+        AdmissionRejected: if no slot is available (the lock is released)
+    """
+    release_lock = await lockSession(session_id)
+    start = time.perf_counter()
+    try:
+        release_slot = await admission.acquire()
+    except BaseException as e:
+        release_lock()
+        if isinstance(e,AdmissionRejected):
+            metrics.observePhase("admission_wait",start,"error")
+            metrics.observeError(e.reason)
+            logger.warning("admitTurn:: rejected : %s",e.reason,extra={"session_id": session_id})
+        raise
+    metrics.observePhase("admission_wait",start)
+
+    def release() -> None:
+        release_slot()
+        release_lock()
+    return release
+
+def upstreamRejection(chat_session) -> AdmissionRejected:
+    """
+    Turn the last error of a chat into a rejection: 429 for a quota error of
+    Gemini (RESOURCE_EXHAUSTED, with the retry delay sent by Gemini if any)
+    or when no Gemini key is available (GeminiKeyPool), 503 while the circuit
+    breaker is open
+
+    Returns:
+        AdmissionRejected: the rejection or None for other errors
+    """
+    #Only reached once the SDK was imported by the warm-up
+    from google.api_core.exceptions import ResourceExhausted #Quota errors of Gemini
+
+    error = getattr(chat_session,"error",None)
+    if isinstance(error,CircuitOpenError):
+        metrics.observeError("circuit_open")
+        return AdmissionRejected("circuit_open",503,error.retry_after)
+    if not isinstance(error,ResourceExhausted):
+        return None
+    #KeysExhausted holds the wait for the next available key
+    retry_after = getattr(error,"retry_after",None) or admission.retryAfter()
+    for detail in error.details or []:
+        #google.rpc.RetryInfo
+        delay = getattr(detail,"retry_delay",None)
+        if delay != None:
+            retry_after = max(1,math.ceil(delay.seconds + delay.nanos/1e9))
+    metrics.observeError("gemini_quota")
+    return AdmissionRejected("gemini_quota",429,retry_after)
+
+def rejectionReply(rejection:AdmissionRejected) -> dict:
+    """
+    Body of a rejected request
+    """
+    error = "Too many requests, retry later." if rejection.status_code == 429 else "Service overloaded, retry later."
+    return {"error": error, "retry_after": rejection.retry_after}
+
+def replyResponse(reply:dict,status_code:int) -> JSONResponse:
+    """
+    JSONResponse of a reply, with a Retry-After header if the request was rejected
+    """
+    headers = {"Retry-After": str(reply["retry_after"])} if "retry_after" in reply else None
+    return JSONResponse(content=reply,status_code=status_code,headers=headers)
+
+def idempotencyReply(conflict:IdempotencyConflict) -> dict:
+    """
+    Body of a request refused for its Idempotency-Key
+    """
+    if conflict.status_code == 422:
+        return {"error": "Idempotency-Key already used with another request."}
+    return {"error": "A request with this Idempotency-Key is in progress, retry later.", "retry_after": conflict.retry_after}
+
+def historyWritten(count:int,start:float,ok:bool) -> None:
+    """
+    HistoryWriter callback, record the duration of a batch write
+    """
+    metrics.observePhase("history_write",start,"ok" if ok else "error")
+    if not ok:
+        metrics.observeError("history_write")
+
+def newChat(history=None,session_id:str=None,context:dict=None,pool:ChatSessionPool=None):
+    """
+    Init a chat session and record the duration of the init,
+    on the live history of the session if the pool has it for this context
+
+    Args:
+        history: List of history
+        session_id (str): optional, the session of the chat
+        context (dict): optional, context of the history (see getChatContext)
+        pool (ChatSessionPool): optional, pool of the live history instead of chat_pool
+
+    Returns:
+        AsyncGeminiChat: the chat session or None on error
+    """
+    start = time.perf_counter()
+    contents = None
+    pool = pool if pool != None else chat_pool
+    if pool != None and history != None and context != None:
+        contents = pool.take(session_id,context)
+    chat_session = gemini_wrapper.newChat(contents if contents != None else history)
+    if chat_session == None:
+        metrics.observePhase("chat_init",start,"error")
+        metrics.observeError("chat_init")
+    else:
+        metrics.observePhase("chat_init",start)
+    return chat_session
+
+async def startChat(prompt:str,session_id:int,history=None,last_turn:int=0,context:dict=None) -> str:
     """
         start a chat with Gemini pro
 
         Arguments:
             prompt (str): The prompt to send
-    session_id (int): The second number to add
-        history: List of history ([
+            session_id (int): The user session id
+            history: List of history ([
                                 {"role": "user", "parts": "Hello"},
                                 {"role": "model", "parts": "Great to meet you. What would you like to know?"}
                             ])
+            last_turn (int): number of the last stored turn of the session
+            context (dict): optional, context of the history (see getChatContext)
 
         Returns:
             str_response (str): The answer
+
+        Raises:
+            AdmissionRejected: if Gemini answers with a quota error or its circuit is open
 """
-    global gemini_wrapper
-    global dynamodb_wrapper
+    str_response = ""
 
+    #Reuse the reply of an identical request, the turn is still saved
+    cache_key, str_response = await getCachedResponse(prompt,history)
+    if str_response != None:
+        logger.debug("startChat:: cached response",extra={"session_id": session_id})
+        metrics.observeResponse(str_response)
+        await saveTurn(session_id,last_turn+1,[{"role": "user", "parts": prompt},{"role": "model", "parts": str_response}])
+        return str_response
     str_response = ""
     
-    #Init the chat
-    if not gemini_wrapper.initChat(history):
-        print("Error initialize chat...")
+    #Init the chat, the session belongs to this request only
+    chat_session = newChat(history,session_id,context)
+    if chat_session == None:
+        logger.error("startChat:: error initialize chat",extra={"session_id": session_id})
         return "Error init chat..."
 
     #Send prompt to Gemini
-    response = gemini_wrapper.chat(prompt)
+    start = time.perf_counter()
+    response = await chat_session.chat(prompt)
+    if response == None:
+        metrics.observePhase("gemini",start,"error")
+        metrics.observeError("gemini")
+        rejection = upstreamRejection(chat_session)
+        if rejection != None:
+            raise rejection
+        return "Error no response..."
     
     #Create string response
     #loop to concate in one string
-    for chunk in response:
+    async for chunk in response:
         str_response+= chunk.text
+    metrics.observePhase("gemini",start)
+    metrics.observeResponse(str_response)
 
-    print(f"model : {str_response}")
-    print("_" * 80)
+    payload_logger.debug("startChat:: model : %s",str_response,extra={"session_id": session_id})
     
-    #Get the chat history and save it
-    history = gemini_wrapper.getChatHistory()
-    if history != None:
-        saveHistory(session_id,history)
+    #Get the chat history and save the messages added by this request
+    chat_history = chat_session.getChatHistory()
+    if chat_history != None:
+        await saveHistory(session_id,chat_history,last_turn+1,len(history or []),context)
+        await putCachedResponse(cache_key,str_response)
     else:
-        print(f"startChat:: No history for session id -> {session_id}")
+        logger.warning("startChat:: no history",extra={"session_id": session_id})
     
     return str_response
 
-def saveHistory(session_id,history) -> dict:
+async def getCachedResponse(prompt:str,history=None) -> tuple:
+    """
+    Look for the reply of an identical request in the response cache
+
+    Args:
+        prompt (str): The prompt to send
+        history: List of history sent with the prompt
+
+    Returns:
+        (cache_key, response) (tuple): the key of the request and the cached reply or None
+    """
+    if response_cache == None:
+        return None, None
+    try:
+        cache_key = ResponseCache.key(gemini_wrapper.MODEL_NAME,gemini_wrapper.generation_config,history,prompt)
+        return cache_key, await response_cache.get(cache_key)
+    except Exception as e:
+        logger.error("getCachedResponse:: exception : %s",e)
+        return None, None
+
+async def putCachedResponse(cache_key:str,response:str) -> None:
+    """
+    Put a reply in the response cache
+
+    Args:
+        cache_key (str): the key returned by getCachedResponse
+        response (str): the reply
+    """
+    if response_cache == None or cache_key == None:
+        return
+    try:
+        await response_cache.put(cache_key,response)
+    except Exception as e:
+        logger.error("putCachedResponse:: exception : %s",e)
+
+async def saveHistory(session_id,history,turn:int,first_message:int=None,context:dict=None,pool:ChatSessionPool=None) -> dict:
     """
-    save the chat history to DynamoDb
+    save the new turn of the chat history to the history store,
+    only the messages added by this request are converted and written,
+    the previous turns are already stored. Once saved, the live history
+    is pooled for the next turn of the session
 
     Args:
 
@@ -111,53 +806,525 @@ def saveHistory(session_id,history) -> dict:
                     {"role": "user", "parts": "Hello"},
                     {"role": "model", "parts": "Great to meet you. What would you like to know?"},
                 ]) : List of history
+        turn (int): number of the turn to write
+        first_message (int): index of the first message added by this request
+                             (number of messages the chat was started with),
+                             the last user and model messages if None
+        context (dict): optional, context the chat was started with (see getChatContext)
+        pool (ChatSessionPool): optional, pool of the live history instead of chat_pool
 
     Returns:
-        str: The answer
+        reponse  (dict): message and last_turn or {"error":"message"}
     """
 
-    print(f"saveHistory:: session id -> {session_id} \n history -> {history}")
+    logger.debug("saveHistory:: save turn",extra={"session_id": session_id, "turn": turn})
 
-    mylist = []
+    if first_message == None:
+        first_message = len(history)-2
 
-    #loop on the history 
-    #and create a list of ChatContent to facilite 
-    #the json manipulation for storing
-    for content in history:
-        part = content.parts[0]
-        print(content.role, "->", type(part).to_dict(part))
-        print('-'*80)
-        mylist.append(ChatContent(content.role,type(part).to_dict(part)["text"]))
+    #Convert the new messages only
+    messages = []
+    for content in history[first_message:]:
+        message = ChatContent.fromContent(content)
+        payload_logger.debug("saveHistory:: %s -> %s",message.role,message.parts,extra={"session_id": session_id, "turn": turn})
+        messages.append(message.toDict())
 
-    history_string = json.dumps([ob.__dict__ for ob in mylist])
+    result = await saveTurn(session_id,turn,messages)
+    pool = pool if pool != None else chat_pool
+    if pool != None and context != None and not result.get("error"):
+        pool.put(session_id,ChatSessionPool.nextContext(context,turn,messages),history)
+    return result
 
-    return dynamodb_wrapper.putHistory(session_id,history_string,TABLE_HISTORY)
+async def saveTurn(session_id,turn:int,messages:list) -> dict:
+    """
+    save a turn to the history store (through the history cache)
+
+    Args:
+        session_id (int): The user session_id
+        turn (int): number of the turn to write
+        messages (list): [{"role": "user", "parts": "..."},{"role": "model", "parts": "..."}]
+
+    Returns:
+        reponse  (dict): message and last_turn or {"error":"message"}
+    """
+    start = time.perf_counter()
+    result = await history_cache.putTurn(session_id,turn,messages,TABLE_HISTORY_TURNS)
+    if result.get("error"):
+        metrics.observePhase("history_save",start,"error")
+        metrics.observeError("history_save")
+    else:
+        metrics.observePhase("history_save",start)
+    return result
     
-def getDynamoHistory(session_id:int) -> dict:
+async def getDynamoTurns(session_id:int,limit:int=HISTORY_MAX_TURNS) -> list:
+    """
+    Get the turns of a session from the history store
+
+    The turns are read from the per-turn table, a session only
+    found in the legacy single-blob table is migrated first.
+
+    Args:
+        session_id (int):
+        limit (int): only read the last "limit" turns, 0 to read all
+
+    Returns:
+        turns (list): [{"turn": 1, "messages": [...]},...] oldest first or None on error
+    """
+
+    try:
+
+        turns = await history_cache.getTurns(session_id,TABLE_HISTORY_TURNS,limit)
+        if isinstance(turns,list) and len(turns)==0:
+            turns = await history_store.migrateHistory(session_id,TABLE_HISTORY,TABLE_HISTORY_TURNS)
+            if isinstance(turns,list) and limit:
+                turns = turns[-limit:]
+
+        if not isinstance(turns,list):
+            logger.error("getDynamoTurns:: error : %s",turns,extra={"session_id": session_id})
+            return None
+
+        logger.debug("getDynamoTurns:: read %d turns",len(turns),extra={"session_id": session_id})
+        return turns
+
+    except Exception as e:
+        logger.error("getDynamoTurns:: exception : %s",e,extra={"session_id": session_id})
+        return None
+
+async def getDynamoHistory(session_id:int,limit:int=HISTORY_MAX_TURNS) -> tuple:
+    """
+    Get history from the history store as list of messages
+
+    Args:
+        session_id (int):
+        limit (int): only read the last "limit" turns, 0 to read all
+
+    Returns:
+        (history, last_turn) (tuple): history as list of messages (or None if empty)
+                                      and the number of the last turn.
+                                      (None, None) on error
+    """
+    turns = await getDynamoTurns(session_id,limit)
+    if turns == None:
+        return None, None
+    if len(turns)==0:
+        return None, 0
+    return [message for turn in turns for message in turn["messages"]], turns[-1]["turn"]
+
+async def getChatContext(session_id:int,summaries:dict=None) -> tuple:
     """
-    Get history from DynamoDb as dicttonary
+    Get the history to send to Gemini, built by the context policy:
+    the rolling summary (if enabled) then the last turns fitting in the window.
+    When enough turns are left out of the window, the summary is updated
+    in background.
 
     Args:
         session_id (int):
+        summaries (dict): optional, summaries already read (getSummaries) instead of reading the session one
 
     Returns:
-        dt  (dict): history in json string format or None
+        (history, last_turn, context) (tuple): history as list of messages (or None if empty),
+                                               the number of the last turn and the context
+                                               of the history (see ChatSessionPool.context).
+                                               (None, None, None) on error
+    """
+    start = time.perf_counter()
+    summary = None
+    if context_policy.summarize and summaries != None:
+        turns = await getDynamoTurns(session_id)
+        summary = summaries.get(session_id)
+    elif context_policy.summarize:
+        turns, summary = await asyncio.gather(
+            getDynamoTurns(session_id),
+            history_store.getSummary(session_id,TABLE_HISTORY_TURNS))
+        if isinstance(summary,dict) and summary.get("error"):
+            summary = None
+    else:
+        turns = await getDynamoTurns(session_id)
+
+    if turns == None:
+        metrics.observePhase("history_read",start,"error")
+        metrics.observeError("history_read")
+        return None, None, None
+    metrics.observePhase("history_read",start)
+    return await buildChatContext(session_id,turns,summary)
+
+async def buildChatContext(session_id:int,turns:list,summary:dict=None) -> tuple:
+    """
+    Build the history sent to Gemini from turns already read (see getChatContext)
+
+    Args:
+        session_id (int):
+        turns (list): [{"turn": 1, "messages": [...]},...] oldest first
+        summary (dict): optional, the rolling summary of the session
+
+    Returns:
+        (history, last_turn, context) (tuple): see getChatContext
+    """
+    last_turn = turns[-1]["turn"] if len(turns)>0 else 0
+
+    window = await context_policy.select(turns,summary)
+    if context_policy.needsSummary(window,summary,last_turn) and session_id not in summarizing:
+        up_to_turn = window[0]["turn"]-1 if len(window)>0 else last_turn
+        summarizing.add(session_id)
+        task = asyncio.create_task(summarizeHistory(session_id,summary,up_to_turn))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    history = context_policy.buildHistory(window,summary)
+    logger.debug("getChatContext:: %d turns in context, summary : %s",len(window),summary != None,extra={"session_id": session_id})
+    metrics.observeHistory(history)
+    context = ChatSessionPool.context(window,summary,sum(len(message["parts"]) for message in history))
+    return (history if len(history)>0 else None), last_turn, context
+
+async def summarizeHistory(session_id:int,summary:dict,up_to_turn:int) -> None:
     """
+    Fold the turns left out of the context window in the rolling summary
 
+    Args:
+        session_id (int):
+        summary (dict): the current summary or None
+        up_to_turn (int): fold the turns until this one
+    """
     try:
+        summary_turn = summary["summary_turn"] if summary != None else 0
+        turns = await history_store.getTurns(session_id,TABLE_HISTORY_TURNS,after_turn=summary_turn)
+        if not isinstance(turns,list):
+            return
+        turns = [turn for turn in turns if turn["turn"] <= up_to_turn]
+        if len(turns)==0:
+            return
+
+        text = await gemini_wrapper.generateContentAsync(context_policy.summaryPrompt(summary,turns))
+        if text == None:
+            return
+        await history_store.putSummary(session_id,text.strip(),turns[-1]["turn"],TABLE_HISTORY_TURNS)
+        logger.info("summarizeHistory:: summary until turn %d",turns[-1]["turn"],extra={"session_id": session_id})
+    except Exception as e:
+        logger.error("summarizeHistory:: exception : %s",e,extra={"session_id": session_id})
+    finally:
+        summarizing.discard(session_id)
+
+
+def sseEvent(data:dict,event:str=None) -> str:
+    """
+    Format a Server-Sent Event
 
-        json_str = dynamodb_wrapper.getHistory(session_id,TABLE_HISTORY)
-        history=None
+    Args:
+        data (dict): payload of the event, serialized as json
+        event (str): optional event name (default event is "message")
+
+    Returns:
+        str: the event ready to be written on the stream
+    """
+    message = f"event: {event}\n" if event != None else ""
+    return message + f"data: {json.dumps(data)}\n\n"
 
-        if json_str!=None:
-            print(f"getDynamoHistory::session id : {session_id} -> read : {json_str}")
-            history = json.loads(json_str)
-            print(f"getDynamoHistory::dict : {history}")
+async def chatEvents(prompt:str,session_id:str,history,last_turn:int,context:dict=None,disconnected=None,pool:ChatSessionPool=None):
+    """
+    Run a chat turn with Gemini and yield the reply as it is produced
 
-        return history
+    Each chunk produced by Gemini is yielded as soon as it is received.
+    The history is saved to the history store only once the whole reply has been
+    produced. If the client disconnects before the end, the turn is stopped
+    and the incomplete turn is not saved.
 
+    Args:
+        prompt (str): The prompt to send
+        session_id (str): The user session id
+        history: List of history
+        last_turn (int): number of the last stored turn of the session
+        context (dict): optional, context of the history (see getChatContext)
+        disconnected: optional, coroutine function returning True once the client is gone
+        pool (ChatSessionPool): optional, pool of the live history instead of chat_pool
+
+    Yields:
+        (event, data) (tuple): ("message", {"session_id": ..., "role": "model", "response": ...}) for each chunk,
+                               then ("done", {"session_id": ...}) or ("error", {"error": ...})
+    """
+    #Reuse the reply of an identical request, sent as a single chunk
+    cache_key, str_response = await getCachedResponse(prompt,history)
+    if str_response != None:
+        yield "message", {"session_id":session_id,"role":"model","response":str_response}
+        metrics.observeResponse(str_response)
+        await saveTurn(session_id,last_turn+1,[{"role": "user", "parts": prompt},{"role": "model", "parts": str_response}])
+        yield "done", {"session_id":session_id}
+        return
+    str_response = ""
+
+    #Init the chat
+    chat_session = newChat(history,session_id,context,pool)
+    if chat_session == None:
+        yield "error", {"error": "Failed to init chat."}
+        return
+
+    #Send prompt to Gemini
+    start = time.perf_counter()
+    response = await chat_session.chat(prompt,True)
+    if response == None:
+        metrics.observePhase("gemini",start,"error")
+        metrics.observeError("gemini")
+        rejection = upstreamRejection(chat_session)
+        if rejection != None:
+            yield "error", rejectionReply(rejection)
+        else:
+            yield "error", {"error": "Failed to get Gemini API response."}
+        return
+
+    async for chunk in response:
+        if disconnected != None and await disconnected():
+            logger.info("chatEvents:: client disconnected",extra={"session_id": session_id})
+            metrics.observeError("client_disconnect")
+            return
+
+        if str_response == "":
+            metrics.observePhase("gemini_first_chunk",start)
+        str_response += chunk.text
+        yield "message", {"session_id":session_id,"role":"model","response":chunk.text}
+    metrics.observePhase("gemini",start)
+    metrics.observeResponse(str_response)
+
+    #Get the chat history and save the messages added by this request
+    chat_history = chat_session.getChatHistory()
+    if chat_history != None:
+        await saveHistory(session_id,chat_history,last_turn+1,len(history or []),context,pool)
+        await putCachedResponse(cache_key,str_response)
+    else:
+        logger.warning("chatEvents:: no history",extra={"session_id": session_id})
+
+    yield "done", {"session_id":session_id}
+
+async def streamChat(prompt:str,session_id:str,history,last_turn:int,http_request:Request,release=None,context:dict=None):
+    """
+    Stream a chat with Gemini as Server-Sent Events (see chatEvents)
+
+    Args:
+        prompt (str): The prompt to send
+        session_id (str): The user session id
+        history: List of history
+        last_turn (int): number of the last stored turn of the session
+        http_request (Request): the incoming request, used to detect disconnection
+        release: optional, releases the Gemini slot and the lock of the session once the stream ends
+        context (dict): optional, context of the history (see getChatContext)
+
+    Yields:
+        str: Server-Sent Events ("message" for each chunk, then "done" or "error")
+    """
+    try:
+        async for event, data in chatEvents(prompt,session_id,history,last_turn,context,http_request.is_disconnected):
+            yield sseEvent(data,event if event != "message" else None)
+
+    except asyncio.CancelledError:
+        #Raised when the server cancels the stream after a disconnection
+        logger.info("streamChat:: stream cancelled",extra={"session_id": session_id})
+        metrics.observeError("client_disconnect")
+        raise
     except Exception as e:
-        print(f"getDynamoHistory:: exception : {e}")
+        logger.error("streamChat:: exception : %s",e,extra={"session_id": session_id})
+        metrics.observeError("exception")
+        yield sseEvent({"error": "Operation failed."},"error")
+    finally:
+        if release != None:
+            release()
+
+
+async def chatReply(prompt:str,session_id:str,summaries:dict=None) -> tuple:
+    """
+    Run one turn of a chat: read the context, get the reply (from Gemini
+    or the response cache) and save the turn. The turns of a session run
+    one after the other (see SessionLocks) and each turn holds a Gemini
+    slot (see AdmissionControl).
+
+    Args:
+        prompt (str): The prompt to send
+        session_id (str): The user session id
+        summaries (dict): optional, summaries already read (see getChatContext)
+
+    Returns:
+        (reply, status_code) (tuple): {"session_id": "...", "role": "model", "response": "..."}
+                                      or {"error": "..."} ({"error": "...", "retry_after": N}
+                                      with 429 / 503), and the http status
+    """
+    try:
+        release = await admitTurn(session_id)
+    except AdmissionRejected as e:
+        return rejectionReply(e), e.status_code
+    try:
+        #Try to get a history from the history store
+        history, last_turn, context = await getChatContext(session_id,summaries)
+        if last_turn == None:
+            return {"error": "Failed to read history."}, 500
+        await getGemini()
+
+        #Start the chat with prompt
+        response_json = await startChat(prompt,session_id,history,last_turn,context)
+    except AdmissionRejected as e:
+        return rejectionReply(e), e.status_code
+    finally:
+        release()
+    payload_logger.debug("chatReply:: response : %s",response_json,extra={"session_id": session_id})
+
+    #Check if there was an error
+    if response_json[0:5]=="Error":
+        logger.error("chatReply:: error decoding response : %s",response_json,extra={"session_id": session_id})
+        return {"error": "Failed to get Gemini API response."}, 200
+
+    response_json = ''.join([char for char in response_json if char != '\\'])
+    #Construct the reply
+    return {"session_id":session_id,"role":"model","response":response_json}, 200
+
+async def runBatch(requests:list):
+    """
+    Run the prompts of a batch and stream the replies as NDJSON, in completion order
+
+    The prompts of a session run one after the other (each turn sees the
+    previous one), the sessions run concurrently with at most
+    CHAT_BATCH_CONCURRENCY prompts in flight. The summaries of all the
+    sessions are read at once, the turns are written by the write-behind
+    queue in batches.
+
+    Args:
+        requests (list): list of ChatRequest
+
+    Yields:
+        str: one json line per prompt ({"index": i, "session_id": ..., "response": ...}
+             or {"index": i, "session_id": ..., "error": ...}) then {"done": true, ...}
+    """
+    summaries = None
+    if context_policy.summarize:
+        summaries = await history_store.getSummaries([request.session_id for request in requests],TABLE_HISTORY_TURNS)
+        if isinstance(summaries.get("error"),str):
+            summaries = None
+
+    sessions = {}
+    for index, request in enumerate(requests):
+        sessions.setdefault(request.session_id,[]).append((index,request.prompt))
+
+    semaphore = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+    results = asyncio.Queue()
+
+    async def runSession(session_id:str,prompts:list) -> None:
+        for index, prompt in prompts:
+            async with semaphore:
+                try:
+                    reply, _ = await chatReply(prompt,session_id,summaries)
+                except Exception as e:
+                    logger.error("runBatch:: exception : %s",e,extra={"session_id": session_id})
+                    metrics.observeError("exception")
+                    reply = {"error": "Operation failed."}
+            await results.put({"index": index, "session_id": session_id, **reply})
+
+    tasks = [asyncio.create_task(runSession(session_id,prompts)) for session_id, prompts in sessions.items()]
+    errors = 0
+    try:
+        for _ in range(len(requests)):
+            result = await results.get()
+            errors += "error" in result
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "count": len(requests), "errors": errors}) + "\n"
+    finally:
+        #Stop the remaining prompts if the client went away
+        for task in tasks:
+            task.cancel()
+
+async def loadSocketSession(websocket:WebSocket,session_id:str,connection:dict) -> bool:
+    """
+    Read the history (into the history cache) and the summary of the session of a websocket
+
+    Returns:
+        bool: False if the history can't be read (an error frame is sent)
+    """
+    start = time.perf_counter()
+    if context_policy.summarize:
+        turns, summary = await asyncio.gather(
+            getDynamoTurns(session_id),
+            history_store.getSummary(session_id,TABLE_HISTORY_TURNS))
+        connection["summary"] = summary if not (isinstance(summary,dict) and summary.get("error")) else None
+    else:
+        turns = await getDynamoTurns(session_id)
+    if turns == None:
+        metrics.observePhase("history_read",start,"error")
+        metrics.observeError("history_read")
+        await sendFrame(websocket,"error",{"error": "Failed to read history."})
+        return False
+    metrics.observePhase("history_read",start)
+    connection["new_session"] = len(turns) == 0
+    return True
+
+async def socketTurn(websocket:WebSocket,session_id:str,prompt:str,connection:dict,live:ChatSessionPool) -> None:
+    """
+    Run one turn of a websocket chat and stream the reply as frames (see chat_socket)
+
+    Args:
+        websocket (WebSocket): the connection
+        session_id (str): the session of the connection
+        prompt (str): The prompt to send
+        connection (dict): {"summary": ..., "summarizing": bool, "new_session": bool} summary of the
+                           session, whether a turn of the connection started its update and
+                           whether the session had no turn when the connection opened
+        live (ChatSessionPool): live chat history of the connection
+
+    Raises:
+        WebSocketDisconnect: if the client is gone, the turn is not saved
+    """
+    try:
+        release = await admitTurn(session_id)
+    except AdmissionRejected as e:
+        await sendFrame(websocket,"error",rejectionReply(e))
+        return
+    try:
+        #The turns of the session are in the history cache unless it was evicted or invalidated,
+        #a new session has none until its first turn (another request of this node would have cached it)
+        turns = history_cache.peekTurns(session_id,HISTORY_MAX_TURNS)
+        if turns == None and connection["new_session"]:
+            turns = []
+        connection["new_session"] = False
+        if turns == None:
+            start = time.perf_counter()
+            turns = await getDynamoTurns(session_id)
+            if turns == None:
+                metrics.observePhase("history_read",start,"error")
+                metrics.observeError("history_read")
+                await sendFrame(websocket,"error",{"error": "Failed to read history."})
+                return
+            metrics.observePhase("history_read",start)
+
+        #Read the summary again once the update started by a previous turn is done
+        if connection["summarizing"] and session_id not in summarizing:
+            summary = await history_store.getSummary(session_id,TABLE_HISTORY_TURNS)
+            if not (isinstance(summary,dict) and summary.get("error")):
+                connection["summary"] = summary
+            connection["summarizing"] = False
+
+        history, last_turn, context = await buildChatContext(session_id,turns,connection["summary"])
+        connection["summarizing"] = connection["summarizing"] or session_id in summarizing
+        await getGemini()
+
+        async with aclosing(chatEvents(prompt,session_id,history,last_turn,context,pool=live)) as events:
+            async for event, data in events:
+                await sendFrame(websocket,event,data)
+
+    except WebSocketDisconnect:
+        logger.info("socketTurn:: client disconnected",extra={"session_id": session_id})
+        metrics.observeError("client_disconnect")
+        raise
+    except Exception as e:
+        logger.error("socketTurn:: exception : %s",e,extra={"session_id": session_id})
+        metrics.observeError("exception")
+        await sendFrame(websocket,"error",{"error": "Operation failed."})
+    finally:
+        release()
+
+async def sendFrame(websocket:WebSocket,event:str,data:dict) -> None:
+    """
+    Send a json frame {"event": "...", ...data}
+
+    Raises:
+        WebSocketDisconnect: if the frame can't be sent (client gone)
+    """
+    try:
+        await websocket.send_json({"event": event, **data})
+    except Exception as e:
+        raise WebSocketDisconnect(1006) from e
 
 
 """""""""""""""""""""
@@ -165,7 +1332,7 @@ def getDynamoHistory(session_id:int) -> dict:
 """""""""""""""""""""
 
 @app.post("/chat/")
-def chat(request: ChatRequest) -> JSONResponse:
+async def chat(request: ChatRequest, idempotency_key: str = Header(None)) -> JSONResponse:
     """
     Chat with Gemini
 
@@ -173,8 +1340,14 @@ def chat(request: ChatRequest) -> JSONResponse:
     and receive a response. It also handles the session history
     and saves it to DynamoDB.
 
+    With an Idempotency-Key header, a retried request gets the reply of the
+    first one (Idempotent-Replayed: true header) instead of adding a turn
+    again, a duplicate sent while it runs waits for its reply. Only the
+    successful replies are kept.
+
     Args:
         request (ChatRequest): ChatRequest containing session_id and prompt
+        idempotency_key (str): optional Idempotency-Key header
 
     Returns:
         json: Format    
@@ -187,45 +1360,212 @@ def chat(request: ChatRequest) -> JSONResponse:
 
     """
     try:
+        if idempotency_key and idempotency != None:
+            (reply, status_code), replayed = await idempotency.run(
+                IdempotencyStore.key(request.session_id,idempotency_key),
+                IdempotencyStore.fingerprint({"prompt": request.prompt}),
+                lambda: chatReply(request.prompt,request.session_id),
+                succeeded=lambda result: result[1] == 200 and "error" not in result[0])
+            response = replyResponse(reply,status_code)
+            if replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+            return response
 
-        global gemini_wrapper #GeminiWrapper
+        reply, status_code = await chatReply(request.prompt,request.session_id)
+        return replyResponse(reply,status_code)
 
-        start_time = time.time()
-        #Init wrapper with gemini key
-        gemini_wrapper = GeminiWrapper(GEMINI_API_KEY)
-        end_time = time.time()
-        print(f"GeminiWrapper instanciation time : {round((end_time-start_time))*1000} ms")
+    except IdempotencyConflict as e:
+        metrics.observeError("idempotency_conflict")
+        return replyResponse(idempotencyReply(e),e.status_code)
 
-        start_time = time.time()
-        #Try to get a history from DynamoDb
-        history = getDynamoHistory(request.session_id)
-        end_time = time.time()
-        print(f"DynamoDb reading time : {round((end_time-start_time)*1000)} ms")
+    except Exception as e:
+        logger.error("chat:: exception : %s",e)
+        metrics.observeError("exception")
+        return JSONResponse(content={"error": "Operation failed."},status_code=400)
 
-        start_time = time.time()
-        #Start the chat with prompt
-        response_json = startChat(request.prompt,request.session_id,history)
-        end_time = time.time()
-        print(f"Gemini response & parse time : {round((end_time-start_time)*1000)} ms")
-        print(f"Response : {response_json}")
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request) -> StreamingResponse:
+    """
+    Chat with Gemini and stream the reply
+
+    Same as /chat/ but the reply is sent as Server-Sent Events
+    while Gemini is generating it. The history is saved to DynamoDB
+    once the reply is complete.
+
+    Args:
+        request (ChatRequest): ChatRequest containing session_id and prompt
+        http_request (Request): the raw request
+
+    Returns:
+        text/event-stream: Format
+            data: {"session_id": "...", "role": "model", "response": "..."}
+
+            ...
+
+            event: done
+            data: {"session_id": "..."}
+    """
+    #The Gemini slot and the lock of the session are held until the end of the stream
+    try:
+        release = await admitTurn(request.session_id)
+    except AdmissionRejected as e:
+        return replyResponse(rejectionReply(e),e.status_code)
+    try:
+        #Try to get a history from the history store
+        history, last_turn, context = await getChatContext(request.session_id)
+        await getGemini()
+    except BaseException:
+        release()
+        raise
+    if last_turn == None:
+        release()
+        return JSONResponse(content={"error": "Failed to read history."},status_code=500)
+
+    return StreamingResponse(
+        streamChat(request.prompt,request.session_id,history,last_turn,http_request,release,context),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache","X-Accel-Buffering": "no"},
+        #Release the slot and the lock even if the stream never starts
+        background=BackgroundTask(release))
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, session_id: str) -> None:
+    """
+    Chat with Gemini over a websocket, the connection is bound to one session
+
+    The history of the session is read once when the connection opens.
+    Each turn then starts from the turns kept in the history cache (the
+    last turn is not read again from the store) and from the live chat
+    history kept by the connection. The reply is streamed as frames and
+    each turn is saved once complete, like /chat/stream.
+    Turns written by another node are seen once a write of the session
+    is merged, the history is then read again.
 
-        #Check if there was an error
-        if response_json[0:5]=="Error":
-            print(f"Error decoding response: {response_json}")
-            return {"error": "Failed to get Gemini API response."}
+    Args:
+        websocket (WebSocket): the connection, opened on /ws/chat?session_id=...
+        session_id (str): the session of the connection
 
-        response_json = ''.join([char for char in response_json if char != '\\'])
-        #Construct the reply
-        reply = {"session_id":request.session_id,"role":"model","response":response_json}
+    Frames:
+        client: {"prompt": "..."}
+        server: {"event": "message", "session_id": "...", "role": "model", "response": "..."}
+                ...
+                {"event": "done", "session_id": "..."}
+                or {"event": "error", "error": "..."} ({"error": "...", "retry_after": N} when
+                Gemini is at capacity)
+    """
+    await websocket.accept()
+    websocket_stats["connections"] += 1
+    websocket_stats["opened"] += 1
+    #Rolling summary of the session and live chat history of the connection
+    connection = {"summary": None, "summarizing": False, "new_session": False}
+    live = ChatSessionPool(max_entries=1,max_bytes=CHAT_POOL_MAX_BYTES,ttl=0)
+    try:
+        if not await loadSocketSession(websocket,session_id,connection):
+            await websocket.close(code=1011)
+            return
 
-        return JSONResponse(content=reply,status_code=200)
+        while True:
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(),WS_IDLE_TIMEOUT or None)
+            except asyncio.TimeoutError:
+                logger.info("chat_socket:: idle connection closed",extra={"session_id": session_id})
+                await websocket.close(code=1000)
+                return
+            try:
+                prompt = json.loads(text).get("prompt")
+            except (ValueError,AttributeError):
+                prompt = None
+            if not isinstance(prompt,str) or prompt == "":
+                await sendFrame(websocket,"error",{"error": "Expected {\"prompt\": \"...\"}."})
+                continue
+            websocket_stats["messages"] += 1
+            await socketTurn(websocket,session_id,prompt,connection,live)
 
+    except WebSocketDisconnect:
+        logger.debug("chat_socket:: disconnected",extra={"session_id": session_id})
     except Exception as e:
-        print(f"Error decoding response: {e}")
-        return JSONResponse(content={"error": "Operation failed."},status_code=400)
+        logger.error("chat_socket:: exception : %s",e,extra={"session_id": session_id})
+        metrics.observeError("exception")
+    finally:
+        websocket_stats["connections"] -= 1
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest) -> StreamingResponse:
+    """
+    Chat with Gemini for many (session_id, prompt) pairs
+
+    The prompts run concurrently (CHAT_BATCH_CONCURRENCY at most, the
+    prompts of a session in order) and each reply is streamed as one
+    json line as soon as it is ready, so the lines are in completion
+    order and carry the index of their prompt.
+
+    Args:
+        request (BatchChatRequest): {"requests": [{"session_id": "...", "prompt": "..."},...]}
+
+    Returns:
+        application/x-ndjson: Format
+            {"index": 1, "session_id": "...", "role": "model", "response": "..."}
+            {"index": 0, "session_id": "...", "error": "..."}
+            ...
+            {"done": true, "count": 2, "errors": 1}
+    """
+    if len(request.requests) == 0 or len(request.requests) > CHAT_BATCH_MAX_ITEMS:
+        return JSONResponse(content={"error": f"A batch holds 1 to {CHAT_BATCH_MAX_ITEMS} requests."},status_code=400)
+
+    return StreamingResponse(
+        runBatch(request.requests),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache","X-Accel-Buffering": "no"})
+
+@app.get("/health")
+async def health() -> JSONResponse:
+    """
+        Liveness probe, the process is up and its event loop answers
+
+        Returns:
+            json: Format
+            {
+                    "status": "ok"
+            }
+    """
+    return JSONResponse(content={"status": "ok"},status_code=200)
+
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """
+        Readiness probe: the history store answers and the Gemini client is
+        warm and connected (see geminiConnected). DynamoDb is only called when it didn't answer any request for
+        READY_CHECK_MAX_AGE seconds (see HistoryStore.checkTable)
+
+        Returns:
+            json: Format, status 200 when ready, 503 otherwise
+            {
+                    "ready": true,
+                    "history_store": {"status": "ACTIVE"},
+                    "gemini": {"warm": true, "connected": true, "keys": {"total": 3, "available": 3}}
+            }
+
+            "keys" only with several Gemini keys (GEMINI_API_KEYS) or GEMINI_KEY_RPM
+    """
+    try:
+        table_status = await history_store.checkTable(TABLE_HISTORY_TURNS,READY_CHECK_MAX_AGE)
+    except Exception as e:
+        logger.error("ready:: exception : %s",e)
+        table_status = {"error": "History store not available"}
+    connected = geminiConnected()
+    is_ready = table_status.get("status") == "ACTIVE" and gemini_wrapper != None and connected
+    content = {
+        "ready": is_ready,
+        "history_store": table_status,
+        "gemini": {"warm": gemini_wrapper != None, "connected": connected},
+    }
+    if gemini_keys != None:
+        keys = gemini_keys.stats()
+        content["gemini"]["keys"] = {"total": keys["total"], "available": keys["available"]}
+    return JSONResponse(content=content,status_code=200 if is_ready else 503)
 
 @app.get("/describe-table/")
-def describe_table() -> JSONResponse:
+async def describe_table() -> JSONResponse:
     """
         Helper route to verify table history
 
@@ -237,18 +1577,67 @@ def describe_table() -> JSONResponse:
 
     """
     try:
-        table_status = dynamodb_wrapper.getTableStatus(TABLE_HISTORY)
+        table_status = await history_store.getTableStatus(TABLE_HISTORY_TURNS)
 
         if table_status.get("error", False):
             return JSONResponse(content={"error":"Error no resource found"},status_code=404)
         
         return JSONResponse(content= table_status,status_code = 200)
     except Exception as e:
-        print(f"describe_table:: exception : {e}")
+        logger.error("describe_table:: exception : %s",e)
         return JSONResponse(content={"error":"Error retreiving ressource"},status_code=500)
 
+@app.get("/cache-stats/")
+async def cache_stats() -> JSONResponse:
+    """
+        Helper route to check the history cache, the write-behind queue,
+        the response cache, the compression of the stored messages and
+        the cache of the turns offloaded to S3, the pool of the live chat
+        histories, the idempotency keys and the session locks
+
+        Returns:
+            json: Format
+            {
+                    "entries": ..., "bytes": ..., "hits": ..., "misses": ...,
+                    "refreshes": ..., "evictions": ..., "merged": ..., "hit_ratio": ...,
+                    "writer": {"queue_size": ..., "written": ..., "dropped": ..., "merged": ..., ...},
+                    "responses": {"entries": ..., "hits": ..., "misses": ..., ...},
+                    "codec": {"encoded": ..., "compressed": ..., "ratio": ..., ...},
+                    "blocks": {"entries": ..., "hits": ..., "misses": ..., "uploaded": ..., ...},
+                    "chats": {"entries": ..., "bytes": ..., "hits": ..., "misses": ..., ...},
+                    "idempotency": {"entries": ..., "running": ..., "replayed": ..., ...},
+                    "locks": {"sessions": ..., "waiting": ..., "contended": ..., ...}
+            }
+
+    """
+    stats = history_cache.stats()
+    if history_writer != None:
+        stats["writer"] = history_writer.stats()
+    if response_cache != None:
+        stats["responses"] = response_cache.stats()
+    stats["codec"] = history_codec.stats()
+    if block_store != None:
+        stats["blocks"] = block_store.stats()
+    if chat_pool != None:
+        stats["chats"] = chat_pool.stats()
+    if idempotency != None:
+        stats["idempotency"] = idempotency.stats()
+    stats["locks"] = session_locks.stats()
+    return JSONResponse(content=stats,status_code=200)
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """
+        Prometheus metrics
+
+        Returns:
+            text/plain: Prometheus text format, e.g.
+            gemini_api_phase_seconds_bucket{model="...",phase="gemini",status="ok",le="0.5"} 12.0
+    """
+    return Response(content=metrics.export(),media_type=Metrics.CONTENT_TYPE)
+
 @app.get("/get-item/{session_id}")
-def get_item(session_id: str) -> JSONResponse:
+async def get_item(session_id: str) -> JSONResponse:
     """
     Helper route to get a session history
 
@@ -260,16 +1649,18 @@ def get_item(session_id: str) -> JSONResponse:
         [{"role": "...","parts":"..."},{"role": "...","parts":"..."},...]
     """
     try:
-        #Get the history from DynamoDb
-        history = dynamodb_wrapper.getHistory(session_id,TABLE_HISTORY)
+        #Get the whole history from the history store
+        history, last_turn = await getDynamoHistory(session_id,0)
+        if last_turn == None:
+            return JSONResponse(content={"error":"Error retreiving ressource"},status_code=500)
         #if the history is None, return 404
         if history == None:
-            print(f"get_item:: No history")
+            logger.debug("get_item:: no history",extra={"session_id": session_id})
             return JSONResponse(content={"error":"Resource not found"},status_code=404)
 
-        print(f"get_item::session id : {session_id} -> read : {history}")
+        logger.debug("get_item:: read %d turns",last_turn,extra={"session_id": session_id})
 
-        return JSONResponse(content={"session_id":session_id,"history":json.loads(history)}, status_code=200)
+        return JSONResponse(content={"session_id":session_id,"history":history}, status_code=200)
     except Exception as e:
-        print(f"get_item:: exception : {e}")
+        logger.error("get_item:: exception : %s",e,extra={"session_id": session_id})
         return JSONResponse(content={"error":"Error retreiving ressource"},status_code=500)
\ No newline at end of file
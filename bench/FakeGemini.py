@@ -0,0 +1,266 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  Local stand-in of the Gemini API for benchmarks, no key nor network needed.
+  The same fake model is served on two ports:
+      - grpc, used by AsyncGeminiWrapper (GEMINI_API_ENDPOINT=http://127.0.0.1:50051)
+      - rest, used by GeminiWrapper transport='rest' (api_endpoint="http://127.0.0.1:8001")
+
+  Usage:
+      python bench/FakeGemini.py --grpc-port 50051 --rest-port 8001 --latency 0.3 --tokens-per-second 150
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+import google.ai.generativelanguage as glm
+import grpc
+
+
+SERVICE_NAME = "google.ai.generativelanguage.v1beta.GenerativeService"
+
+#Injected errors: grpc code and http status. The SDK retries "unavailable"
+#for up to 10 minutes, "internal" is returned to the caller at once
+ERROR_CODES = {
+    "internal": (grpc.StatusCode.INTERNAL, 500, "INTERNAL"),
+    "unavailable": (grpc.StatusCode.UNAVAILABLE, 503, "UNAVAILABLE"),
+    "resource_exhausted": (grpc.StatusCode.RESOURCE_EXHAUSTED, 429, "RESOURCE_EXHAUSTED"),
+}
+
+
+class FakeGemini:
+    """
+    Fake model: replies with reply_tokens words after "latency" seconds,
+    the words are produced at tokens_per_second (streamed in chunks).
+    A ratio of the calls fails with error_code (see ERROR_CODES).
+
+    Example:
+        >>> fake = FakeGemini(latency=0.3,tokens_per_second=150,error_rate=0.01)
+        >>> await fake.start(grpc_port=50051,rest_port=8001)
+        >>> await fake.stop()
+    """
+
+    #Words sent by chunk when streaming
+    CHUNK_TOKENS = 20
+
+    def __init__(self,latency:float=0.3,tokens_per_second:float=150,reply_tokens:int=120,
+                 error_rate:float=0.0,error_code:str="internal",seed:int=None):
+        """
+        Ctor
+
+        Args:
+            latency (float): time before the first token in seconds
+            tokens_per_second (float): generation speed, 0 for instant
+            reply_tokens (int): number of words of a reply
+            error_rate (float): ratio of the calls failing, between 0 and 1
+            error_code (str): error of the failing calls, a key of ERROR_CODES
+            seed (int): optional seed of the error injection
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_code = ERROR_CODES[error_code]
+        self.random = random.Random(seed)
+        self.grpc_server = None
+        self.rest_runner = None
+        self.calls = 0
+        self.errors = 0
+
+    def fails(self) -> bool:
+        """
+        Draw the error injection of a call
+        """
+        self.calls += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    def words(self,count:int,offset:int=0) -> str:
+        return " ".join(f"token{i}" for i in range(offset,offset+count))
+
+    async def generate(self,request:glm.GenerateContentRequest) -> glm.GenerateContentResponse:
+        """
+        Whole reply, after the latency and the generation time
+        """
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += self.reply_tokens/self.tokens_per_second
+        await asyncio.sleep(delay)
+        return self.response(request,self.words(self.reply_tokens))
+
+    async def stream(self,request:glm.GenerateContentRequest):
+        """
+        Reply by chunks of CHUNK_TOKENS words
+        """
+        await asyncio.sleep(self.latency)
+        for offset in range(0,self.reply_tokens,self.CHUNK_TOKENS):
+            count = min(self.CHUNK_TOKENS,self.reply_tokens-offset)
+            if self.tokens_per_second:
+                await asyncio.sleep(count/self.tokens_per_second)
+            yield self.response(request,self.words(count,offset)+" ")
+
+    def countTokens(self,request:glm.CountTokensRequest) -> glm.CountTokensResponse:
+        contents = list(request.contents) or list(request.generate_content_request.contents)
+        return glm.CountTokensResponse(total_tokens=sum(FakeGemini.tokens(content) for content in contents))
+
+    @staticmethod
+    def tokens(content:glm.Content) -> int:
+        return sum(len(part.text.split()) for part in content.parts)
+
+    def response(self,request:glm.GenerateContentRequest,text:str) -> glm.GenerateContentResponse:
+        prompt_tokens = sum(FakeGemini.tokens(content) for content in request.contents)
+        reply_tokens = len(text.split())
+        return glm.GenerateContentResponse(
+            candidates=[glm.Candidate(
+                index=0,
+                content=glm.Content(role="model",parts=[glm.Part(text=text)]),
+                finish_reason=glm.Candidate.FinishReason.STOP)],
+            usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=reply_tokens,
+                total_token_count=prompt_tokens+reply_tokens))
+
+    """""""""""""""""""""
+            GRPC
+    """""""""""""""""""""
+
+    async def grpcGenerate(self,request,context):
+        if self.fails():
+            await context.abort(self.error_code[0],"Injected error")
+        return await self.generate(request)
+
+    async def grpcStream(self,request,context):
+        if self.fails():
+            await context.abort(self.error_code[0],"Injected error")
+        async for response in self.stream(request):
+            yield response
+
+    async def grpcCountTokens(self,request,context):
+        return self.countTokens(request)
+
+    def grpcHandler(self) -> grpc.GenericRpcHandler:
+        return grpc.method_handlers_generic_handler(SERVICE_NAME,{
+            "GenerateContent": grpc.unary_unary_rpc_method_handler(
+                self.grpcGenerate,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize),
+            "StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+                self.grpcStream,
+                request_deserializer=glm.GenerateContentRequest.deserialize,
+                response_serializer=glm.GenerateContentResponse.serialize),
+            "CountTokens": grpc.unary_unary_rpc_method_handler(
+                self.grpcCountTokens,
+                request_deserializer=glm.CountTokensRequest.deserialize,
+                response_serializer=glm.CountTokensResponse.serialize),
+        })
+
+    """""""""""""""""""""
+            REST
+    """""""""""""""""""""
+
+    async def restCall(self,http_request:web.Request) -> web.StreamResponse:
+        #/v1beta/models/{model}:{method}
+        method = http_request.match_info["method"]
+        body = await http_request.text()
+
+        if method == "countTokens":
+            request = glm.CountTokensRequest.from_json(body,ignore_unknown_fields=True)
+            return web.json_response(text=glm.CountTokensResponse.to_json(self.countTokens(request)))
+
+        if method not in ("generateContent","streamGenerateContent"):
+            return web.json_response({"error": {"code": 404, "message": f"Unknown method {method}"}},status=404)
+        if self.fails():
+            _, status, name = self.error_code
+            return web.json_response({"error": {"code": status, "message": "Injected error", "status": name}},status=status)
+
+        request = glm.GenerateContentRequest.from_json(body,ignore_unknown_fields=True)
+        if method == "generateContent":
+            response = await self.generate(request)
+            return web.json_response(text=glm.GenerateContentResponse.to_json(response))
+
+        #The rest transport of the SDK reads the stream as a json array
+        stream = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await stream.prepare(http_request)
+        separator = "["
+        async for response in self.stream(request):
+            await stream.write((separator + glm.GenerateContentResponse.to_json(response)).encode("utf-8"))
+            separator = ",\n"
+        await stream.write(b"[]" if separator == "[" else b"]")
+        await stream.write_eof()
+        return stream
+
+    async def restStats(self,http_request:web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "errors": self.errors})
+
+    """""""""""""""""""""
+          LIFECYCLE
+    """""""""""""""""""""
+
+    async def start(self,grpc_port:int=50051,rest_port:int=8001,host:str="127.0.0.1") -> None:
+        """
+        Start the grpc and rest servers (a port set to 0 is not served)
+        """
+        if grpc_port:
+            self.grpc_server = grpc.aio.server()
+            self.grpc_server.add_generic_rpc_handlers((self.grpcHandler(),))
+            self.grpc_server.add_insecure_port(f"{host}:{grpc_port}")
+            await self.grpc_server.start()
+
+        if rest_port:
+            rest_app = web.Application()
+            rest_app.router.add_post("/v1beta/models/{model}:{method}",self.restCall)
+            rest_app.router.add_get("/stats",self.restStats)
+            self.rest_runner = web.AppRunner(rest_app)
+            await self.rest_runner.setup()
+            await web.TCPSite(self.rest_runner,host,rest_port).start()
+
+    async def stop(self) -> None:
+        if self.grpc_server != None:
+            await self.grpc_server.stop(None)
+            self.grpc_server = None
+        if self.rest_runner != None:
+            await self.rest_runner.cleanup()
+            self.rest_runner = None
+
+
+async def serve(args) -> None:
+    fake = FakeGemini(latency=args.latency,
+                      tokens_per_second=args.tokens_per_second,
+                      reply_tokens=args.reply_tokens,
+                      error_rate=args.error_rate,
+                      error_code=args.error_code,
+                      seed=args.seed)
+    await fake.start(args.grpc_port,args.rest_port,args.host)
+    print(json.dumps({"grpc_port": args.grpc_port, "rest_port": args.rest_port}),flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in of the Gemini API")
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--grpc-port",type=int,default=50051,help="0 to disable")
+    parser.add_argument("--rest-port",type=int,default=8001,help="0 to disable")
+    parser.add_argument("--latency",type=float,default=0.3,help="time before the first token (s)")
+    parser.add_argument("--tokens-per-second",type=float,default=150,help="generation speed, 0 for instant")
+    parser.add_argument("--reply-tokens",type=int,default=120,help="number of words of a reply")
+    parser.add_argument("--error-rate",type=float,default=0.0,help="ratio of the calls failing")
+    parser.add_argument("--error-code",default="internal",choices=sorted(ERROR_CODES))
+    parser.add_argument("--seed",type=int,default=None)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parseArgs()))
+    except KeyboardInterrupt:
+        pass
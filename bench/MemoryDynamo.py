@@ -0,0 +1,318 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  In-memory stand-in of the aiobotocore DynamoDb client for benchmarks.
+  Only the calls and expressions used by AsyncDynamoWrapper are supported.
+
+  It can also be served over http (DynamoDb json protocol) so the API
+  uses its real client and connection pool against a DynamoDb whose
+  latency doesn't grow with the load:
+
+      python bench/MemoryDynamo.py --port 4567 --latency 0.005
+"""
+import argparse
+import asyncio
+import json
+import re
+import types
+
+from aiohttp import web
+from botocore.exceptions import ClientError
+
+
+class ResourceNotFoundException(ClientError):
+    pass
+
+
+class ConditionalCheckFailedException(ClientError):
+    pass
+
+
+class Exceptions:
+    ResourceNotFoundException = ResourceNotFoundException
+    ConditionalCheckFailedException = ConditionalCheckFailedException
+
+
+class Events:
+    """
+    Stand-in of the event system of a client, only the after-call
+    handlers are called (with a 200 response)
+    """
+
+    def __init__(self):
+        self.handlers = []
+
+    def register(self,event_name:str,handler) -> None:
+        if event_name.startswith("after-call"):
+            self.handlers.append(handler)
+
+    def emit(self) -> None:
+        for handler in self.handlers:
+            handler(http_response=types.SimpleNamespace(status_code=200))
+
+
+class MemoryDynamoClient:
+    """
+    Tables held in dicts, items in the low-level format ({"S": ...}, {"N": ...}).
+    An optional latency is added to each call to mimic the network.
+
+    Example:
+        >>> client = MemoryDynamoClient({"ChatHistoryTurns": ("session_id","turn")},latency=0.002)
+        >>> dynamodb_wrapper = AsyncDynamoWrapper(client)
+    """
+
+    exceptions = Exceptions
+
+    def __init__(self,tables:dict,latency:float=0.0):
+        """
+        Ctor
+
+        Args:
+            tables (dict): table name -> (hash key, range key or None)
+            latency (float): delay added to each call in seconds
+        """
+        self.latency = latency
+        self.keys = dict(tables)
+        #table name -> hash value -> range value -> item
+        self.tables = {name: {} for name in tables}
+        self.calls = 0
+        self.meta = types.SimpleNamespace(events=Events())
+
+    async def call(self,operation:str,table_name:str) -> dict:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if table_name not in self.tables:
+            raise ResourceNotFoundException(
+                {"Error": {"Code": "ResourceNotFoundException", "Message": "Cannot do operations on a non-existent table"}},
+                operation)
+        self.meta.events.emit()
+        return self.tables[table_name]
+
+    def keyOf(self,table_name:str,item:dict) -> tuple:
+        hash_key, range_key = self.keys[table_name]
+        return value(item[hash_key]), (value(item[range_key]) if range_key else None)
+
+    async def get_item(self,TableName:str,Key:dict,**kwargs) -> dict:
+        table = await self.call("GetItem",TableName)
+        hash_value, range_value = self.keyOf(TableName,Key)
+        item = table.get(hash_value,{}).get(range_value)
+        return {"Item": copyItem(item)} if item != None else {}
+
+    async def put_item(self,TableName:str,Item:dict,ConditionExpression:str=None,ExpressionAttributeValues:dict=None,**kwargs) -> dict:
+        table = await self.call("PutItem",TableName)
+        #Only "attribute_not_exists(key)", true if the item doesn't exist,
+        #optionally "... OR expires_at < :now", also true if the item expired
+        if ConditionExpression != None:
+            hash_value, range_value = self.keyOf(TableName,Item)
+            existing = table.get(hash_value,{}).get(range_value)
+            expired = (existing != None and "expires_at <" in ConditionExpression
+                       and int(existing["expires_at"]["N"]) < int(ExpressionAttributeValues[":now"]["N"]))
+            if existing != None and not expired:
+                raise ConditionalCheckFailedException(
+                    {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+                    "PutItem")
+        self.store(table,TableName,Item)
+        return {}
+
+    def store(self,table:dict,table_name:str,item:dict) -> None:
+        hash_value, range_value = self.keyOf(table_name,item)
+        table.setdefault(hash_value,{})[range_value] = copyItem(item)
+
+    async def update_item(self,TableName:str,Key:dict,UpdateExpression:str,ExpressionAttributeValues:dict,
+                          ReturnValues:str="NONE",**kwargs) -> dict:
+        table = await self.call("UpdateItem",TableName)
+        hash_value, range_value = self.keyOf(TableName,Key)
+        item = table.setdefault(hash_value,{}).setdefault(range_value,copyItem(Key))
+        updated = {}
+        #Only "SET a = :x, b = :y"
+        for assignment in UpdateExpression.strip()[len("SET"):].split(","):
+            name, placeholder = [part.strip() for part in assignment.split("=")]
+            item[name] = dict(ExpressionAttributeValues[placeholder])
+            updated[name] = dict(item[name])
+        return {"Attributes": updated} if ReturnValues == "UPDATED_NEW" else {}
+
+    async def query(self,TableName:str,KeyConditionExpression:str,ExpressionAttributeValues:dict,
+                    ScanIndexForward:bool=True,Limit:int=None,ExclusiveStartKey:dict=None,
+                    ProjectionExpression:str=None,**kwargs) -> dict:
+        table = await self.call("Query",TableName)
+        hash_key, range_key = self.keys[TableName]
+
+        #Only "hash = :h" and "hash = :h AND range <op> :r"
+        conditions = [part.strip() for part in re.split(r"\s+AND\s+",KeyConditionExpression,flags=re.IGNORECASE)]
+        _, _, placeholder = conditions[0].split()
+        items = table.get(value(ExpressionAttributeValues[placeholder]),{})
+        ranges = sorted(items)
+        if len(conditions) > 1:
+            _, operator, placeholder = conditions[1].split()
+            bound = value(ExpressionAttributeValues[placeholder])
+            ranges = [r for r in ranges if OPERATORS[operator](r,bound)]
+        if not ScanIndexForward:
+            ranges.reverse()
+        if ExclusiveStartKey != None:
+            start = value(ExclusiveStartKey[range_key])
+            ranges = ranges[ranges.index(start)+1:] if start in ranges else []
+
+        response = {}
+        if Limit and len(ranges) > Limit:
+            ranges = ranges[:Limit]
+            response["LastEvaluatedKey"] = {key: dict(items[ranges[-1]][key]) for key in (hash_key,range_key)}
+
+        attributes = [name.strip() for name in ProjectionExpression.split(",")] if ProjectionExpression else None
+        response["Items"] = [copyItem(items[r],attributes) for r in ranges]
+        response["Count"] = len(response["Items"])
+        return response
+
+    async def batch_write_item(self,RequestItems:dict,**kwargs) -> dict:
+        for table_name, requests in RequestItems.items():
+            table = await self.call("BatchWriteItem",table_name)
+            for request in requests:
+                if "PutRequest" in request:
+                    self.store(table,table_name,request["PutRequest"]["Item"])
+                else:
+                    hash_value, range_value = self.keyOf(table_name,request["DeleteRequest"]["Key"])
+                    table.get(hash_value,{}).pop(range_value,None)
+        return {"UnprocessedItems": {}}
+
+    async def batch_get_item(self,RequestItems:dict,**kwargs) -> dict:
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = await self.call("BatchGetItem",table_name)
+            projection = request.get("ProjectionExpression")
+            attributes = [name.strip() for name in projection.split(",")] if projection else None
+            responses[table_name] = []
+            for key in request["Keys"]:
+                hash_value, range_value = self.keyOf(table_name,key)
+                item = table.get(hash_value,{}).get(range_value)
+                if item != None:
+                    responses[table_name].append(copyItem(item,attributes))
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    async def describe_table(self,TableName:str) -> dict:
+        await self.call("DescribeTable",TableName)
+        return {"Table": {"TableName": TableName, "TableStatus": "ACTIVE"}}
+
+
+class MemorySession:
+    """
+    Stand-in of aiobotocore.session.AioSession, create_client always
+    returns the same in-memory client so the data outlives the client context
+    """
+
+    def __init__(self,client:MemoryDynamoClient):
+        self.client = client
+
+    def create_client(self,service_name:str,**kwargs):
+        return ClientContext(self.client)
+
+
+class ClientContext:
+
+    def __init__(self,client:MemoryDynamoClient):
+        self.client = client
+
+    async def __aenter__(self) -> MemoryDynamoClient:
+        return self.client
+
+    async def __aexit__(self,*exc_info) -> None:
+        return None
+
+
+OPERATORS = {
+    "=": lambda a, b: a == b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+def value(attribute:dict):
+    """
+    Comparable value of a key attribute ({"S": "a"} -> "a", {"N": "2"} -> 2)
+    """
+    if "N" in attribute:
+        number = float(attribute["N"])
+        return int(number) if number.is_integer() else number
+    return next(iter(attribute.values()))
+
+
+def copyItem(item:dict,attributes:list=None) -> dict:
+    if item == None:
+        return None
+    return {name: dict(attribute) for name, attribute in item.items() if attributes == None or name in attributes}
+
+
+class MemoryDynamoServer:
+    """
+    DynamoDb json protocol (POST / with X-Amz-Target) in front of a MemoryDynamoClient
+    """
+
+    def __init__(self,client:MemoryDynamoClient):
+        self.client = client
+        self.runner = None
+
+    async def call(self,http_request:web.Request) -> web.Response:
+        operation = http_request.headers.get("X-Amz-Target","").split(".")[-1]
+        method = getattr(self.client,re.sub(r"(?<!^)([A-Z])",r"_\1",operation).lower(),None)
+        if method == None:
+            return self.error(400,"UnknownOperationException",f"Unknown operation {operation}")
+        try:
+            response = await method(**json.loads(await http_request.read()))
+        except ClientError as e:
+            return self.error(400,e.response["Error"]["Code"],e.response["Error"]["Message"])
+        return web.json_response(response,content_type="application/x-amz-json-1.0")
+
+    def error(self,status:int,code:str,message:str) -> web.Response:
+        return web.json_response({"__type": f"com.amazonaws.dynamodb.v20120810#{code}", "message": message},
+                                 status=status,content_type="application/x-amz-json-1.0")
+
+    async def start(self,port:int=4567,host:str="127.0.0.1") -> None:
+        app = web.Application(client_max_size=16*1024*1024)
+        app.router.add_post("/",self.call)
+        self.runner = web.AppRunner(app,access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner,host,port).start()
+
+    async def stop(self) -> None:
+        if self.runner != None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+async def serve(args) -> None:
+    client = MemoryDynamoClient({
+        args.table_history_turns: ("session_id","turn"),
+        args.table_history: ("session_id",None),
+        args.table_response_cache: ("cache_key",None),
+        args.table_idempotency: ("cache_key",None),
+    },latency=args.latency)
+    server = MemoryDynamoServer(client)
+    await server.start(args.port,args.host)
+    print(json.dumps({"port": args.port}),flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="In-memory DynamoDb served over http")
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--port",type=int,default=4567)
+    parser.add_argument("--latency",type=float,default=0.005,help="delay added to each call (s)")
+    parser.add_argument("--table-history-turns",default="ChatHistoryTurns")
+    parser.add_argument("--table-history",default="ChatHistory")
+    parser.add_argument("--table-response-cache",default="ChatResponseCache")
+    parser.add_argument("--table-idempotency",default="ChatIdempotency")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parseArgs()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,334 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  Load generator: runs sessions of growing history against /chat/ (or
+  /chat/stream, or /ws/chat with one connection per session) and writes a json report with the latency percentiles,
+  the throughput, the latency by turn and the per-phase breakdown read
+  from /metrics. A previous report can be given to flag regressions.
+
+  Usage:
+      python bench/load.py --url http://127.0.0.1:8000 --sessions 100 --turns 10 --concurrency 20
+      python bench/load.py ... --compare bench/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+
+import aiohttp
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+#Metrics of the report compared by --compare, and the direction of a regression
+COMPARED = {
+    ("latency_ms","p50_ms"): "higher",
+    ("latency_ms","p95_ms"): "higher",
+    ("latency_ms","p99_ms"): "higher",
+    ("rps",): "lower",
+    ("error_rate",): "higher",
+}
+
+METRIC_LINE = re.compile(r'^(?P<name>[a-zA-Z_:]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def percentile(values:list,p:float) -> float:
+    """
+    Percentile with linear interpolation, values must be sorted
+    """
+    if len(values) == 0:
+        return 0.0
+    rank = (len(values)-1)*p/100
+    low = int(rank)
+    high = min(low+1,len(values)-1)
+    return values[low] + (values[high]-values[low])*(rank-low)
+
+def summarize(latencies:list) -> dict:
+    """
+    Count, mean and percentiles of latencies in seconds, reported in ms
+    """
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean_ms": round(1000*sum(values)/len(values),2) if values else 0.0,
+        "p50_ms": round(1000*percentile(values,50),2),
+        "p95_ms": round(1000*percentile(values,95),2),
+        "p99_ms": round(1000*percentile(values,99),2),
+        "max_ms": round(1000*values[-1],2) if values else 0.0,
+    }
+
+def parseMetrics(text:str) -> dict:
+    """
+    Read the phase histograms of /metrics
+
+    Returns:
+        dict: {(sample name, phase, le): value} for the "ok" status
+    """
+    samples = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match == None or not match["name"].startswith("gemini_api_phase_seconds"):
+            continue
+        labels = dict(LABEL.findall(match["labels"] or ""))
+        if labels.get("status") != "ok":
+            continue
+        key = (match["name"],labels["phase"],labels.get("le"))
+        samples[key] = samples.get(key,0.0) + float(match["value"])
+    return samples
+
+def phaseBreakdown(before:dict,after:dict) -> dict:
+    """
+    Per-phase count, mean and percentiles (estimated from the histogram
+    buckets) of the requests sent between two /metrics scrapes
+    """
+    delta = {key: value-before.get(key,0.0) for key, value in after.items()}
+    phases = {}
+    for (name, phase, _), count in delta.items():
+        if name != "gemini_api_phase_seconds_count" or count <= 0:
+            continue
+        buckets = sorted((float(le),value) for (bucket_name, bucket_phase, le), value in delta.items()
+                         if bucket_name == "gemini_api_phase_seconds_bucket" and bucket_phase == phase and le != "+Inf")
+        total = delta.get(("gemini_api_phase_seconds_sum",phase,None),0.0)
+        phases[phase] = {
+            "count": int(count),
+            "mean_ms": round(1000*total/count,2),
+            "p50_ms": round(1000*bucketQuantile(buckets,count,0.50),2),
+            "p95_ms": round(1000*bucketQuantile(buckets,count,0.95),2),
+            "p99_ms": round(1000*bucketQuantile(buckets,count,0.99),2),
+        }
+    return phases
+
+def bucketQuantile(buckets:list,count:float,q:float) -> float:
+    """
+    Quantile of a cumulative histogram, interpolated in the bucket (like histogram_quantile)
+    """
+    rank = q*count
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= rank:
+            if cumulative == lower_count:
+                return bound
+            return lower_bound + (bound-lower_bound)*(rank-lower_count)/(cumulative-lower_count)
+        lower_bound, lower_count = bound, cumulative
+    return lower_bound
+
+async def scrapeMetrics(http:aiohttp.ClientSession,url:str) -> dict:
+    try:
+        async with http.get(f"{url}/metrics") as response:
+            return parseMetrics(await response.text())
+    except aiohttp.ClientError:
+        return {}
+
+async def sendTurn(http:aiohttp.ClientSession,args,session_id:str,turn:int) -> dict:
+    """
+    Send one prompt, return the latency (and time to first byte when streaming)
+    """
+    prompt = f"[{session_id} turn {turn}] " + " ".join(f"word{i}" for i in range(args.prompt_words))
+    path = "/chat/stream" if args.stream else "/chat/"
+    start = time.perf_counter()
+    first_byte = None
+    body = bytearray()
+    try:
+        async with http.post(f"{args.url}{path}",json={"prompt": prompt, "session_id": session_id}) as response:
+            async for chunk in response.content.iter_any():
+                if first_byte == None:
+                    first_byte = time.perf_counter()-start
+                body += chunk
+            status = response.status
+        #The routes answer 200 with an error payload when Gemini fails
+        ok = status == 200 and (b"event: error" not in body if args.stream else b'"error"' not in body)
+    except (aiohttp.ClientError,asyncio.TimeoutError) as e:
+        ok, status = False, type(e).__name__
+    return {"turn": turn, "latency": time.perf_counter()-start, "first_byte": first_byte,
+            "ok": ok, "status": status if ok else f"{status} error", "bytes": len(body)}
+
+async def sendSocketTurn(socket:aiohttp.ClientWebSocketResponse,args,session_id:str,turn:int) -> dict:
+    """
+    Send one prompt on the websocket of the session, return the latency (and time to the first frame)
+    """
+    prompt = f"[{session_id} turn {turn}] " + " ".join(f"word{i}" for i in range(args.prompt_words))
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    event = "error"
+    try:
+        await socket.send_json({"prompt": prompt})
+        while True:
+            message = await socket.receive(timeout=args.timeout)
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            if first_byte == None:
+                first_byte = time.perf_counter()-start
+            size += len(message.data)
+            event = json.loads(message.data)["event"]
+            if event != "message":
+                break
+        ok, status = event == "done", event
+    except (aiohttp.ClientError,asyncio.TimeoutError) as e:
+        ok, status = False, type(e).__name__
+    return {"turn": turn, "latency": time.perf_counter()-start, "first_byte": first_byte,
+            "ok": ok, "status": 200 if ok else f"{status} error", "bytes": size}
+
+async def runSession(http:aiohttp.ClientSession,args,session_id:str,results:list,semaphore:asyncio.Semaphore) -> None:
+    """
+    Send the turns of a session one after the other, the history grows at each turn
+    """
+    async with semaphore:
+        if not args.websocket:
+            for turn in range(1,args.turns+1):
+                results.append(await sendTurn(http,args,session_id,turn))
+            return
+
+        url = args.url.replace("http","ws",1)
+        async with http.ws_connect(f"{url}/ws/chat",params={"session_id": session_id}) as socket:
+            for turn in range(1,args.turns+1):
+                results.append(await sendSocketTurn(socket,args,session_id,turn))
+
+async def run(args,config:dict=None) -> dict:
+    """
+    Run the load and build the report
+
+    Args:
+        args: parsed arguments (see addArguments)
+        config (dict): optional settings added to the report (e.g. the stand-ins settings)
+
+    Returns:
+        report (dict): the json report
+    """
+    run_id = uuid.uuid4().hex[:8]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout,connector=connector) as http:
+        #Warm up the connections and the clients of the API
+        for i in range(args.warmup):
+            await sendTurn(http,args,f"warmup-{run_id}-{i}",1)
+
+        before = await scrapeMetrics(http,args.url)
+        results = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+        start = time.perf_counter()
+        await asyncio.gather(*(runSession(http,args,f"bench-{run_id}-{i}",results,semaphore)
+                               for i in range(args.sessions)))
+        duration = time.perf_counter()-start
+        after = await scrapeMetrics(http,args.url)
+
+    ok = [result for result in results if result["ok"]]
+    by_turn = {}
+    for result in ok:
+        by_turn.setdefault(result["turn"],[]).append(result["latency"])
+    errors = {}
+    for result in results:
+        if not result["ok"]:
+            errors[str(result["status"])] = errors.get(str(result["status"]),0)+1
+
+    report = {
+        "label": args.label,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ",time.gmtime()),
+        "config": {
+            "url": args.url, "stream": args.stream, "websocket": args.websocket, "sessions": args.sessions, "turns": args.turns,
+            "concurrency": args.concurrency, "prompt_words": args.prompt_words,
+            **{key: value for key, value in os.environ.items() if key.startswith(("HISTORY_","CONTEXT_","RESPONSE_CACHE"))},
+            **(config or {}),
+        },
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round((len(results)-len(ok))/len(results),4) if results else 0.0,
+        "duration_s": round(duration,3),
+        "rps": round(len(ok)/duration,2) if duration else 0.0,
+        "latency_ms": summarize([result["latency"] for result in ok]),
+        "by_turn": {str(turn): summarize(latencies) for turn, latencies in sorted(by_turn.items())},
+        "phases": phaseBreakdown(before,after),
+    }
+    if args.stream or args.websocket:
+        report["first_byte_ms"] = summarize([result["first_byte"] for result in ok if result["first_byte"] != None])
+    return report
+
+def compare(report:dict,baseline:dict,threshold:float) -> list:
+    """
+    Compare a report with a baseline
+
+    Returns:
+        list: [(metric, baseline value, new value, change ratio, regression),...]
+    """
+    rows = []
+    for path, worse in COMPARED.items():
+        old, new = baseline, report
+        for key in path:
+            old = old.get(key,{}) if isinstance(old,dict) else None
+            new = new.get(key,{}) if isinstance(new,dict) else None
+        if not isinstance(old,(int,float)) or not isinstance(new,(int,float)):
+            continue
+        change = (new-old)/old if old else 0.0
+        regression = change > threshold if worse == "higher" else change < -threshold
+        if path == ("error_rate",):
+            change = new-old
+            regression = change > threshold/10
+        rows.append((".".join(path),old,new,round(change,4),regression))
+    return rows
+
+def printReport(report:dict,rows:list=None) -> None:
+    latency = report["latency_ms"]
+    print(f"{report['requests']} requests in {report['duration_s']} s, {report['rps']} req/s, "
+          f"error rate {report['error_rate']}")
+    print(f"latency ms: p50 {latency['p50_ms']}  p95 {latency['p95_ms']}  p99 {latency['p99_ms']}  max {latency['max_ms']}")
+    for phase, values in report["phases"].items():
+        print(f"  {phase:<20} n={values['count']:<6} mean {values['mean_ms']:>9} ms  p95 {values['p95_ms']:>9} ms  p99 {values['p99_ms']:>9} ms")
+    for metric, old, new, change, regression in rows or []:
+        print(f"  {metric:<20} {old:>10} -> {new:<10} {change:+.1%} {'REGRESSION' if regression else ''}")
+
+def writeReport(report:dict,out:str=None) -> str:
+    if not out:
+        os.makedirs(RESULTS_DIR,exist_ok=True)
+        name = f"{report['label'] or 'run'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        out = os.path.join(RESULTS_DIR,name)
+    with open(out,"w") as file:
+        json.dump(report,file,indent=2)
+    return out
+
+def addArguments(parser:argparse.ArgumentParser) -> None:
+    parser.add_argument("--url",default="http://127.0.0.1:8000",help="url of the API")
+    parser.add_argument("--sessions",type=int,default=50,help="number of sessions")
+    parser.add_argument("--turns",type=int,default=10,help="turns per session, the history grows at each turn")
+    parser.add_argument("--concurrency",type=int,default=10,help="sessions running at the same time")
+    parser.add_argument("--prompt-words",type=int,default=30,help="words of each prompt")
+    parser.add_argument("--stream",action="store_true",help="use /chat/stream")
+    parser.add_argument("--websocket",action="store_true",help="use /ws/chat, one connection per session")
+    parser.add_argument("--warmup",type=int,default=5,help="requests sent before measuring")
+    parser.add_argument("--timeout",type=float,default=120,help="timeout of a request (s)")
+    parser.add_argument("--label",default="",help="name of the run, used in the report file name")
+    parser.add_argument("--out",default="",help="report file, default bench/results/<label>-<time>.json")
+    parser.add_argument("--compare",default="",help="previous report to compare with")
+    parser.add_argument("--threshold",type=float,default=0.10,help="change ratio flagged as a regression")
+
+def finish(report:dict,args) -> int:
+    """
+    Write and print the report, compare it with the baseline
+
+    Returns:
+        int: exit code, 1 if a regression was found
+    """
+    rows = None
+    if args.compare:
+        with open(args.compare) as file:
+            rows = compare(report,json.load(file),args.threshold)
+        report["comparison"] = {"baseline": args.compare,
+                                "rows": [dict(zip(("metric","baseline","value","change","regression"),row)) for row in rows]}
+    out = writeReport(report,args.out)
+    printReport(report,rows)
+    print(f"report : {out}")
+    return 1 if rows and any(row[4] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator of the chat API")
+    addArguments(parser)
+    args = parser.parse_args()
+    sys.exit(finish(asyncio.run(run(args)),args))
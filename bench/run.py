@@ -0,0 +1,128 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  Offline benchmark: start the Gemini stand-in and the API (with the
+  in-memory DynamoDb), run the load generator then stop everything.
+  The app settings are read from the environment, e.g. to compare
+  the write-behind queue with write-through:
+
+      python bench/run.py --label write-behind
+      HISTORY_WRITE_BEHIND=false python bench/run.py --label write-through \
+          --compare bench/results/write-behind-<time>.json
+
+  or the DynamoDb connection pool, with the stand-in served over http
+  (--dynamodb-http PORT) or LocalStack (tables created by init-aws.sh):
+
+      DYNAMODB_MAX_POOL_CONNECTIONS=10 python bench/run.py --label pool-10 --dynamodb-http 4567
+      DYNAMODB_MAX_POOL_CONNECTIONS=10 python bench/run.py --label pool-10 \
+          --dynamodb-endpoint http://localhost:4566
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(BENCH_DIR, ".."))
+from bench import load
+from bench.FakeGemini import ERROR_CODES
+
+
+async def waitReady(url:str,process:subprocess.Popen,timeout:float=30) -> None:
+    """
+    Wait for an http server to answer (below 500, /ready answers 503 until the app is warm
+    and connected to Gemini)
+    """
+    deadline = time.monotonic()+timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            if process.poll() != None:
+                raise RuntimeError(f"{process.args[1]} exited with code {process.returncode}")
+            try:
+                async with http.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout} s")
+
+
+async def waitPort(port:int,process:subprocess.Popen,timeout:float=30,host:str="127.0.0.1") -> None:
+    """
+    Wait for a server to listen on a port (the Gemini stand-in, before the API
+    connects to it: early failed calls would open the circuit breaker)
+    """
+    deadline = time.monotonic()+timeout
+    while time.monotonic() < deadline:
+        if process.poll() != None:
+            raise RuntimeError(f"{process.args[1]} exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection(host,port)
+            writer.close()
+            await writer.wait_closed()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{host}:{port} not listening after {timeout} s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the chat API")
+    load.addArguments(parser)
+    stand_ins = parser.add_argument_group("stand-ins")
+    stand_ins.add_argument("--port",type=int,default=8000,help="port of the API")
+    stand_ins.add_argument("--grpc-port",type=int,default=50051,help="grpc port of the Gemini stand-in")
+    stand_ins.add_argument("--latency",type=float,default=0.3,help="Gemini time before the first token (s)")
+    stand_ins.add_argument("--tokens-per-second",type=float,default=150,help="Gemini generation speed")
+    stand_ins.add_argument("--reply-tokens",type=int,default=120,help="words of a Gemini reply")
+    stand_ins.add_argument("--error-rate",type=float,default=0.0,help="ratio of the Gemini calls failing")
+    stand_ins.add_argument("--error-code",default="internal",choices=sorted(ERROR_CODES))
+    stand_ins.add_argument("--dynamodb-latency",type=float,default=0.002,help="delay added to each DynamoDb call (s)")
+    stand_ins.add_argument("--dynamodb-endpoint",default="",help="real DynamoDb endpoint (e.g. LocalStack) instead of the stand-in")
+    stand_ins.add_argument("--dynamodb-http",type=int,default=0,
+                           help="port of the stand-in served over http (the API uses its DynamoDb client and pool)")
+    args = parser.parse_args(argv)
+    args.url = f"http://127.0.0.1:{args.port}"
+
+    config = {key: getattr(args,key) for key in ("latency","tokens_per_second","reply_tokens",
+                                                 "error_rate","error_code","dynamodb_latency","dynamodb_endpoint","dynamodb_http")}
+    processes = []
+    try:
+        if args.dynamodb_http:
+            processes.append(subprocess.Popen([sys.executable,os.path.join(BENCH_DIR,"MemoryDynamo.py"),
+                "--port",str(args.dynamodb_http),"--latency",str(args.dynamodb_latency)],stdout=subprocess.DEVNULL))
+            args.dynamodb_endpoint = f"http://127.0.0.1:{args.dynamodb_http}"
+        processes.append(subprocess.Popen([sys.executable,os.path.join(BENCH_DIR,"FakeGemini.py"),
+            "--grpc-port",str(args.grpc_port),"--rest-port","0",
+            "--latency",str(args.latency),"--tokens-per-second",str(args.tokens_per_second),
+            "--reply-tokens",str(args.reply_tokens),"--error-rate",str(args.error_rate),
+            "--error-code",args.error_code],stdout=subprocess.DEVNULL))
+        asyncio.run(waitPort(args.grpc_port,processes[-1]))
+        if args.dynamodb_http:
+            asyncio.run(waitPort(args.dynamodb_http,processes[0]))
+        processes.append(subprocess.Popen([sys.executable,os.path.join(BENCH_DIR,"server.py"),
+            "--port",str(args.port),"--gemini-endpoint",f"http://127.0.0.1:{args.grpc_port}",
+            "--dynamodb-latency",str(args.dynamodb_latency),"--dynamodb-endpoint",args.dynamodb_endpoint]))
+
+        asyncio.run(waitReady(f"{args.url}/ready",processes[-1]))
+        report = asyncio.run(load.run(args,config))
+        return load.finish(report,args)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
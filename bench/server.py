@@ -0,0 +1,64 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  Run the API for benchmarks: DynamoDb is replaced by the in-memory
+  stand-in (bench/MemoryDynamo.py) and Gemini calls go to the fake
+  server (bench/FakeGemini.py). The app settings are read from the
+  environment as usual (HISTORY_WRITE_BEHIND, RESPONSE_CACHE, ...),
+  with HISTORY_STORE=memory or sqlite the stand-in is not used. With
+  --dynamodb-endpoint the API uses a real DynamoDb endpoint (LocalStack,
+  the tables must exist), e.g. to measure the http connection pool.
+
+  Usage:
+      python bench/server.py --port 8000 --gemini-endpoint http://127.0.0.1:50051
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.MemoryDynamo import MemoryDynamoClient, MemorySession
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="API with local stand-ins of Gemini and DynamoDb")
+    parser.add_argument("--host",default="127.0.0.1")
+    parser.add_argument("--port",type=int,default=8000)
+    parser.add_argument("--gemini-endpoint",default="http://127.0.0.1:50051",help="grpc endpoint of FakeGemini")
+    parser.add_argument("--dynamodb-latency",type=float,default=0.002,help="delay added to each DynamoDb call (s)")
+    parser.add_argument("--dynamodb-endpoint",default="",help="DynamoDb endpoint used instead of the stand-in")
+    args = parser.parse_args(argv)
+
+    os.environ["GEMINI_API_ENDPOINT"] = args.gemini_endpoint
+    os.environ.setdefault("GEMINI_API_KEY","bench")
+    os.environ.setdefault("LOG_LEVEL","WARNING")
+    if args.dynamodb_endpoint:
+        os.environ["DYNAMODB_ENDPOINT"] = args.dynamodb_endpoint
+        #Credentials of LocalStack and of the stand-in
+        os.environ.setdefault("AWS_ACCESS_KEY_ID","bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY","bench")
+    import app as api
+
+    if args.dynamodb_endpoint:
+        uvicorn.run(api.app,host=args.host,port=args.port,log_level="warning")
+        return
+
+    client = MemoryDynamoClient({
+        api.TABLE_HISTORY_TURNS: ("session_id","turn"),
+        api.TABLE_HISTORY: ("session_id",None),
+        api.TABLE_RESPONSE_CACHE or "ChatResponseCache": ("cache_key",None),
+        api.TABLE_IDEMPOTENCY or "ChatIdempotency": ("cache_key",None),
+    },latency=args.dynamodb_latency)
+    #The lifespan creates the DynamoDb client from this session
+    api.awsSession = lambda: MemorySession(client)
+
+    uvicorn.run(api.app,host=args.host,port=args.port,log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import deque
+import asyncio
+import math
+import time
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted, the API answers with
+    status_code and a Retry-After header of retry_after seconds
+    """
+
+    def __init__(self,reason:str,status_code:int,retry_after:int):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    Concurrency limiter with a bounded wait queue in front of Gemini.
+
+    At most max_concurrency requests hold a slot, the others wait in
+    arrival order. A request is rejected at once with 429 when max_queue
+    requests are already waiting, and with 503 when it waited max_wait
+    seconds without getting a slot, instead of piling up on an upstream
+    that is already at its quota. The Retry-After of a rejection is an
+    estimate of the time needed to drain the queue.
+
+    Example:
+        >>> admission = AdmissionControl(max_concurrency=32,max_queue=64,max_wait=10)
+        >>> release = await admission.acquire()
+        >>> try:
+        >>>     ...
+        >>> finally:
+        >>>     release()
+    """
+
+    def __init__(self,max_concurrency:int=32,max_queue:int=64,max_wait:float=10,max_retry_after:int=60):
+        """
+        Ctor
+
+        Args:
+            max_concurrency (int): maximum number of slots held at the same time, 0 for no limit
+            max_queue (int): maximum number of requests waiting for a slot
+            max_wait (float): maximum wait for a slot in seconds (queue-time budget)
+            max_retry_after (int): upper bound of the Retry-After in seconds
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retry_after = max_retry_after
+        self.waiters = deque()
+        self.active = 0
+        #Moving average of the time a slot is held, in seconds
+        self.hold_time = 1.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    async def acquire(self):
+        """
+        Wait for a slot
+
+        Returns:
+            release: function releasing the slot, it can be called several times
+
+        Raises:
+            AdmissionRejected: 429 if the queue is full, 503 if the wait exceeds max_wait
+        """
+        if not self.max_concurrency:
+            self.admitted += 1
+            return lambda: None
+
+        if self.active < self.max_concurrency and len(self.waiters) == 0:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected("queue_full",429,self.retryAfter())
+
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(waiter,self.max_wait)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    #The slot was handed over while the wait was interrupted
+                    self.releaseSlot()
+                elif waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                if isinstance(e,asyncio.TimeoutError):
+                    self.rejected_timeout += 1
+                    raise AdmissionRejected("queue_timeout",503,self.retryAfter())
+                raise
+        self.admitted += 1
+
+        start = time.perf_counter()
+        released = False
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.hold_time = 0.9*self.hold_time + 0.1*(time.perf_counter()-start)
+                self.releaseSlot()
+        return release
+
+    def releaseSlot(self) -> None:
+        """
+        Hand the slot over to the first waiting request, or free it
+        """
+        while len(self.waiters) > 0:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def retryAfter(self) -> int:
+        """
+        Estimated time before a new request would get a slot, in seconds
+        """
+        drain = (len(self.waiters)+1) * self.hold_time / max(self.max_concurrency,1)
+        return min(max(1,math.ceil(drain)),self.max_retry_after)
+
+    def stats(self) -> dict:
+        """
+        Limiter counters
+
+        Returns:
+            json: Format
+            {
+                "active": ..., "queue_depth": ..., "admitted": ..., "queued": ...,
+                "rejected_queue_full": ..., "rejected_timeout": ..., "hold_seconds": ...
+            }
+        """
+        return {
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "hold_seconds": round(self.hold_time,3),
+        }
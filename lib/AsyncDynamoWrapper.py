@@ -0,0 +1,557 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+import asyncio
+import json
+import logging
+import time
+
+from lib.AsyncLogging import getPayloadLogger
+from lib.DynamoWrapper import DynamoWrapper
+from lib.HistoryCodec import HistoryCodec
+from lib.HistoryStore import HistoryStore
+from lib.S3BlockStore import S3BlockStore
+
+logger = logging.getLogger(__name__)
+payload_logger = getPayloadLogger(__name__)
+
+class AsyncDynamoWrapper(HistoryStore):
+    """
+    Async variant of DynamoWrapper built on an aiobotocore client,
+    the DynamoDb backend of HistoryStore.
+
+    With a S3BlockStore, the turns (and legacy histories) larger than
+    overflow_bytes once encoded are uploaded to S3 and the item only
+    keeps a pointer ({"bucket","key","bytes"} in the "overflow" attribute).
+    Instantiate your aiobotocore DynamoDb client and pass it in Ctor
+
+    Example:
+        >>> session = aiobotocore.session.get_session()
+        >>> async with session.create_client("dynamodb",endpoint_url=...) as client:
+        >>>     dynamo_wrapper = AsyncDynamoWrapper(client)
+        >>>     await dynamo_wrapper.getHistory(session_id,table_name)
+    """
+    dynamodb = None
+
+    def __init__(self, dynamodb, codec:HistoryCodec=None, block_store:S3BlockStore=None, overflow_bytes:int=300*1024):
+        """
+        Init the wrapper to communicate with DynamoDb
+
+        Args:
+            dynamodb: aiobotocore "dynamodb" client
+            codec (HistoryCodec): optional, encoding of the messages (json string by default)
+            block_store (S3BlockStore): optional, where the large values are offloaded
+            overflow_bytes (int): encoded values larger than this are offloaded
+                                  (DynamoDb items are limited to 400 KB)
+
+        """
+        self.dynamodb = dynamodb
+        self.codec = codec if codec != None else HistoryCodec()
+        self.block_store = block_store
+        self.overflow_bytes = overflow_bytes
+        self.deserializer = TypeDeserializer()
+        #table_name -> status of the last DescribeTable, and time of the last answer of DynamoDb
+        self.table_status = {}
+        self.last_response = 0.0
+        self.dynamodb.meta.events.register("after-call.dynamodb",self.responded)
+
+    async def getHistory(self,session_id:str,table_name:str) -> str:
+        """
+        Get the history from DynamoDb as json string
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the history table
+
+        Returns:
+            json_str  (str): history in json string format (String or compressed
+                             Binary attribute) or {"error":"message"}
+        """
+        try:
+            response = await self.dynamodb.get_item(
+                TableName=table_name,
+                Key={'session_id': {'S': session_id}})
+
+            if 'Item' in response:
+                payload_logger.debug("AsyncDynamoWrapper::getHistory -> item : %s",response['Item'],extra={"session_id": session_id})
+                if "overflow" in response['Item']:
+                    return HistoryCodec.decodeText(await self.getBlock(response['Item']['overflow']))
+                history = response['Item'].get("history",{})
+                if "B" in history:
+                    return HistoryCodec.decodeText(history["B"])
+                return history.get("S")
+            else:
+                logger.debug("AsyncDynamoWrapper::getHistory -> item not found",extra={"session_id": session_id})
+                return None
+
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getHistory -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+        except RuntimeError as e:
+            logger.error("AsyncDynamoWrapper::getHistory -> error : %s",e)
+            return {"error": str(e)}
+
+    async def putHistory(self,session_id:str,history:str,table_name:str) -> dict:
+        """
+        Put the history to DynamoDb as json string
+
+        Args:
+            session_id (str): the session id relate to the history
+            history (str): the history
+            table_name (str): the history table
+
+        Returns:
+            reponse  (dict): updated_attributes and message or {"error":"message"}
+        """
+        try:
+            attribute = await self.valueAttribute(self.codec.encodeText(history),table_name,session_id)
+            #Only one of history / overflow is set
+            name, other = ("overflow","history") if "M" in attribute else ("history","overflow")
+            response = await self.dynamodb.update_item(
+                TableName=table_name,
+                Key={'session_id': {'S': session_id}},
+                UpdateExpression=f"SET {name} = :val REMOVE {other}",
+                ExpressionAttributeValues={
+                    ':val': attribute,
+                },
+                ReturnValues="UPDATED_NEW"
+            )
+            attributes = {k: self.deserializer.deserialize(v) for k,v in response["Attributes"].items()}
+            payload_logger.debug("AsyncDynamoWrapper::putHistory -> updated_attributes : %s",attributes,extra={"session_id": session_id})
+            return {"message": "Item updated successfully!", "updated_attributes": attributes}
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::putHistory -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def getTurns(self,session_id:str,table_name:str,limit:int=None,after_turn:int=0) -> list:
+        """
+        Get the turns of a session from the per-turn history table
+        (session_id as hash key, turn as sort key, turns are numbered from 1)
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+            limit (int): optional, only read the last "limit" turns
+            after_turn (int): optional, only read the turns after this one
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first or {"error":"message"}
+        """
+        try:
+            query = {
+                "TableName": table_name,
+                "KeyConditionExpression": "session_id = :sid AND turn > :after",
+                "ExpressionAttributeValues": {':sid': {'S': session_id}, ':after': {'N': str(after_turn)}},
+                "ScanIndexForward": not limit,
+            }
+            turns = []
+            while True:
+                if limit:
+                    query["Limit"] = limit - len(turns)
+                response = await self.dynamodb.query(**query)
+                turns.extend(await self.decodeTurns(response["Items"]))
+                if "LastEvaluatedKey" not in response or (limit and len(turns) >= limit):
+                    break
+                query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+            if limit:
+                turns.reverse()
+            return turns
+
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getTurns -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+        except RuntimeError as e:
+            logger.error("AsyncDynamoWrapper::getTurns -> error : %s",e)
+            return {"error": str(e)}
+
+    async def getLastTurn(self,session_id:str,table_name:str) -> int:
+        """
+        Get the number of the last turn of a session, it is the version of
+        the history. Strongly consistent, only the key is read.
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+
+        Returns:
+            last_turn (int): the last turn, 0 if the session has no turn or {"error":"message"}
+        """
+        try:
+            response = await self.dynamodb.query(
+                TableName=table_name,
+                KeyConditionExpression="session_id = :sid AND turn > :zero",
+                ExpressionAttributeValues={':sid': {'S': session_id}, ':zero': {'N': '0'}},
+                ProjectionExpression="turn",
+                ScanIndexForward=False,
+                ConsistentRead=True,
+                Limit=1)
+            if len(response["Items"]) == 0:
+                return 0
+            return int(response["Items"][0]["turn"]["N"])
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getLastTurn -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def getSummary(self,session_id:str,table_name:str) -> dict:
+        """
+        Get the rolling summary of a session, stored next to
+        the turns in the item of turn 0
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+
+        Returns:
+            summary (dict): {"summary": "...", "summary_turn": N} (N is the last
+                            folded turn), None if there is no summary or {"error":"message"}
+        """
+        try:
+            response = await self.dynamodb.get_item(
+                TableName=table_name,
+                Key={'session_id': {'S': session_id}, 'turn': {'N': '0'}})
+            if 'Item' not in response:
+                return None
+            return {"summary": response['Item']['summary']['S'],
+                    "summary_turn": int(response['Item']['summary_turn']['N'])}
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getSummary -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def getSummaries(self,session_ids:list,table_name:str,max_attempts:int=5) -> dict:
+        """
+        Get the rolling summaries of several sessions with batch_get_item
+        (100 keys per call, the unprocessed keys are sent again with a backoff)
+
+        Args:
+            session_ids (list): the sessions
+            table_name (str): the per-turn history table
+            max_attempts (int): maximum number of calls per group of 100 keys
+
+        Returns:
+            summaries (dict): {session_id: {"summary": "...", "summary_turn": N}} for
+                              the sessions having a summary, or {"error":"message"}
+        """
+        summaries = {}
+        session_ids = list(dict.fromkeys(session_ids))
+        try:
+            for i in range(0,len(session_ids),100):
+                request_items = {table_name: {
+                    "Keys": [{'session_id': {'S': session_id}, 'turn': {'N': '0'}} for session_id in session_ids[i:i+100]],
+                    "ProjectionExpression": "session_id, summary, summary_turn"}}
+                for attempt in range(max_attempts):
+                    response = await self.dynamodb.batch_get_item(RequestItems=request_items)
+                    for item in response["Responses"].get(table_name,[]):
+                        if "summary" in item:
+                            summaries[item['session_id']['S']] = {"summary": item['summary']['S'],
+                                                                  "summary_turn": int(item['summary_turn']['N'])}
+                    request_items = response.get("UnprocessedKeys")
+                    if not request_items:
+                        break
+                    await asyncio.sleep(0.05 * 2 ** attempt)
+                else:
+                    raise RuntimeError(f"{len(request_items[table_name]['Keys'])} keys unprocessed")
+            return summaries
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getSummaries -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+        except RuntimeError as e:
+            logger.error("AsyncDynamoWrapper::getSummaries -> error : %s",e)
+            return {"error": str(e)}
+
+    async def putSummary(self,session_id:str,summary:str,summary_turn:int,table_name:str) -> dict:
+        """
+        Put the rolling summary of a session in the item of turn 0
+
+        Args:
+            session_id (str): the session id relate to the history
+            summary (str): the summary
+            summary_turn (int): the last turn folded in the summary
+            table_name (str): the per-turn history table
+
+        Returns:
+            reponse  (dict): message or {"error":"message"}
+        """
+        try:
+            await self.dynamodb.put_item(
+                TableName=table_name,
+                Item={'session_id': {'S': session_id},
+                      'turn': {'N': '0'},
+                      'summary': {'S': summary},
+                      'summary_turn': {'N': str(summary_turn)}})
+            return {"message": "Summary saved successfully!"}
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::putSummary -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def getCachedResponse(self,cache_key:str,table_name:str) -> dict:
+        """
+        Get a cached Gemini reply
+
+        Args:
+            cache_key (str): the key of the request
+            table_name (str): the response cache table (cache_key hash key)
+
+        Returns:
+            item (dict): {"response": "...", "expires_at": N}, None if not found or {"error":"message"}
+        """
+        try:
+            response = await self.dynamodb.get_item(
+                TableName=table_name,
+                Key={'cache_key': {'S': cache_key}})
+            if 'Item' not in response:
+                return None
+            return {"response": response['Item']['response']['S'],
+                    "expires_at": int(response['Item']['expires_at']['N'])}
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::getCachedResponse -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def putCachedResponse(self,cache_key:str,response:str,expires_at:int,table_name:str,if_absent:bool=False) -> dict:
+        """
+        Put a Gemini reply in the response cache table
+
+        Args:
+            cache_key (str): the key of the request
+            response (str): the reply
+            expires_at (int): expiration as epoch seconds (TTL attribute of the table)
+            table_name (str): the response cache table
+            if_absent (bool): only write if there is no item or it expired (the TTL deletion is lazy)
+
+        Returns:
+            reponse  (dict): message, {"error":"message"} or
+                             {"error":"message","conflict":True} if if_absent and the item exists
+        """
+        try:
+            condition = {}
+            if if_absent:
+                condition = {"ConditionExpression": "attribute_not_exists(cache_key) OR expires_at < :now",
+                             "ExpressionAttributeValues": {':now': {'N': str(int(time.time()))}}}
+            await self.dynamodb.put_item(
+                TableName=table_name,
+                Item={'cache_key': {'S': cache_key},
+                      'response': {'S': response},
+                      'expires_at': {'N': str(expires_at)}},
+                **condition)
+            return {"message": "Response cached successfully!"}
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return {"error": "Response already exists", "conflict": True}
+            logger.error("AsyncDynamoWrapper::putCachedResponse -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def turnItem(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        """
+        Build the DynamoDb item of a turn, the messages are offloaded to S3
+        if they are too large
+
+        Args:
+            session_id (str): the session id relate to the history
+            turn (int): the turn number
+            messages (list): the messages of the turn
+            table_name (str): the per-turn history table (part of the S3 key)
+
+        Returns:
+            item (dict): item in DynamoDb json format
+        """
+        attribute = await self.valueAttribute(self.codec.encode(messages),table_name,session_id,str(turn))
+        return {'session_id': {'S': session_id},
+                'turn': {'N': str(turn)},
+                'overflow' if "M" in attribute else 'messages': attribute}
+
+    async def valueAttribute(self,value,*parts:str) -> dict:
+        """
+        Build the attribute of an encoded value: String (json), Binary (compressed)
+        or Map (pointer to the S3 block if the value is larger than overflow_bytes)
+
+        Args:
+            value (str|bytes): value returned by the codec
+            parts (str): parts of the S3 key (table, session, turn)
+        """
+        if self.block_store != None and len(value) > self.overflow_bytes//4:
+            data = HistoryCodec.toBytes(value)
+            if len(data) > self.overflow_bytes:
+                pointer = await self.block_store.put(self.block_store.blockKey(data,*parts),data)
+                return {'M': {'bucket': {'S': pointer["bucket"]},
+                              'key': {'S': pointer["key"]},
+                              'bytes': {'N': str(pointer["bytes"])}}}
+        return {'S': value} if isinstance(value,str) else {'B': value}
+
+    async def getBlock(self,attribute:dict) -> bytes:
+        """
+        Download the block of a pointer attribute
+        """
+        if self.block_store == None:
+            raise RuntimeError("value offloaded to S3 but no block store is configured")
+        return await self.block_store.get({key: value["S"] for key, value in attribute["M"].items() if "S" in value})
+
+    async def decodeTurns(self,items:list) -> list:
+        """
+        Decode the messages of turn items, the offloaded ones are downloaded in parallel
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] in the order of the items
+        """
+        blocks = iter(await asyncio.gather(*(self.getBlock(item["overflow"]) for item in items if "overflow" in item)))
+        turns = []
+        for item in items:
+            value = next(blocks) if "overflow" in item else item["messages"].get("S",item["messages"].get("B"))
+            turns.append({"turn": int(item["turn"]["N"]), "messages": self.codec.decode(value)})
+        return turns
+
+    async def putTurn(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        """
+        Append one turn to the per-turn history table, only the new messages
+        of the turn are written. The put is conditional, it fails if another
+        node already wrote this turn number (see HistoryStore.appendTurn)
+
+        Args:
+            session_id (str): the session id relate to the history
+            turn (int): the turn number
+            messages (list): the messages of the turn [{"role": "user", "parts": "..."},...]
+            table_name (str): the per-turn history table
+
+        Returns:
+            reponse  (dict): message and last_turn, {"error":"message"} or
+                             {"error":"message","conflict":True} if the turn already exists
+        """
+        try:
+            await self.dynamodb.put_item(
+                TableName=table_name,
+                Item=await self.turnItem(session_id,turn,messages,table_name),
+                ConditionExpression="attribute_not_exists(turn)")
+            return {"message": "Turn saved successfully!", "last_turn": turn}
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info("AsyncDynamoWrapper::putTurn -> turn %s already exists",turn,extra={"session_id": session_id})
+                return {"error": "Turn already exists", "conflict": True}
+            logger.error("AsyncDynamoWrapper::putTurn -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    async def putTurns(self,session_id:str,turns:list,table_name:str,first_turn:int=1) -> dict:
+        """
+        Append turns to the per-turn history table with batch_write_item
+
+        Args:
+            session_id (str): the session id relate to the history
+            turns (list): list of turns, each turn is a list of messages
+            table_name (str): the per-turn history table
+            first_turn (int): number of the first turn to write
+
+        Returns:
+            reponse  (dict): message and last_turn or {"error":"message"}
+        """
+        try:
+            items = await asyncio.gather(*(self.turnItem(session_id,turn,messages,table_name)
+                                           for turn, messages in enumerate(turns, start=first_turn)))
+            requests = [{'PutRequest': {'Item': item}} for item in items]
+            #batch_write_item accepts 25 requests at most
+            for i in range(0, len(requests), 25):
+                await self.batchWrite({table_name: requests[i:i+25]})
+            return {"message": "Turns saved successfully!", "last_turn": first_turn+len(turns)-1}
+        except ClientError as e:
+            logger.error("AsyncDynamoWrapper::putTurns -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+        except RuntimeError as e:
+            logger.error("AsyncDynamoWrapper::putTurns -> error : %s",e)
+            return {"error": str(e)}
+
+    async def batchWrite(self,request_items:dict,max_attempts:int=5) -> None:
+        """
+        batch_write_item, the unprocessed items are sent again with a backoff
+
+        Args:
+            request_items (dict): {table_name: [{"PutRequest": ...},...]}
+            max_attempts (int): maximum number of calls
+
+        Raises:
+            ClientError: if the call fails
+            RuntimeError: if items are still unprocessed after max_attempts
+        """
+        for attempt in range(max_attempts):
+            response = await self.dynamodb.batch_write_item(RequestItems=request_items)
+            request_items = response.get("UnprocessedItems")
+            if not request_items:
+                return
+            await asyncio.sleep(0.05 * 2 ** attempt)
+        raise RuntimeError(f"{sum(len(v) for v in request_items.values())} items unprocessed")
+
+    async def migrateHistory(self,session_id:str,legacy_table_name:str,table_name:str) -> list:
+        """
+        Copy a single-blob history (legacy table) to the per-turn history table.
+        The legacy item is left untouched.
+
+        Args:
+            session_id (str): the session id relate to the history
+            legacy_table_name (str): the single-blob history table
+            table_name (str): the per-turn history table
+
+        Returns:
+            turns (list): the migrated turns, [] if there is nothing to migrate
+                          or {"error":"message"}
+        """
+        json_str = await self.getHistory(session_id,legacy_table_name)
+        if not isinstance(json_str,str):
+            return json_str if json_str != None else []
+
+        turns = DynamoWrapper.splitTurns(json.loads(json_str))
+        result = await self.putTurns(session_id,turns,table_name)
+        if result.get("error"):
+            return result
+        logger.info("AsyncDynamoWrapper::migrateHistory -> %d turns migrated",len(turns),extra={"session_id": session_id})
+        return [{"turn": turn, "messages": messages} for turn, messages in enumerate(turns, start=1)]
+
+    async def getTableStatus(self,table_name:str) -> dict:
+        """
+        Helper route to verify table history
+
+        Returns:
+            json: Format
+            {
+                    "status": "..."
+            }
+
+        """
+        try:
+            response = await self.dynamodb.describe_table(TableName=table_name)
+            return {"status": response["Table"]["TableStatus"]}
+        except self.dynamodb.exceptions.ResourceNotFoundException:
+            logger.warning("AsyncDynamoWrapper::getTableStatus -> resource not found for %s",table_name)
+        return {"error": "Table does not exist"}
+
+    async def checkTable(self,table_name:str,max_age:float=30) -> dict:
+        """
+        Readiness check of a table without a DescribeTable per probe: the
+        table status is cached and DynamoDb is known reachable while any
+        call (reads and writes of the requests included) got an answer
+        in the last max_age seconds, a DescribeTable is only sent otherwise
+
+        Returns:
+            json: {"status": "..."} or {"error": "message"}
+        """
+        status = self.table_status.get(table_name)
+        if status != None and time.monotonic() - self.last_response < max_age:
+            return status
+        try:
+            status = await self.getTableStatus(table_name)
+        except Exception as e:
+            logger.error("AsyncDynamoWrapper::checkTable -> error : %s",e)
+            return {"error": str(e)}
+        if status.get("status") == "ACTIVE":
+            self.table_status[table_name] = status
+        else:
+            self.table_status.pop(table_name,None)
+        return status
+
+    def responded(self,http_response=None,**kwargs) -> None:
+        """
+        after-call hook of the client, record that DynamoDb answered
+        (errors of the requests themselves included, not the 5xx)
+        """
+        if http_response != None and http_response.status_code < 500:
+            self.last_response = time.monotonic()
@@ -0,0 +1,101 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import logging
+
+from lib.CallPolicy import CallPolicy
+from lib.GeminiKeyPool import GeminiKeyPool
+from lib.GeminiChat import GeminiChat
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGeminiChat(GeminiChat):
+    """
+    Async variant of GeminiChat, returned by AsyncGeminiWrapper.newChat
+
+    With a CallPolicy, each attempt (retry or hedge) runs on its own copy
+    of the chat session and the session of the attempt that answered is
+    kept, so a failed or cancelled attempt never alters the history.
+    The SDK retries are disabled, the policy owns them.
+
+    With a GeminiKeyPool, each attempt runs on the model bound to the key
+    chosen by the pool (another key after a quota error).
+
+    Example:
+
+        >>> chat = gwrapper.newChat(history)
+        >>> response = await chat.chat("Hello")
+    """
+
+    def __init__(self,chat_session,call_policy:CallPolicy=None,stream_timeout:float=300,key_pool:GeminiKeyPool=None):
+        """
+        Ctor
+
+        Args:
+            chat_session (ChatSession): session started on a shared model
+            call_policy (CallPolicy): optional, deadline, retries, hedging and circuit breaker
+                                      of the calls (for a stream, until the first chunk)
+            stream_timeout (float): deadline of a whole stream in seconds, with a call_policy
+            key_pool (GeminiKeyPool): optional, API keys the attempts are spread on
+        """
+        super().__init__(chat_session)
+        self.call_policy = call_policy
+        self.stream_timeout = stream_timeout
+        self.key_pool = key_pool
+
+    async def chat(self,prompt:str,stream:bool=False):
+        """
+        Send a prompt to the chat session
+
+        Args:
+            prompt(str): user prompt to send
+            stream(bool): if True, the response can be iterated with
+                          "async for" as soon as Gemini produces it
+
+        Return:
+            response(AsyncGenerateContentResponse): Gemini response or None
+
+        """
+        response = None
+        try:
+
+            if self.call_policy == None and self.key_pool == None:
+                response = await self.chat_session.send_message_async(prompt, stream=stream)
+            elif self.call_policy == None:
+                self.chat_session, response = await self.attempt(prompt,stream)()
+            else:
+                self.chat_session, response = await self.call_policy.run(self.attempt(prompt,stream))
+
+        except Exception as e:
+            logger.error("AsyncGeminiChat::chat -> exception : %s",e)
+            self.error = e
+
+        return response
+
+    def attempt(self,prompt:str,stream:bool):
+        """
+        Build the attempts of a call, each one on a copy of the chat session
+
+        Return:
+            attempt: function returning the awaitable of one attempt,
+                     resolving to (chat_session, response)
+        """
+        model = self.chat_session.model
+        history = self.chat_session.history
+        request_options = None
+        if self.call_policy != None:
+            request_options = {"retry": None,
+                               "timeout": self.stream_timeout if stream else (self.call_policy.timeout or None)}
+
+        async def send(model):
+            chat_session = model.start_chat(history=history)
+            response = await chat_session.send_message_async(prompt,stream=stream,request_options=request_options)
+            return chat_session, response
+
+        if self.key_pool == None:
+            return lambda: send(model)
+        return lambda: self.key_pool.run(lambda key: send(self.key_pool.model(key,model)))
@@ -0,0 +1,252 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import google.ai.generativelanguage as glm
+from google.ai.generativelanguage_v1beta.services.generative_service.transports import GenerativeServiceGrpcAsyncIOTransport
+import functools
+import grpc
+import logging
+
+from lib.AsyncGeminiChat import AsyncGeminiChat
+from lib.CallPolicy import CallPolicy
+from lib.GeminiKeyPool import GeminiKeyPool
+from lib.GeminiWrapper import GeminiWrapper
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGeminiWrapper(GeminiWrapper):
+    """
+    Async variant of GeminiWrapper, chat calls run on the event loop
+    through the SDK's send_message_async.
+
+    The async client uses the grpc_asyncio transport (the rest transport
+    of the SDK is blocking), it holds the grpc channel so create the wrapper
+    once per process and use newChat to get a chat session per request.
+    The calls are multiplexed on the HTTP/2 connection of the channel, with
+    keepalive the connection is pinged while calls are running so a dead
+    connection is detected before the call deadline.
+
+    With a CallPolicy the calls get a deadline, retries with backoff,
+    optional hedging and a circuit breaker (see CallPolicy), the chat
+    sessions share the policy.
+
+    With a GeminiKeyPool the calls are spread on several API keys, each
+    one with its own client (see GeminiKeyPool), async_client is then the
+    client of the first key.
+
+    Example:
+
+        >>> gwrapper = AsyncGeminiWrapper("Gemini_Api_Key")
+        >>> chat = gwrapper.newChat(history)
+        >>> response = await chat.chat("Hello")
+    """
+
+    def __init__(self,API_KEY,model_name="gemini-2.0-flash",async_client=None,generation_config:dict=None,api_endpoint:str=None,
+                 call_policy:CallPolicy=None,stream_timeout:float=300,keepalive:float=0,key_pool:GeminiKeyPool=None):
+        """
+        Ctor
+
+        Args:
+            API_KEY (str): Gemini key api
+            model_name (str): Model name to use, default is "gemini-2.0-flash"
+            async_client (GenerativeServiceAsyncClient): shared async client,
+                                                         a new one is created if None
+            generation_config (dict): optional generation config of the models
+            api_endpoint (str): optional grpc endpoint of the API, "http://host:port"
+                                for a plaintext local stand-in (see bench/FakeGemini.py)
+            call_policy (CallPolicy): optional, deadline, retries, hedging and circuit breaker of the calls
+            stream_timeout (float): deadline of a whole stream in seconds, with a call_policy
+            keepalive (float): interval of the keepalive pings of the channel in seconds, 0 to disable
+            key_pool (GeminiKeyPool): optional, API keys and their clients the calls are spread on
+        """
+        super().__init__(API_KEY,model_name,generation_config)
+        self.call_policy = call_policy
+        self.stream_timeout = stream_timeout
+        self.key_pool = key_pool
+        self.async_client = async_client
+        if self.async_client == None and self.key_pool != None:
+            self.async_client = self.key_pool.clients()[0]
+        if self.async_client == None:
+            self.async_client = AsyncGeminiWrapper.createAsyncClient(API_KEY,api_endpoint,keepalive)
+
+    @staticmethod
+    def createAsyncClient(API_KEY,api_endpoint:str=None,keepalive:float=0):
+        """
+        Create an async Gemini client on the grpc_asyncio transport
+
+        Must be called from a running event loop.
+
+        Args:
+            API_KEY (str): Gemini key api
+            api_endpoint (str): optional endpoint, "http://host:port" opens a plaintext channel
+            keepalive (float): interval of the keepalive pings in seconds, 0 to disable
+
+        Return:
+            client (GenerativeServiceAsyncClient): async client
+        """
+        options = AsyncGeminiWrapper.channelOptions(keepalive)
+        if api_endpoint and api_endpoint.startswith("http://"):
+            #Local stand-in without TLS nor credentials
+            channel = grpc.aio.insecure_channel(api_endpoint[len("http://"):],options=options)
+            return glm.GenerativeServiceAsyncClient(
+                transport=GenerativeServiceGrpcAsyncIOTransport(channel=channel))
+
+        def createChannel(host,**kwargs):
+            #Same channel as the SDK (credentials from the API key, TLS) with our options
+            kwargs["options"] = options
+            return GenerativeServiceGrpcAsyncIOTransport.create_channel(host,**kwargs)
+
+        client_options = {"api_key": API_KEY}
+        if api_endpoint:
+            client_options["api_endpoint"] = api_endpoint
+        return glm.GenerativeServiceAsyncClient(
+            transport=functools.partial(GenerativeServiceGrpcAsyncIOTransport,channel=createChannel),
+            client_options=client_options)
+
+    @staticmethod
+    def channelOptions(keepalive:float=0) -> list:
+        """
+        Options of the grpc channel: no message size limit (as the SDK) and
+        keepalive pings every keepalive seconds while calls are running
+        (not on an idle connection, the servers refuse too frequent pings)
+        """
+        options = [("grpc.max_send_message_length", -1),
+                   ("grpc.max_receive_message_length", -1)]
+        if keepalive:
+            options += [("grpc.keepalive_time_ms", int(keepalive*1000)),
+                        ("grpc.keepalive_timeout_ms", 10000),
+                        ("grpc.keepalive_permit_without_calls", 0),
+                        ("grpc.http2.max_pings_without_data", 0)]
+        return options
+
+    def getModel(self,sys_instruction=None):
+        """
+        Return the cached model for a system instruction,
+        bound to the async client
+
+        Args:
+            sys_instruction (str): optional system instruction
+
+        Return:
+            model (GenerativeModel): cached model
+        """
+        model = super().getModel(sys_instruction)
+        #Make the model use the async client instead of the default one
+        model._async_client = self.async_client
+        return model
+
+    def newChat(self,user_history_prompt:list=None):
+        """
+        Start a chat session on the cached model, with history if provided
+
+        Args:
+            user_history_prompt(list(dict)): History of the chat
+
+        Return
+            chat (AsyncGeminiChat): the chat session or None on error
+        """
+        try:
+            return AsyncGeminiChat(self.startChatSession(user_history_prompt),self.call_policy,self.stream_timeout,
+                                   self.key_pool)
+        except Exception as e:
+            logger.error("AsyncGeminiWrapper::newChat -> exception : %s",e)
+            return None
+
+    async def generateContentAsync(self,prompt:str,sys_instruction=None) -> str:
+        """
+        Send a single prompt to Gemini, outside of any chat session
+
+        Args:
+            prompt (str): the prompt
+            sys_instruction (str): optional system instruction
+
+        Return:
+            text (str): the answer or None
+        """
+        try:
+            model = self.getModel(sys_instruction)
+            response = await self.run(self.onKey(model,lambda model: model.generate_content_async(prompt,request_options=self.requestOptions())))
+            return response.text
+        except Exception as e:
+            logger.error("AsyncGeminiWrapper::generateContentAsync -> exception : %s",e)
+            return None
+
+    async def countTokens(self,messages:list) -> int:
+        """
+        Count the tokens of messages with the model tokenizer
+
+        Args:
+            messages (list): [{"role": "user", "parts": "..."},...]
+
+        Return:
+            total_tokens (int): number of tokens or None
+        """
+        try:
+            model = self.getModel()
+            response = await self.run(self.onKey(model,lambda model: model.count_tokens_async(messages,request_options=self.requestOptions())))
+            return response.total_tokens
+        except Exception as e:
+            logger.warning("AsyncGeminiWrapper::countTokens -> exception : %s",e)
+            return None
+
+    async def run(self,call):
+        """
+        Run a call with the policy if any
+
+        Args:
+            call: function returning the awaitable of the call
+        """
+        if self.call_policy == None:
+            return await call()
+        return await self.call_policy.run(call)
+
+    def onKey(self,model,call):
+        """
+        Bind a call to a key of the pool if any
+
+        Args:
+            model (GenerativeModel): the model of the call
+            call: function called with the model, returning the awaitable of the call
+
+        Returns:
+            call: function returning the awaitable of the call on the model bound to the chosen key
+        """
+        if self.key_pool == None:
+            return lambda: call(model)
+        return lambda: self.key_pool.run(lambda key: call(self.key_pool.model(key,model)))
+
+    def requestOptions(self) -> dict:
+        """
+        Request options of a unary call: no SDK retry and the policy deadline,
+        the SDK defaults without a policy
+        """
+        if self.call_policy == None:
+            return None
+        return {"retry": None, "timeout": self.call_policy.timeout or None}
+
+    async def chat(self,prompt:str,stream:bool=False):
+        """
+        Send a prompt to current chat session
+
+        Args:
+            prompt(str): user prompt to send
+            stream(bool): if True, the response can be iterated with
+                          "async for" as soon as Gemini produces it
+
+        Return:
+            response(AsyncGenerateContentResponse): Gemini response
+
+        """
+        response = None
+        try:
+
+            response = await self.chat_session.send_message_async(prompt, stream=stream)
+
+        except Exception as e:
+            logger.error("AsyncGeminiWrapper::chat -> exception : %s",e)
+
+        return response
@@ -0,0 +1,157 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from logging.handlers import QueueHandler, QueueListener
+import json
+import logging
+import queue
+import random
+import sys
+import time
+
+
+#Prefix of the loggers used for payload dumps (prompts, replies, histories)
+PAYLOAD_LOGGER = "payload"
+
+#Attributes of a LogRecord, the other ones come from "extra" and are written as fields
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("",0,"",0,"",None,None))) | {"message", "taskName"}
+
+
+def getPayloadLogger(name:str) -> logging.Logger:
+    """
+    Logger of the payload dumps of a module, disabled unless setupLogging(payloads=True).
+    The level check is done before the message is built, a disabled dump costs nothing.
+
+    Example:
+        >>> payload_logger = getPayloadLogger(__name__)
+        >>> payload_logger.debug("history : %s",history)
+    """
+    return logging.getLogger(f"{PAYLOAD_LOGGER}.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as a json line:
+    {"time": ..., "level": ..., "logger": ..., "message": ..., <extra fields>}
+    """
+
+    def format(self,record:logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S",time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry,default=str)
+
+
+class TruncateFilter(logging.Filter):
+    """
+    Build the message of a record and cut it to max_length characters
+    """
+
+    def __init__(self,max_length:int=1000):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self,record:logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if self.max_length and len(message) > self.max_length:
+            message = message[:self.max_length] + f"... ({len(message)} chars)"
+        record.msg = message
+        record.args = None
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keep a ratio of the records below WARNING, warnings and errors are always kept
+    """
+
+    def __init__(self,rate:float=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self,record:logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DropQueueHandler(QueueHandler):
+    """
+    QueueHandler with a bounded queue, records are dropped (and counted)
+    when the queue is full instead of blocking the request
+    """
+
+    def __init__(self,log_queue:queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self,record:logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setupLogging(level:str="INFO",payloads:bool=False,max_length:int=1000,sample_rate:float=1.0,
+                 json_format:bool=True,max_queue:int=10000,app_loggers:tuple=("app","lib")) -> QueueListener:
+    """
+    Configure the root logger: the records are filtered and truncated
+    on the calling thread, then formatted and written to stdout by a
+    listener thread so the I/O stays off the event loop.
+
+    Args:
+        level (str): level of the application logs (DEBUG, INFO, WARNING, ERROR), INFO if unknown
+        payloads (bool): enable the payload dumps (see getPayloadLogger)
+        max_length (int): maximum length of a message, 0 for no limit
+        sample_rate (float): ratio of the records below WARNING kept, between 0 and 1
+        json_format (bool): write json lines, plain text otherwise
+        max_queue (int): maximum number of records waiting to be written
+        app_loggers (tuple): loggers set to "level", the other libraries (botocore, grpc, ...)
+                             only log warnings and errors
+
+    Returns:
+        listener (QueueListener): the started listener, stop it on shutdown to flush the queue
+
+    Example:
+        >>> listener = setupLogging("INFO")
+        >>> logging.getLogger(__name__).info("session id : %s",session_id)
+        >>> listener.stop()
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else
+                                logging.Formatter("%(asctime)s %(levelname)s %(name)s : %(message)s"))
+
+    queue_handler = DropQueueHandler(queue.Queue(maxsize=max_queue))
+    queue_handler.addFilter(SampleFilter(sample_rate))
+    queue_handler.addFilter(TruncateFilter(max_length))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler,DropQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    level_name = str(level).upper()
+    level = logging.getLevelName(level_name)
+    #getLevelName returns "Level X" for an unknown name
+    unknown_level = not isinstance(level,int)
+    if unknown_level:
+        level = logging.INFO
+    root.setLevel(max(level,logging.WARNING))
+    for name in app_loggers:
+        logging.getLogger(name).setLevel(level)
+
+    #Payload dumps are logged at DEBUG level
+    logging.getLogger(PAYLOAD_LOGGER).setLevel(logging.DEBUG if payloads else logging.CRITICAL+1)
+
+    listener = QueueListener(queue_handler.queue,stream_handler,respect_handler_level=True)
+    listener.start()
+    if unknown_level:
+        logging.getLogger(__name__).warning("setupLogging:: unknown level %s, using INFO",level_name)
+    return listener
@@ -0,0 +1,195 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import deque
+from google.api_core import exceptions
+import asyncio
+import logging
+import random
+import time
+
+from lib.CircuitBreaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class CallPolicy:
+    """
+    Deadline, retries, hedging and circuit breaker of the calls to an upstream.
+
+    Each attempt has a deadline of timeout seconds. Retryable errors
+    (unavailable, internal, deadline exceeded and the timeouts) are retried
+    up to max_attempts with an exponential backoff and full jitter. Other
+    errors (invalid request, quota...) are raised at once.
+
+    With hedge=True, a second attempt is sent if the first one has not
+    answered after the p95 latency of the last calls (at least hedge_min_delay),
+    the first answer wins and the other attempt is cancelled. The attempts
+    must then be independent (e.g. one chat session per attempt).
+
+    Each attempt goes through the circuit breaker: while it is open the
+    call fails fast with CircuitOpenError.
+
+    Example:
+        >>> policy = CallPolicy(timeout=30,max_attempts=3,breaker=CircuitBreaker())
+        >>> response = await policy.run(lambda: model.generate_content_async(prompt))
+    """
+
+    RETRYABLE = (exceptions.ServiceUnavailable,
+                 exceptions.InternalServerError,
+                 exceptions.DeadlineExceeded,
+                 exceptions.Aborted,
+                 exceptions.Unknown,
+                 asyncio.TimeoutError)
+
+    def __init__(self,timeout:float=30,max_attempts:int=3,base_delay:float=0.2,max_delay:float=2.0,
+                 hedge:bool=False,hedge_min_delay:float=1.0,breaker:CircuitBreaker=None,window:int=200):
+        """
+        Ctor
+
+        Args:
+            timeout (float): deadline of an attempt in seconds, 0 for no deadline
+            max_attempts (int): maximum number of attempts of a call (1 for no retry)
+            base_delay (float): backoff before the first retry in seconds, doubled on each retry
+            max_delay (float): maximum backoff in seconds
+            hedge (bool): send a second attempt when the first one is slower than the p95
+            hedge_min_delay (float): minimum delay before the hedged attempt in seconds
+            breaker (CircuitBreaker): optional, circuit breaker of the upstream
+            window (int): number of latencies kept to compute the p95
+        """
+        self.timeout = timeout
+        self.max_attempts = max(1,max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def run(self,call):
+        """
+        Run a call with the policy
+
+        Args:
+            call: function returning the awaitable of one attempt, called for each attempt
+
+        Returns:
+            the result of the first successful attempt
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+            Exception: the error of the last attempt
+        """
+        self.calls += 1
+        for attempt in range(self.max_attempts):
+            if self.breaker != None:
+                self.breaker.check()
+            start = time.perf_counter()
+            try:
+                result = await self.attempt(call)
+            except self.RETRYABLE as e:
+                if isinstance(e,asyncio.TimeoutError):
+                    self.timeouts += 1
+                if self.breaker != None:
+                    self.breaker.failure()
+                if attempt+1 == self.max_attempts:
+                    self.failed += 1
+                    raise
+                self.retries += 1
+                delay = random.uniform(0,min(self.max_delay,self.base_delay * 2 ** attempt))
+                logger.warning("CallPolicy::run -> attempt %d failed (%s), retry in %.2f s",attempt+1,type(e).__name__,delay)
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                if self.breaker != None:
+                    self.breaker.abandon()
+                raise
+            except Exception:
+                #The upstream answered, the request itself is refused
+                if self.breaker != None:
+                    self.breaker.success()
+                self.failed += 1
+                raise
+            if self.breaker != None:
+                self.breaker.success()
+            self.latencies.append(time.perf_counter()-start)
+            return result
+
+    async def attempt(self,call):
+        """
+        One attempt with its deadline, hedged if enabled
+        """
+        if not self.hedge:
+            return await self.deadline(call)
+
+        tasks = [asyncio.ensure_future(self.deadline(call))]
+        try:
+            done, _ = await asyncio.wait(tasks,timeout=self.hedgeDelay())
+            if len(done) > 0:
+                return tasks[0].result()
+
+            self.hedged += 1
+            tasks.append(asyncio.ensure_future(self.deadline(call)))
+            pending = set(tasks)
+            error = None
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() == None:
+                        if task is tasks[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            #The slower attempt is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def deadline(self,call):
+        self.attempts += 1
+        if self.timeout:
+            return await asyncio.wait_for(call(),self.timeout)
+        return await call()
+
+    def hedgeDelay(self) -> float:
+        """
+        Delay before the hedged attempt: p95 of the last latencies, at least hedge_min_delay
+        """
+        if len(self.latencies) < 20:
+            return max(self.hedge_min_delay,self.timeout/2 if self.timeout else self.hedge_min_delay)
+        latencies = sorted(self.latencies)
+        return max(self.hedge_min_delay,latencies[int(len(latencies)*0.95)-1])
+
+    def stats(self) -> dict:
+        """
+        Call counters
+
+        Returns:
+            json: Format
+            {
+                "calls": ..., "attempts": ..., "retries": ..., "timeouts": ..., "failed": ...,
+                "hedged": ..., "hedge_wins": ..., "hedge_delay": ...
+            }
+        """
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay": round(self.hedgeDelay(),3),
+        }
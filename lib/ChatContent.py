@@ -7,12 +7,29 @@
 class ChatContent:
     """
     This class serve to convert Gemini chat parts to List of object
+
+    A compact record (no instance dict), one per stored message.
+
+    Example:
+        >>> ChatContent.fromContent(content).toDict()
+        {"role": "model", "parts": "..."}
 """
-    role = None
-    parts = None
+    __slots__ = ("role","parts")
 
     def __init__(self,role:str,parts:str):
         self.role = role
         self.parts = parts
 
-    
\ No newline at end of file
+    @classmethod
+    def fromContent(cls,content):
+        """
+        Convert a Content of the SDK, the text is read from the first part
+        without converting the protobuf message to a dict
+        """
+        return cls(content.role,content.parts[0].text)
+
+    def toDict(self) -> dict:
+        """
+        Stored form of the message: {"role": "...", "parts": "..."}
+        """
+        return {"role": self.role, "parts": self.parts}
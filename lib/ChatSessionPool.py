@@ -0,0 +1,188 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import OrderedDict
+import time
+
+
+class ChatSessionPool:
+    """
+    Bounded LRU pool of the live chat histories (protobuf contents) of the
+    sessions, so the next turn of a session starts its chat without
+    converting the whole history again.
+
+    An entry is tagged with the context it was built from: the summary
+    turn and the (turn, number of messages) of each turn of the window.
+    It is only reused when the context of the next turn is the same, or
+    the same window with its oldest turns dropped (sliding window).
+    Any other change (turns added by another node, new summary, failed or
+    merged write) misses and the chat is started from the stored history,
+    which stays the source of truth.
+
+    take removes the entry: a live history belongs to one request, it is
+    put back once the turn is saved.
+
+    Example:
+        >>> chat_pool = ChatSessionPool(max_entries=1000,ttl=600)
+        >>> contents = chat_pool.take(session_id,context)
+        >>> chat_pool.put(session_id,next_context,chat_history)
+    """
+
+    #Approximate memory used by a message besides its text
+    MESSAGE_OVERHEAD = 256
+
+    def __init__(self,max_entries:int=1024,max_bytes:int=64*1024*1024,ttl:float=600):
+        """
+        Ctor
+
+        Args:
+            max_entries (int): maximum number of pooled sessions
+            max_bytes (int): maximum size of the pooled messages (approximate)
+            ttl (float): time an unused entry is kept in seconds, 0 to keep it until evicted
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        #session_id -> {"context": {...}, "contents": [...], "size": int, "used": float}
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def context(window:list,summary:dict=None,size:int=0) -> dict:
+        """
+        Context of a chat built from a window of turns (see ContextPolicy.buildHistory)
+
+        Args:
+            window (list): [{"turn": 1, "messages": [...]},...]
+            summary (dict): optional {"summary": "...", "summary_turn": N}
+            size (int): size of the texts of the history
+
+        Returns:
+            json: Format {"summary_turn": N, "turns": ((turn, messages),...), "size": N}
+        """
+        return {
+            "summary_turn": summary["summary_turn"] if summary != None else 0,
+            "turns": tuple((turn["turn"],len(turn["messages"])) for turn in window),
+            "size": size,
+        }
+
+    @staticmethod
+    def nextContext(context:dict,turn:int,messages:list) -> dict:
+        """
+        Context of the chat once a turn was added
+
+        Args:
+            context (dict): context the chat was started with
+            turn (int): number of the added turn
+            messages (list): [{"role": "user", "parts": "..."},...] messages of the turn
+        """
+        return {
+            "summary_turn": context["summary_turn"],
+            "turns": context["turns"] + ((turn,len(messages)),),
+            "size": context["size"] + sum(len(message["parts"]) for message in messages),
+        }
+
+    def take(self,session_id:str,context:dict) -> list:
+        """
+        Take the live history of a session if it was built from the same context
+
+        Args:
+            session_id (str): the session id
+            context (dict): context of the chat to start (see context)
+
+        Returns:
+            contents (list): the protobuf contents of the history or None
+        """
+        entry = self.entries.pop(session_id,None)
+        if entry == None:
+            self.misses += 1
+            return None
+        self.size -= entry["size"]
+
+        if self.ttl and time.monotonic()-entry["used"] > self.ttl:
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        turns = entry["context"]["turns"]
+        count = len(context["turns"])
+        if (count == 0 or count > len(turns) or entry["context"]["summary_turn"] != context["summary_turn"]
+                or turns[-count:] != context["turns"]):
+            self.misses += 1
+            return None
+
+        #Drop the messages of the turns that left the window, after the summary messages
+        contents = entry["contents"]
+        prefix = len(contents) - sum(messages for _, messages in turns)
+        dropped = sum(messages for _, messages in turns[:-count])
+        self.hits += 1
+        if dropped:
+            return contents[:prefix] + contents[prefix+dropped:]
+        return contents
+
+    def put(self,session_id:str,context:dict,contents:list) -> None:
+        """
+        Pool the live history of a session
+
+        Args:
+            session_id (str): the session id
+            context (dict): context of the history (see nextContext)
+            contents (list): the protobuf contents of the history
+        """
+        self.invalidate(session_id)
+        size = context["size"] + self.MESSAGE_OVERHEAD*len(contents)
+        if size > self.max_bytes:
+            return
+        self.entries[session_id] = {"context": context, "contents": list(contents), "size": size, "used": time.monotonic()}
+        self.size += size
+        self.evict()
+
+    def invalidate(self,session_id:str) -> None:
+        """
+        Remove the live history of a session
+        """
+        entry = self.entries.pop(session_id,None)
+        if entry != None:
+            self.size -= entry["size"]
+
+    def evict(self) -> None:
+        """
+        Remove the expired entries then the least recently used ones above the limits
+        """
+        now = time.monotonic()
+        while len(self.entries) > 0:
+            session_id, entry = next(iter(self.entries.items()))
+            if self.ttl and now-entry["used"] > self.ttl:
+                self.expired += 1
+            elif len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.evictions += 1
+            else:
+                break
+            del self.entries[session_id]
+            self.size -= entry["size"]
+
+    def stats(self) -> dict:
+        """
+        Pool counters
+
+        Returns:
+            json: Format
+            {
+                "entries": ..., "bytes": ..., "hits": ..., "misses": ..., "evictions": ..., "expired": ...
+            }
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
@@ -0,0 +1,146 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import deque
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream while its circuit is open,
+    retry_after is the time left before a new call is tried (seconds)
+    """
+
+    def __init__(self,retry_after:int):
+        super().__init__(f"circuit open, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is unhealthy.
+
+    closed: calls go through, the circuit opens when at least failure_threshold
+    of the last window calls failed and they are failure_ratio of them (a few
+    errors spread among many concurrent calls don't open it).
+    open: calls are refused (CircuitOpenError) during reset_timeout seconds.
+    half_open: one call is let through as a probe, its success closes the
+    circuit and its failure opens it again.
+
+    Example:
+        >>> breaker = CircuitBreaker(failure_threshold=5,reset_timeout=30)
+        >>> breaker.check()
+        >>> breaker.success() or breaker.failure()
+    """
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+    STATES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+    def __init__(self,failure_threshold:int=5,failure_ratio:float=0.5,reset_timeout:float=30,window:int=20):
+        """
+        Ctor
+
+        Args:
+            failure_threshold (int): minimum number of failures opening the circuit, 0 to never open it
+            failure_ratio (float): minimum ratio of failed calls opening the circuit
+            reset_timeout (float): time the circuit stays open before a probe, in seconds
+            window (int): number of last calls considered
+        """
+        self.failure_threshold = failure_threshold
+        self.failure_ratio = failure_ratio
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        #Outcomes of the last calls, True for a failure
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def check(self) -> None:
+        """
+        Check that a call can be sent
+
+        Raises:
+            CircuitOpenError: if the circuit is open, or half open with a probe already running
+        """
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(max(1,math.ceil(remaining)))
+            self.state = self.HALF_OPEN
+            self.probing = False
+            logger.info("CircuitBreaker::check -> half open")
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                self.rejected += 1
+                raise CircuitOpenError(1)
+            self.probing = True
+
+    def success(self) -> None:
+        """
+        Record a call answered by the upstream
+        """
+        if self.state != self.CLOSED:
+            logger.info("CircuitBreaker::success -> closed")
+            self.outcomes.clear()
+            self.failures = 0
+        self.state = self.CLOSED
+        self.record(False)
+        self.probing = False
+
+    def failure(self) -> None:
+        """
+        Record a call failed because of the upstream (unavailable, timeout...)
+        """
+        self.record(True)
+        tripped = (self.failure_threshold and self.failures >= self.failure_threshold
+                   and self.failures >= self.failure_ratio*len(self.outcomes))
+        if self.state == self.HALF_OPEN or tripped:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning("CircuitBreaker::failure -> open after %d failures",self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+
+    def record(self,failed:bool) -> None:
+        if len(self.outcomes) == self.outcomes.maxlen:
+            self.failures -= self.outcomes[0]
+        self.outcomes.append(failed)
+        self.failures += failed
+
+    def abandon(self) -> None:
+        """
+        Record a call cancelled before its outcome, another probe can be sent
+        """
+        self.probing = False
+
+    def stats(self) -> dict:
+        """
+        Breaker state and counters, state is 0 (closed), 1 (half open) or 2 (open),
+        failures is the number of failures among the last calls
+
+        Returns:
+            json: Format
+            {
+                "state": ..., "failures": ..., "opened": ..., "rejected": ...
+            }
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,173 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+
+
+class ContextPolicy:
+    """
+    Choose the part of the history sent to Gemini.
+
+    The last turns are kept within a number of turns and a token budget.
+    Optionally, the turns left out of the window are folded in a rolling
+    summary sent before the window, so the context stays bounded however
+    old the session is.
+
+    Example:
+        >>> policy = ContextPolicy(max_turns=20,max_tokens=4000,summarize=True)
+        >>> window = await policy.select(turns,summary)
+        >>> history = policy.buildHistory(window,summary)
+        >>> if policy.needsSummary(window,summary,last_turn): ...
+    """
+
+    #Local estimator: average number of characters per token
+    CHARS_PER_TOKEN = 4
+    #Local estimator: tokens used by the role and framing of a message
+    MESSAGE_TOKENS = 4
+
+    def __init__(self,max_turns:int=0,max_tokens:int=0,summarize:bool=False,summary_every:int=4,token_counter=None):
+        """
+        Ctor
+
+        Args:
+            max_turns (int): maximum number of turns in the window, 0 for no limit
+            max_tokens (int): token budget of the context (summary + window), 0 for no limit
+            summarize (bool): fold the turns left out of the window in a summary
+            summary_every (int): number of turns left out of the window before updating the summary
+            token_counter: optional async function counting the tokens of a list of
+                           messages (e.g. AsyncGeminiWrapper.countTokens), the local
+                           estimator is used if None
+        """
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.summary_every = summary_every
+        self.token_counter = token_counter
+
+    @staticmethod
+    def estimateTokens(messages:list) -> int:
+        """
+        Estimate the number of tokens of messages without calling Gemini
+
+        Args:
+            messages (list): [{"role": "user", "parts": "..."},...]
+
+        Returns:
+            int: estimated number of tokens
+        """
+        return sum(len(message.get("parts") or "")//ContextPolicy.CHARS_PER_TOKEN+ContextPolicy.MESSAGE_TOKENS
+                   for message in messages)
+
+    async def countTokens(self,turn:dict) -> int:
+        """
+        Number of tokens of a turn, kept in the turn so it is counted once
+
+        Args:
+            turn (dict): {"turn": 1, "messages": [...]}
+
+        Returns:
+            int: number of tokens
+        """
+        if "tokens" not in turn:
+            tokens = None
+            if self.token_counter != None:
+                tokens = await self.token_counter(turn["messages"])
+            turn["tokens"] = tokens if tokens != None else ContextPolicy.estimateTokens(turn["messages"])
+        return turn["tokens"]
+
+    async def select(self,turns:list,summary:dict=None) -> list:
+        """
+        Select the last turns fitting in the window
+
+        Args:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first
+            summary (dict): optional {"summary": "...", "summary_turn": N},
+                            the turns already folded in the summary are left out
+
+        Returns:
+            window (list): the selected turns, oldest first
+        """
+        budget = self.max_tokens
+        if budget and summary != None:
+            budget -= ContextPolicy.estimateTokens(self.summaryMessages(summary))
+
+        window = []
+        used = 0
+        for turn in reversed(turns):
+            if summary != None and turn["turn"] <= summary["summary_turn"]:
+                break
+            if self.max_turns and len(window) >= self.max_turns:
+                break
+            tokens = await self.countTokens(turn)
+            if self.max_tokens and used+tokens > budget:
+                break
+            window.append(turn)
+            used += tokens
+
+        window.reverse()
+        return window
+
+    def buildHistory(self,window:list,summary:dict=None) -> list:
+        """
+        Build the history passed to the chat session
+
+        Args:
+            window (list): the selected turns
+            summary (dict): optional {"summary": "...", "summary_turn": N}
+
+        Returns:
+            history (list): [{"role": "user", "parts": "..."},...]
+        """
+        history = self.summaryMessages(summary) if summary != None else []
+        history.extend(message for turn in window for message in turn["messages"])
+        return history
+
+    def summaryMessages(self,summary:dict) -> list:
+        """
+        Messages holding the summary, sent before the window
+        """
+        return [
+            {"role": "user", "parts": f"Summary of our conversation so far:\n{summary['summary']}"},
+            {"role": "model", "parts": "Understood, I will keep this in mind."},
+        ]
+
+    def needsSummary(self,window:list,summary:dict,last_turn:int) -> bool:
+        """
+        Check if enough turns were left out of the window to update the summary
+
+        Args:
+            window (list): the selected turns
+            summary (dict): the current summary or None
+            last_turn (int): the last turn of the session
+
+        Returns:
+            bool: True if the summary should be updated
+        """
+        if not self.summarize:
+            return False
+        first_turn = window[0]["turn"] if len(window) > 0 else last_turn+1
+        summary_turn = summary["summary_turn"] if summary != None else 0
+        return first_turn-1-summary_turn >= self.summary_every
+
+    def summaryPrompt(self,summary:dict,turns:list) -> str:
+        """
+        Prompt asking Gemini to fold turns in the summary
+
+        Args:
+            summary (dict): the current summary or None
+            turns (list): the turns to fold
+
+        Returns:
+            str: the prompt
+        """
+        lines = ["Update the summary of a conversation between a user and an assistant.",
+                 "Keep the facts, names, decisions and open questions, be concise.",
+                 ""]
+        if summary != None:
+            lines += ["Current summary:", summary["summary"], ""]
+        lines.append("New messages:")
+        lines += [f"{message['role']}: {message['parts']}" for turn in turns for message in turn["messages"]]
+        lines += ["", "Updated summary:"]
+        return "\n".join(lines)
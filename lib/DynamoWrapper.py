@@ -4,7 +4,16 @@
   This project is licensed under the Educational and Non-Commercial Use License.
   See the LICENSE file for details.
 """
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+import json
+import logging
+
+from lib.AsyncLogging import getPayloadLogger
+from lib.HistoryCodec import HistoryCodec
+
+logger = logging.getLogger(__name__)
+payload_logger = getPayloadLogger(__name__)
 
 class DynamoWrapper():
     """
@@ -17,17 +26,27 @@ class DynamoWrapper():
     """
     dynamodb = None
 
-    def __init__(self, dynamodb):
+    def __init__(self, dynamodb, codec:HistoryCodec=None, s3=None):
         """
         Init the wrapper to communicaate with DynamoDb
 
         Args:
-            ressource (str): "dynamodb"
-            endpoint (str): DynamoDb endpoint
-            region_name (str): AWS region
+            dynamodb: boto3 "dynamodb" resource
+            codec (HistoryCodec): optional, encoding of the messages (json string by default)
+            s3: optional boto3 "s3" client, to read the values offloaded by AsyncDynamoWrapper
 
         """
         self.dynamodb = dynamodb
+        self.codec = codec if codec != None else HistoryCodec()
+        self.s3 = s3
+
+    def getBlock(self,pointer:dict) -> bytes:
+        """
+        Download a value offloaded to S3 ({"bucket","key","bytes"} pointer)
+        """
+        if self.s3 == None:
+            raise RuntimeError("value offloaded to S3 but no s3 client is configured")
+        return self.s3.get_object(Bucket=pointer["bucket"],Key=pointer["key"])["Body"].read()
 
     def getHistory(self,session_id:str,table_name:str) -> str:
         """
@@ -42,18 +61,20 @@ class DynamoWrapper():
         """
         try:
             table = self.dynamodb.Table(table_name)
-            print(f"DynamoWrapper::getHistory : {session_id}")
             response = table.get_item(Key={'session_id': session_id})
 
             if 'Item' in response:
-                print(f"getHistory::response['Item'] : {response['Item']}")
-                return response['Item'].get("history")
+                payload_logger.debug("DynamoWrapper::getHistory -> item : %s",response['Item'],extra={"session_id": session_id})
+                if "overflow" in response['Item']:
+                    return HistoryCodec.decodeText(self.getBlock(response['Item']["overflow"]))
+                history = response['Item'].get("history")
+                return HistoryCodec.decodeText(history) if history != None else None
             else:
-                print("DynamoWrapper::getHistoryItem:: item not found")
+                logger.debug("DynamoWrapper::getHistory -> item not found",extra={"session_id": session_id})
                 return None
 
         except ClientError as e:
-            print(f"DynamoWrapper::getHistory::Error : {e.response['Error']['Message']}")
+            logger.error("DynamoWrapper::getHistory -> error : %s",e.response['Error']['Message'])
             return {"error": e.response['Error']['Message']}
         
     def putHistory(self,session_id:str,history:str,table_name:str) -> dict:
@@ -75,17 +96,123 @@ class DynamoWrapper():
                 Key={'session_id': session_id},
                 UpdateExpression="SET history = :val",
                 ExpressionAttributeValues={
-                    ':val': history,
+                    ':val': self.codec.encodeText(history),
                 },
                 ReturnValues="UPDATED_NEW"
             )
-            print(f"DynamoWrapper::putHistoryItem -> Item updated successfully!")
-            print(f'DynamoWrapper::putHistoryItem -> updated_attributes : {response["Attributes"]}')
+            payload_logger.debug("DynamoWrapper::putHistory -> updated_attributes : %s",response["Attributes"],extra={"session_id": session_id})
             return {"message": "Item updated successfully!", "updated_attributes": response["Attributes"]}
         except ClientError as e:
-            print(f"DynamoWrapper::putHistoryItem::insertOrAppend -> Error : {e.response['Error']['Message']}")
+            logger.error("DynamoWrapper::putHistory -> error : %s",e.response['Error']['Message'])
             return {"error": e.response['Error']['Message']}
         
+    @staticmethod
+    def splitTurns(history:list) -> list:
+        """
+        Split a flat history in turns, a turn starts with a user message
+        and holds the model messages that follow it
+
+        Args:
+            history (list): [{"role": "user", "parts": "..."},{"role": "model", "parts": "..."},...]
+
+        Returns:
+            turns (list): [[{"role": "user",...},{"role": "model",...}],...]
+        """
+        turns = []
+        for message in history:
+            if message.get("role") == "user" or len(turns) == 0:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def getTurns(self,session_id:str,table_name:str,limit:int=None) -> list:
+        """
+        Get the turns of a session from the per-turn history table
+        (session_id as hash key, turn as sort key, turns are numbered from 1)
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+            limit (int): optional, only read the last "limit" turns
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first or {"error":"message"}
+        """
+        try:
+            table = self.dynamodb.Table(table_name)
+            query = {
+                "KeyConditionExpression": Key('session_id').eq(session_id) & Key('turn').gt(0),
+                "ScanIndexForward": not limit,
+            }
+            turns = []
+            while True:
+                if limit:
+                    query["Limit"] = limit - len(turns)
+                response = table.query(**query)
+                turns.extend({"turn": int(item["turn"]), "messages": self.codec.decode(self.getBlock(item["overflow"]) if "overflow" in item else item["messages"])}
+                             for item in response["Items"])
+                if "LastEvaluatedKey" not in response or (limit and len(turns) >= limit):
+                    break
+                query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+            if limit:
+                turns.reverse()
+            return turns
+
+        except ClientError as e:
+            logger.error("DynamoWrapper::getTurns -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    def putTurns(self,session_id:str,turns:list,table_name:str,first_turn:int=1) -> dict:
+        """
+        Append turns to the per-turn history table, only the given turns are written
+
+        Args:
+            session_id (str): the session id relate to the history
+            turns (list): list of turns, each turn is a list of messages
+            table_name (str): the per-turn history table
+            first_turn (int): number of the first turn to write
+
+        Returns:
+            reponse  (dict): message and last_turn or {"error":"message"}
+        """
+        try:
+            table = self.dynamodb.Table(table_name)
+            with table.batch_writer() as batch:
+                for turn, messages in enumerate(turns, start=first_turn):
+                    batch.put_item(Item={'session_id': session_id,
+                                         'turn': turn,
+                                         'messages': self.codec.encode(messages)})
+            return {"message": "Turns saved successfully!", "last_turn": first_turn+len(turns)-1}
+        except ClientError as e:
+            logger.error("DynamoWrapper::putTurns -> error : %s",e.response['Error']['Message'])
+            return {"error": e.response['Error']['Message']}
+
+    def migrateHistory(self,session_id:str,legacy_table_name:str,table_name:str) -> list:
+        """
+        Copy a single-blob history (legacy table) to the per-turn history table.
+        The legacy item is left untouched.
+
+        Args:
+            session_id (str): the session id relate to the history
+            legacy_table_name (str): the single-blob history table
+            table_name (str): the per-turn history table
+
+        Returns:
+            turns (list): the migrated turns, [] if there is nothing to migrate
+                          or {"error":"message"}
+        """
+        json_str = self.getHistory(session_id,legacy_table_name)
+        if not isinstance(json_str,str):
+            return json_str if json_str != None else []
+
+        turns = DynamoWrapper.splitTurns(json.loads(json_str))
+        result = self.putTurns(session_id,turns,table_name)
+        if result.get("error"):
+            return result
+        logger.info("DynamoWrapper::migrateHistory -> %d turns migrated",len(turns),extra={"session_id": session_id})
+        return [{"turn": turn, "messages": messages} for turn, messages in enumerate(turns, start=1)]
+
     def getTableStatus(self,table_name:str) -> dict:
         """
         Helper route to verify table history
@@ -101,5 +228,5 @@ class DynamoWrapper():
             table = self.dynamodb.Table(table_name)
             return {"status": table.table_status}
         except self.dynamodb.meta.client.exceptions.ResourceNotFoundException:
-            print(f"DynamoWrapper::getTableStatus -> Resource not found for {table_name}")
+            logger.warning("DynamoWrapper::getTableStatus -> resource not found for %s",table_name)
         return {"error": "Table does not exist"}
\ No newline at end of file
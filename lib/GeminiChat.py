@@ -0,0 +1,68 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiChat:
+    """
+    Lightweight chat session owned by a single request.
+
+    The configured client and the models live in GeminiWrapper and are
+    shared by the whole process, only the conversation is kept here.
+
+    Example:
+
+        >>> chat = gwrapper.newChat(history)
+        >>> response = chat.chat("Hello")
+        >>> chat.getChatHistory()
+    """
+
+    def __init__(self,chat_session):
+        """
+        Ctor
+
+        Args:
+            chat_session (ChatSession): session started on a shared model
+        """
+        self.chat_session = chat_session
+        #Exception of the last failed call, e.g. a quota error
+        self.error = None
+
+    def chat(self,prompt:str,stream:bool=False):
+        """
+        Send a prompt to the chat session
+
+        Args:
+            prompt(str): user prompt to send
+            stream(bool): if True, the response is yielded chunk by chunk
+                          as soon as Gemini produces it, default is False
+
+        Return:
+            response(GenerateContentResponse): Gemini response or None
+
+        """
+        response = None
+        try:
+
+            response = self.chat_session.send_message(prompt, stream=stream)
+
+        except Exception as e:
+            logger.error("GeminiChat::chat -> exception : %s",e)
+            self.error = e
+
+        return response
+
+    def getChatHistory(self):
+        """
+        Return the history of the chat session
+
+        Return:
+            List(Content):  chat session history
+        """
+        return self.chat_session.history
@@ -0,0 +1,264 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from google.api_core import exceptions
+import asyncio
+import copy
+import itertools
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class KeysExhausted(exceptions.ResourceExhausted):
+    """
+    Raised when no key of the pool can take a call: all of them are
+    cooling down after a quota error or used their rate (retry after retry_after seconds)
+    """
+
+    def __init__(self,retry_after:int):
+        super().__init__("No Gemini API key available")
+        self.retry_after = retry_after
+
+
+class GeminiKeyPool:
+    """
+    Pool of Gemini API keys, each one with its own async client (its own
+    channel and credentials, the global genai.configure is never switched).
+
+    Each key has a token bucket of rpm calls per minute (no limit if rpm is 0)
+    and a count of its calls in flight (for a stream, until its first chunk).
+    A call runs on the key chosen by the strategy among the keys with a
+    token: "least_loaded" (fewest calls in flight, then most tokens left)
+    or "round_robin".
+
+    A key answering with a quota error (RESOURCE_EXHAUSTED) leaves the
+    rotation for the retry delay sent by Gemini (cooldown seconds by default),
+    the call is sent again on another key. When no key is available the call
+    waits for one at most max_wait seconds, then KeysExhausted is raised.
+
+    Example:
+        >>> key_pool = GeminiKeyPool(clients,rpm=15,strategy="least_loaded")
+        >>> response = await key_pool.run(lambda key: key_pool.model(key,model).generate_content_async(prompt))
+    """
+
+    STRATEGIES = ("least_loaded","round_robin")
+
+    def __init__(self,clients:list,rpm:float=0,burst:float=None,strategy:str="least_loaded",
+                 cooldown:float=60,max_wait:float=1.0):
+        """
+        Ctor
+
+        Args:
+            clients (list): async clients (GenerativeServiceAsyncClient), one per key
+            rpm (float): calls per minute of a key, 0 for no limit
+            burst (float): calls a key can start at once, rpm/6 by default (10 s of its rate)
+            strategy (str): "least_loaded" or "round_robin"
+            cooldown (float): time a key leaves the rotation after a quota error in seconds,
+                              when Gemini doesn't send a retry delay
+            max_wait (float): maximum wait of a call for an available key in seconds
+        """
+        if len(clients) == 0:
+            raise ValueError("GeminiKeyPool needs at least one client")
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy!r}, expected least_loaded or round_robin")
+        self.rpm = rpm
+        self.burst = max(1.0,burst if burst else rpm/6)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        now = time.monotonic()
+        self.keys = [{"index": index, "client": client, "tokens": self.burst, "updated": now,
+                      "in_flight": 0, "cooldown_until": 0.0, "calls": 0, "quota_errors": 0, "models": {}}
+                     for index, client in enumerate(clients)]
+        self.next_key = itertools.count()
+        self.calls = 0
+        self.switched = 0
+        self.waits = 0
+        self.exhausted = 0
+
+    def model(self,key:dict,model):
+        """
+        Copy of a model bound to the client of a key, cached per key
+
+        Args:
+            key (dict): the key (see run)
+            model (GenerativeModel): the model, bound to any client
+
+        Returns:
+            model (GenerativeModel): the model bound to the client of the key
+        """
+        base = getattr(model,"_key_pool_base",model)
+        bound = key["models"].get(base)
+        if bound == None:
+            bound = copy.copy(base)
+            bound._async_client = key["client"]
+            bound._key_pool_base = base
+            key["models"][base] = bound
+        return bound
+
+    async def run(self,call):
+        """
+        Run a call on a key, again on another key after a quota error
+
+        Args:
+            call: function called with the key, returning the awaitable of the call
+
+        Returns:
+            the result of the call
+
+        Raises:
+            KeysExhausted: if no key is available after max_wait
+            ResourceExhausted: if every key answered with a quota error
+        """
+        self.calls += 1
+        tried = set()
+        while True:
+            key = await self.acquire(tried)
+            try:
+                result = await call(key)
+            except exceptions.ResourceExhausted as e:
+                self.release(key,e)
+                tried.add(key["index"])
+                if len(tried) == len(self.keys):
+                    raise
+                self.switched += 1
+                logger.warning("GeminiKeyPool::run -> quota error on key %d, trying another key",key["index"])
+                continue
+            except BaseException:
+                self.release(key)
+                raise
+            self.release(key)
+            return result
+
+    async def acquire(self,tried:set) -> dict:
+        """
+        Take a token of the key chosen by the strategy, wait at most max_wait for one
+
+        Args:
+            tried (set): indexes of the keys that already failed for this call
+
+        Raises:
+            KeysExhausted: if no key is available after max_wait
+        """
+        deadline = time.monotonic()+self.max_wait
+        waited = False
+        while True:
+            now = time.monotonic()
+            candidates = []
+            delay = None
+            for key in self.keys:
+                if key["index"] in tried:
+                    continue
+                self.refill(key,now)
+                wait = max(key["cooldown_until"]-now,0.0)
+                if self.rpm and key["tokens"] < 1:
+                    wait = max(wait,(1-key["tokens"])*60/self.rpm)
+                if wait == 0:
+                    candidates.append(key)
+                elif delay == None or wait < delay:
+                    delay = wait
+
+            if len(candidates) > 0:
+                key = self.choose(candidates)
+                if self.rpm:
+                    key["tokens"] -= 1
+                key["in_flight"] += 1
+                key["calls"] += 1
+                return key
+
+            if delay == None or now+delay > deadline:
+                self.exhausted += 1
+                raise KeysExhausted(max(1,math.ceil(delay or self.cooldown)))
+            if not waited:
+                waited = True
+                self.waits += 1
+            await asyncio.sleep(delay)
+
+    def choose(self,candidates:list) -> dict:
+        """
+        Key of the strategy among the available keys
+        """
+        if self.strategy == "round_robin":
+            start = next(self.next_key) % len(self.keys)
+            return min(candidates,key=lambda key: (key["index"]-start) % len(self.keys))
+        return min(candidates,key=lambda key: (key["in_flight"],-key["tokens"],key["calls"]))
+
+    def release(self,key:dict,error:Exception=None) -> None:
+        """
+        End a call on a key, a quota error removes the key from the rotation
+        for the retry delay of the error (cooldown by default)
+        """
+        key["in_flight"] -= 1
+        if isinstance(error,exceptions.ResourceExhausted):
+            key["quota_errors"] += 1
+            key["cooldown_until"] = time.monotonic()+self.retryDelay(error)
+
+    def retryDelay(self,error:exceptions.ResourceExhausted) -> float:
+        """
+        Retry delay sent by Gemini with a quota error (google.rpc.RetryInfo), cooldown by default
+        """
+        for detail in error.details or []:
+            delay = getattr(detail,"retry_delay",None)
+            if delay != None:
+                return delay.seconds + delay.nanos/1e9
+        return self.cooldown
+
+    def refill(self,key:dict,now:float) -> None:
+        """
+        Add the tokens of a key earned since its last update
+        """
+        if self.rpm:
+            key["tokens"] = min(self.burst,key["tokens"]+(now-key["updated"])*self.rpm/60)
+        key["updated"] = now
+
+    def clients(self) -> list:
+        """
+        The async clients of the keys
+        """
+        return [key["client"] for key in self.keys]
+
+    def stats(self) -> dict:
+        """
+        Pool counters, switched calls were sent again on another key after a quota
+        error, exhausted calls found no available key. "keys" holds the counters
+        of each key (by index, the keys themselves are never exposed)
+
+        Returns:
+            json: Format
+            {
+                "total": ..., "available": ..., "cooling": ..., "in_flight": ...,
+                "calls": ..., "switched": ..., "waits": ..., "exhausted": ..., "quota_errors": ...,
+                "keys": [{"index": 0, "in_flight": ..., "tokens": ..., "cooling": ..., "calls": ..., "quota_errors": ...},...]
+            }
+        """
+        now = time.monotonic()
+        keys = []
+        for key in self.keys:
+            self.refill(key,now)
+            keys.append({
+                "index": key["index"],
+                "in_flight": key["in_flight"],
+                "tokens": round(key["tokens"],2) if self.rpm else None,
+                "cooling": round(max(key["cooldown_until"]-now,0.0),1),
+                "calls": key["calls"],
+                "quota_errors": key["quota_errors"],
+            })
+        cooling = sum(1 for key in keys if key["cooling"] > 0)
+        return {
+            "total": len(keys),
+            "available": len(keys)-cooling,
+            "cooling": cooling,
+            "in_flight": sum(key["in_flight"] for key in keys),
+            "calls": self.calls,
+            "switched": self.switched,
+            "waits": self.waits,
+            "exhausted": self.exhausted,
+            "quota_errors": sum(key["quota_errors"] for key in keys),
+            "keys": keys,
+        }
@@ -5,36 +5,55 @@
   See the LICENSE file for details.
 """
 import google.generativeai as genai
+import logging
+
+from lib.AsyncLogging import getPayloadLogger
+from lib.GeminiChat import GeminiChat
+
+logger = logging.getLogger(__name__)
+payload_logger = getPayloadLogger(__name__)
 
 
 class GeminiWrapper:
     """
     This is a simple helper class to interect with Gemini
 
+    The client is configured once in the Ctor and the models are cached,
+    create one wrapper per process and use newChat to get a chat session
+    per request.
+
     Example:
         
         >>> gwrapper = GeminiWrapper("Gemini_Api_Key","gemini-2.0-flash")
         >>> gwrapper.generateContent("Hello")
+        >>> chat = gwrapper.newChat(history)
     """
 
 
-    def __init__(self,API_KEY,model_name="gemini-2.0-flash"):
+    def __init__(self,API_KEY,model_name="gemini-2.0-flash",generation_config:dict=None,api_endpoint:str=None):
         """
         Ctor 
 
         Args:
             API_KEY (str): Gemini key api   
             model_name (str): Model name to use, default is "gemini-2.0-flash"     
+            generation_config (dict): optional generation config of the models
+                                      (see createGenerationConfig for the keys)
+            api_endpoint (str): optional endpoint of the API, e.g. "http://127.0.0.1:8001"
+                                for a local stand-in (see bench/FakeGemini.py)
         """
         try:
             self.MODEL_NAME = model_name
+            self.generation_config = generation_config
             self.FULL_MODEL_NAME = "models/"+self.MODEL_NAME
             self.model = None
             self.chat_session = None
-            genai.configure(api_key=API_KEY, transport='rest')
+            self.models = {}
+            genai.configure(api_key=API_KEY, transport='rest',
+                            client_options={"api_endpoint": api_endpoint} if api_endpoint else None)
             
         except Exception as e:
-            print(f"GeminiWrapper::__init__ -> Exception: {e}")
+            logger.error("GeminiWrapper::__init__ -> exception : %s",e)
             return f"Error {e}"
 
     def reset(self) -> None:
@@ -43,6 +62,62 @@ class GeminiWrapper:
         """
         self.model = None
         self.chat_session = None
+        self.models = {}
+
+    def getModel(self,sys_instruction=None):
+        """
+        Return the model for a system instruction, the model is created
+        on first use and then reused
+
+        Args:
+            sys_instruction (str): optional system instruction
+
+        Return:
+            model (GenerativeModel): cached model
+        """
+        model = self.models.get(sys_instruction)
+        if model == None:
+            model = genai.GenerativeModel(self.MODEL_NAME,
+                                          system_instruction=sys_instruction,
+                                          generation_config=self.generation_config)
+            self.models[sys_instruction] = model
+        return model
+
+    def newChat(self,user_history_prompt:list=None):
+        """
+        Start a chat session on the cached model, with history if provided
+
+        Unlike initChat, the session is not kept in the wrapper
+        so the wrapper can be shared between concurrent requests.
+
+        Args:
+            user_history_prompt(list(dict)): History of the chat 
+                                            [
+                                                {"role": "user", "parts": "Hello"},
+                                                {"role": "model", "parts": "Great to meet you. What would you like to know?"},
+                                            ]
+        Return
+            chat (GeminiChat): the chat session or None on error
+        """
+        try:
+            return GeminiChat(self.startChatSession(user_history_prompt))
+        except Exception as e:
+            logger.error("GeminiWrapper::newChat -> exception : %s",e)
+            return None
+
+    def startChatSession(self,user_history_prompt:list=None):
+        """
+        Start a ChatSession on the cached model
+
+        Args:
+            user_history_prompt(list(dict)): History of the chat
+
+        Return
+            chat_session (ChatSession): the SDK chat session
+        """
+        if user_history_prompt !=None and len(user_history_prompt)>0:
+            return self.getModel().start_chat(history=user_history_prompt)
+        return self.getModel().start_chat()
 
     def createGenerationConfig(self,**kwargs):
         """
@@ -68,7 +143,7 @@ class GeminiWrapper:
         try:
             return genai.types.GenerationConfig(**kwargs)
         except Exception as e:
-            print(f"GeminiWrapper::createGenerationConfig -> Exception: {e}")
+            logger.error("GeminiWrapper::createGenerationConfig -> exception : %s",e)
     
     def generateContent(self,prompt:str,sys_instruction=None):
         """
@@ -93,20 +168,16 @@ class GeminiWrapper:
         """
         response = None
         try:
-            print(f"GeminiWrapper::prompt -> {prompt}")
+            payload_logger.debug("GeminiWrapper::generateContent -> prompt : %s",prompt)
             if self.model== None or self.model.model_name!=self.FULL_MODEL_NAME:
-                if sys_instruction!= None:
-                    self.model = genai.GenerativeModel(self.MODEL_NAME,
-                                                       system_instruction=sys_instruction)
-                else:
-                    self.model = genai.GenerativeModel(self.MODEL_NAME)
+                self.model = self.getModel(sys_instruction)
             if prompt != None and len(prompt)>0:
                 response = self.model.generate_content(prompt)
             else:
-                print("GeminiWrapper::Invalid or empty prompt")
+                logger.warning("GeminiWrapper::generateContent -> invalid or empty prompt")
 
         except Exception as e:
-            print(f"GeminiWrapper::generateContent -> Exception: {e}")
+            logger.error("GeminiWrapper::generateContent -> exception : %s",e)
         return response
 
     def initChat(self,user_history_prompt:list=None):
@@ -124,7 +195,7 @@ class GeminiWrapper:
         """
         try:
             if self.model == None or self.model.model_name != self.FULL_MODEL_NAME:
-                self.model = genai.GenerativeModel(self.MODEL_NAME)
+                self.model = self.getModel()
 
             if user_history_prompt !=None and len(user_history_prompt)>0:
                 self.chat_session = self.model.start_chat(
@@ -134,23 +205,25 @@ class GeminiWrapper:
                     #    {"role": "model", "parts": "Great to meet you. What would you like to know?"},
                     #]
                 )
-                print("init chat with history")
+                logger.debug("GeminiWrapper::initChat -> with history")
             else : 
                 self.chat_session = self.model.start_chat()
 
-                print("init chat without history")
+                logger.debug("GeminiWrapper::initChat -> without history")
             return True
         except Exception as e:
-            print(f"GeminiWrapper::chat -> Exception : {e}")
+            logger.error("GeminiWrapper::initChat -> exception : %s",e)
            
             return False
 
-    def chat(self,prompt:str):
+    def chat(self,prompt:str,stream:bool=False):
         """
         Send a prompt to current chat session
 
         Args:
             prompt(str): user prompt to send
+            stream(bool): if True, the response is yielded chunk by chunk
+                          as soon as Gemini produces it, default is False
 
         Return:
             response(GenerateContentResponse): Gemini response
@@ -159,10 +232,10 @@ class GeminiWrapper:
         response = None
         try:
 
-            response = self.chat_session.send_message(prompt, stream=False)
+            response = self.chat_session.send_message(prompt, stream=stream)
 
         except Exception as e:
-            print(f"GeminiWrapper::chat -> Exception : {e}")
+            logger.error("GeminiWrapper::chat -> exception : %s",e)
 
         return response
     
@@ -0,0 +1,297 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import OrderedDict
+
+
+class HistoryCache:
+    """
+    Bounded LRU cache of parsed session histories in front of a HistoryStore.
+
+    getTurns and putTurn have the same signature as the store ones.
+    Saves are written through to the store then appended to the cached entry.
+    Before serving an entry, the last turn in the store (the version
+    of the history) is read with a key only query: if another node added
+    turns, only the missing turns are read.
+
+    With a HistoryWriter, saves are appended to the cached entry and queued
+    instead (write-behind). An entry with turns not yet written can't be
+    evicted so the next turn of the session always sees them.
+
+    A turn merged by the store (another node wrote the same turn number,
+    see HistoryStore.appendTurn) is written at another number, the entry
+    is then removed and read again from the store on the next request.
+
+    Example:
+        >>> history_cache = HistoryCache(history_store,max_entries=1000)
+        >>> await history_cache.getTurns(session_id,table_name)
+        >>> history_cache.stats()
+    """
+
+    #Approximate memory used by a message besides its text
+    MESSAGE_OVERHEAD = 64
+
+    def __init__(self,history_store,max_entries:int=1024,max_bytes:int=64*1024*1024,max_turns:int=0,writer=None):
+        """
+        Ctor
+
+        Args:
+            history_store (HistoryStore): store used on cache miss and for writes
+            max_entries (int): maximum number of cached sessions
+            max_bytes (int): maximum size of the cached messages (approximate)
+            max_turns (int): maximum number of turns kept per session, 0 to keep all
+            writer (HistoryWriter): optional, write-behind queue used by putTurn
+        """
+        self.history_store = history_store
+        self.writer = writer
+        #session_id -> number of turns queued and not yet written
+        self.pending = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        #session_id -> {"turns": [...], "complete": bool, "size": int}
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.merged = 0
+
+    async def getTurns(self,session_id:str,table_name:str,limit:int=None) -> list:
+        """
+        Get the turns of a session, from the cache if the cached entry is up to date
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+            limit (int): optional, only return the last "limit" turns
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first or {"error":"message"}
+        """
+        entry = self.entries.get(session_id)
+        if entry != None and self.covers(entry,limit):
+            version = await self.history_store.getLastTurn(session_id,table_name)
+            if not isinstance(version,int):
+                return version
+
+            cached_version = entry["turns"][-1]["turn"]
+            if version == cached_version or (version < cached_version and session_id in self.pending):
+                self.hits += 1
+                self.entries.move_to_end(session_id)
+                return self.slice(entry,limit)
+
+            if version > cached_version:
+                #Another node added turns, only read the missing ones
+                turns = await self.history_store.getTurns(session_id,table_name,after_turn=cached_version)
+                if not isinstance(turns,list):
+                    return turns
+                self.refreshes += 1
+                entry = self.extend(session_id,entry,turns)
+                return self.slice(entry,limit)
+
+            self.invalidate(session_id)
+
+        self.misses += 1
+        turns = await self.history_store.getTurns(session_id,table_name,limit)
+        if isinstance(turns,list) and len(turns) > 0:
+            self.store(session_id,turns,not limit or len(turns) < limit)
+        return turns
+
+    def peekTurns(self,session_id:str,limit:int=None) -> list:
+        """
+        Get the cached turns of a session without reading the last turn in
+        the store, for a caller that already holds the session (a websocket
+        connection): turns written by another node are only seen once a
+        write of the session is merged (the entry is then removed)
+
+        Args:
+            session_id (str): the session id relate to the history
+            limit (int): optional, only return the last "limit" turns
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first or None if not cached
+        """
+        entry = self.entries.get(session_id)
+        if entry == None or not self.covers(entry,limit):
+            return None
+        self.hits += 1
+        self.entries.move_to_end(session_id)
+        return self.slice(entry,limit)
+
+    async def putTurn(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        """
+        Write a turn to the store (or queue it with a HistoryWriter)
+        and append it to the cached entry
+
+        Args:
+            session_id (str): the session id relate to the history
+            turn (int): the turn number
+            messages (list): the messages of the turn
+            table_name (str): the per-turn history table
+
+        Returns:
+            reponse  (dict): message and last_turn or {"error":"message"}
+        """
+        if self.writer != None and self.appendTurn(session_id,turn,messages):
+            #Pin the entry until the turn is written
+            self.pending[session_id] = self.pending.get(session_id,0)+1
+            if self.writer.submit(session_id,turn,messages,table_name,self.written):
+                return {"message": "Turn queued!", "last_turn": turn}
+            self.written(session_id,turn,True)
+
+        result = await self.history_store.appendTurn(session_id,turn,messages,table_name)
+        if result.get("error"):
+            self.invalidate(session_id)
+            return result
+
+        if result.get("merged"):
+            self.merged += 1
+            self.invalidate(session_id)
+        elif self.writer == None:
+            self.appendTurn(session_id,turn,messages)
+        return result
+
+    def appendTurn(self,session_id:str,turn:int,messages:list) -> bool:
+        """
+        Append a turn to the cached entry of a session
+
+        Returns:
+            bool: True if appended, False if the entry is missing or
+                  doesn't end with the previous turn (the entry is removed)
+        """
+        entry = self.entries.get(session_id)
+        if entry != None and entry["turns"][-1]["turn"] == turn-1:
+            self.extend(session_id,entry,[{"turn": turn, "messages": messages}])
+            return True
+        if turn == 1:
+            self.store(session_id,[{"turn": turn, "messages": messages}],True)
+            return True
+        self.invalidate(session_id)
+        return False
+
+    def written(self,session_id:str,turn:int,ok:bool,written_turn:int=None) -> None:
+        """
+        HistoryWriter callback, unpin the entry once its queued turns are written.
+        If a turn was dropped or merged the entry is removed, the store is the reference.
+        """
+        count = self.pending.get(session_id,0)-1
+        if count > 0:
+            self.pending[session_id] = count
+        else:
+            self.pending.pop(session_id,None)
+        if not ok:
+            self.pending.pop(session_id,None)
+            self.invalidate(session_id)
+        elif written_turn != None and written_turn != turn:
+            self.merged += 1
+            self.invalidate(session_id)
+
+    def covers(self,entry:dict,limit:int) -> bool:
+        """
+        Check if a cached entry holds enough turns for the request
+        """
+        return entry["complete"] or (bool(limit) and len(entry["turns"]) >= limit)
+
+    def slice(self,entry:dict,limit:int) -> list:
+        """
+        Return a copy of the last "limit" turns of a cached entry
+        """
+        if limit:
+            return entry["turns"][-limit:]
+        return list(entry["turns"])
+
+    def store(self,session_id:str,turns:list,complete:bool) -> dict:
+        """
+        Put an entry in the cache then evict the least recently used
+        entries until the limits are respected
+
+        Returns:
+            entry (dict): the stored entry
+        """
+        self.invalidate(session_id)
+        if self.max_turns and len(turns) > self.max_turns:
+            turns = turns[-self.max_turns:]
+            complete = False
+
+        #The entry owns its list, extend appends to it
+        size = self.turnsSize(turns)
+        entry = {"turns": list(turns), "complete": complete, "size": size}
+        self.entries[session_id] = entry
+        self.size += size
+        self.evict(session_id)
+        return entry
+
+    def extend(self,session_id:str,entry:dict,turns:list) -> dict:
+        """
+        Append turns to a cached entry in place, only the size of the new turns
+        is computed (the cost doesn't grow with the history)
+
+        Returns:
+            entry (dict): the entry
+        """
+        entry["turns"].extend(turns)
+        size = self.turnsSize(turns)
+        if self.max_turns and len(entry["turns"]) > self.max_turns:
+            size -= self.turnsSize(entry["turns"][:-self.max_turns])
+            del entry["turns"][:-self.max_turns]
+            entry["complete"] = False
+        entry["size"] += size
+        self.size += size
+        self.entries.move_to_end(session_id)
+        self.evict(session_id)
+        return entry
+
+    def turnsSize(self,turns:list) -> int:
+        """
+        Approximate memory used by the messages of turns
+        """
+        return sum(len(message.get("parts") or "")+self.MESSAGE_OVERHEAD
+                   for turn in turns for message in turn["messages"])
+
+    def evict(self,session_id:str) -> None:
+        """
+        Evict the least recently used entries, except session_id and the
+        entries with pending turns, until the limits are respected
+        """
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            evicted_id = next((key for key in self.entries if key not in self.pending and key != session_id),None)
+            if evicted_id == None:
+                break
+            self.size -= self.entries.pop(evicted_id)["size"]
+            self.evictions += 1
+
+    def invalidate(self,session_id:str) -> None:
+        """
+        Remove a session from the cache
+        """
+        entry = self.entries.pop(session_id,None)
+        if entry != None:
+            self.size -= entry["size"]
+
+    def stats(self) -> dict:
+        """
+        Cache counters
+
+        Returns:
+            json: Format
+            {
+                "entries": ..., "bytes": ..., "hits": ..., "misses": ...,
+                "refreshes": ..., "evictions": ..., "merged": ..., "hit_ratio": ...
+            }
+        """
+        lookups = self.hits + self.misses + self.refreshes
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+            "merged": self.merged,
+            "hit_ratio": round(self.hits/lookups,3) if lookups else 0.0,
+        }
@@ -0,0 +1,135 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import json
+import zlib
+
+
+class HistoryCodec:
+    """
+    Encoding of the stored messages.
+
+    Without compression the messages are a json string (String attribute).
+    With compression="zlib" the json is compressed and stored as bytes
+    (Binary attribute) starting with a format-version byte. Small values
+    are kept as json strings, zlib doesn't pay off below min_bytes.
+    decode reads both formats whatever the compression setting, so the
+    setting can be changed at any time.
+
+    Example:
+        >>> codec = HistoryCodec("zlib")
+        >>> value = codec.encode(messages)
+        >>> messages = codec.decode(value)
+    """
+
+    COMPRESSIONS = ("none","zlib")
+
+    #First byte of the Binary values
+    FORMAT_JSON = 0
+    FORMAT_ZLIB = 1
+
+    def __init__(self,compression:str="none",min_bytes:int=256,level:int=6):
+        """
+        Ctor
+
+        Args:
+            compression (str): "none" or "zlib"
+            min_bytes (int): json values smaller than this are not compressed
+            level (int): zlib level, 1 (fastest) to 9 (smallest)
+        """
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r}, expected one of {self.COMPRESSIONS}")
+        self.compression = compression
+        self.min_bytes = min_bytes
+        self.level = level
+        self.encoded = 0
+        self.compressed = 0
+        self.json_bytes = 0
+        self.stored_bytes = 0
+
+    def encode(self,messages) -> str:
+        """
+        Encode messages (or any json value)
+
+        Returns:
+            value (str|bytes): json string or compressed bytes
+        """
+        return self.encodeText(json.dumps(messages))
+
+    def encodeText(self,text:str) -> str:
+        """
+        Encode a json string
+
+        Returns:
+            value (str|bytes): the json string or compressed bytes
+        """
+        self.encoded += 1
+        if self.compression == "none" or len(text) < self.min_bytes:
+            self.json_bytes += len(text)
+            self.stored_bytes += len(text)
+            return text
+
+        raw = text.encode("utf-8")
+        value = bytes([self.FORMAT_ZLIB]) + zlib.compress(raw,self.level)
+        self.compressed += 1
+        self.json_bytes += len(raw)
+        self.stored_bytes += len(value)
+        return value
+
+    def decode(self,value):
+        """
+        Decode a value written by encode, in any format
+        """
+        return json.loads(self.decodeText(value))
+
+    @staticmethod
+    def decodeText(value) -> str:
+        """
+        Get the json string of a value written by encode, in any format
+
+        Args:
+            value (str|bytes): json string, or bytes (boto3 Binary are accepted)
+
+        Returns:
+            text (str): the json string
+
+        Raises:
+            ValueError: if the format-version byte is unknown
+        """
+        if isinstance(value,str):
+            return value
+        #boto3 resources return a Binary wrapping the bytes
+        value = bytes(getattr(value,"value",value))
+        if len(value) > 0 and value[0] == HistoryCodec.FORMAT_ZLIB:
+            return zlib.decompress(value[1:]).decode("utf-8")
+        if len(value) > 0 and value[0] == HistoryCodec.FORMAT_JSON:
+            return value[1:].decode("utf-8")
+        raise ValueError(f"Unknown history format {value[:1]!r}")
+
+    @staticmethod
+    def toBytes(value) -> bytes:
+        """
+        Binary form of a value written by encode (e.g. to store it in a file),
+        json strings get the FORMAT_JSON byte
+        """
+        if isinstance(value,str):
+            return bytes([HistoryCodec.FORMAT_JSON]) + value.encode("utf-8")
+        return value
+
+    def stats(self) -> dict:
+        """
+        Statistics of the encoded values
+
+        Returns:
+            stats (dict): encoded, compressed, json_bytes, stored_bytes, ratio
+        """
+        return {
+            "encoded": self.encoded,
+            "compressed": self.compressed,
+            "json_bytes": self.json_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.stored_bytes/self.json_bytes,4) if self.json_bytes else 1.0,
+        }
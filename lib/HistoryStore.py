@@ -0,0 +1,230 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import asyncio
+
+
+class HistoryStore:
+    """
+    Interface of the history backends used by the API:
+    AsyncDynamoWrapper (DynamoDb), MemoryHistoryStore (process memory)
+    and SqliteHistoryStore (SQLite file in WAL mode).
+
+    A session is a list of turns numbered from 1, each turn holding the
+    messages of one prompt and its reply. Next to the turns, a store keeps
+    the rolling summary of the sessions and the shared response cache.
+    The methods return {"error": "message"} on failure, except writeTurns
+    which raises so the write-behind queue can retry.
+
+    Several nodes may append to the same session: the turn number is the
+    version of the history and putTurn only writes a turn whose number is
+    free (a conditional write). appendTurn and writeTurns merge on conflict,
+    the turn is appended after the turns written meanwhile by other nodes.
+
+    Example:
+        >>> history_store = MemoryHistoryStore()
+        >>> await history_store.putTurn(session_id,1,messages,table_name)
+        >>> await history_store.getTurns(session_id,table_name,limit=10)
+    """
+
+    async def getTurns(self,session_id:str,table_name:str,limit:int=None,after_turn:int=0) -> list:
+        """
+        Get the turns of a session
+
+        Args:
+            session_id (str): the session id relate to the history
+            table_name (str): the per-turn history table
+            limit (int): optional, only read the last "limit" turns
+            after_turn (int): optional, only read the turns after this one
+
+        Returns:
+            turns (list): [{"turn": 1, "messages": [...]},...] oldest first or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def getLastTurn(self,session_id:str,table_name:str) -> int:
+        """
+        Get the number of the last turn of a session (the version of the history)
+
+        Returns:
+            last_turn (int): the last turn, 0 if the session has no turn or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def putTurn(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        """
+        Write one turn if its number is free
+
+        Returns:
+            reponse  (dict): message and last_turn, {"error":"message"} or
+                             {"error":"message","conflict":True} if the turn already exists
+        """
+        raise NotImplementedError
+
+    async def appendTurn(self,session_id:str,turn:int,messages:list,table_name:str,max_attempts:int=3) -> dict:
+        """
+        Write one turn with optimistic concurrency. On conflict the turns written
+        since turn-1 are read: if one holds the same messages the turn was already
+        written (retried write), otherwise it is appended after them (merge).
+
+        Args:
+            turn (int): the expected turn number (last turn read + 1)
+            max_attempts (int): maximum number of writes
+
+        Returns:
+            reponse  (dict): message, last_turn (the number the turn was written at)
+                             and merged (True if it differs from turn) or {"error":"message"}
+        """
+        expected_turn = turn
+        for attempt in range(max_attempts):
+            result = await self.putTurn(session_id,turn,messages,table_name)
+            if not result.get("conflict"):
+                if "error" not in result:
+                    result["merged"] = turn != expected_turn
+                return result
+            turns = await self.getTurns(session_id,table_name,after_turn=turn-1)
+            if not isinstance(turns,list):
+                return turns
+            for written in turns:
+                if written["messages"] == messages:
+                    return {"message": "Turn already saved!", "last_turn": written["turn"],
+                            "merged": written["turn"] != expected_turn}
+            if len(turns) > 0:
+                turn = turns[-1]["turn"]+1
+        return {"error": f"Turn not saved, {max_attempts} conflicts", "conflict": True}
+
+    async def putTurns(self,session_id:str,turns:list,table_name:str,first_turn:int=1) -> dict:
+        """
+        Write consecutive turns of a session
+
+        Args:
+            turns (list): list of turns, each turn is a list of messages
+            first_turn (int): number of the first turn to write
+
+        Returns:
+            reponse  (dict): message and last_turn or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def writeTurns(self,turns:list) -> list:
+        """
+        Write turns of any sessions (used by HistoryWriter) with appendTurn,
+        the turns of a session in order and the sessions concurrently
+
+        Args:
+            turns (list): [(table_name,session_id,turn,messages),...]
+
+        Returns:
+            written (list): the number each turn was written at, in the order of turns
+
+        Raises:
+            RuntimeError: if a turn is not written
+        """
+        sessions = {}
+        for index, (table_name, session_id, _, _) in enumerate(turns):
+            sessions.setdefault((table_name,session_id),[]).append(index)
+        written = [None]*len(turns)
+
+        async def writeSession(indexes:list) -> None:
+            for index in indexes:
+                table_name, session_id, turn, messages = turns[index]
+                result = await self.appendTurn(session_id,turn,messages,table_name)
+                if "error" in result:
+                    raise RuntimeError(result["error"])
+                written[index] = result["last_turn"]
+
+        await asyncio.gather(*(writeSession(indexes) for indexes in sessions.values()))
+        return written
+
+    async def getSummary(self,session_id:str,table_name:str) -> dict:
+        """
+        Get the rolling summary of a session
+
+        Returns:
+            summary (dict): {"summary": "...", "summary_turn": N}, None if there
+                            is no summary or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def getSummaries(self,session_ids:list,table_name:str) -> dict:
+        """
+        Get the rolling summaries of several sessions at once
+
+        Returns:
+            summaries (dict): {session_id: {"summary": "...", "summary_turn": N}} for
+                              the sessions having a summary, or {"error":"message"}
+        """
+        summaries = await asyncio.gather(*(self.getSummary(session_id,table_name) for session_id in session_ids))
+        return {session_id: summary for session_id, summary in zip(session_ids,summaries)
+                if summary != None and not summary.get("error")}
+
+    async def putSummary(self,session_id:str,summary:str,summary_turn:int,table_name:str) -> dict:
+        """
+        Put the rolling summary of a session
+
+        Returns:
+            reponse  (dict): message or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def getCachedResponse(self,cache_key:str,table_name:str) -> dict:
+        """
+        Get a reply of the shared response cache
+
+        Returns:
+            item (dict): {"response": "...", "expires_at": N}, None if not found or {"error":"message"}
+        """
+        raise NotImplementedError
+
+    async def putCachedResponse(self,cache_key:str,response:str,expires_at:int,table_name:str,if_absent:bool=False) -> dict:
+        """
+        Put a reply in the shared response cache (also used by IdempotencyStore)
+
+        Args:
+            if_absent (bool): only write if there is no entry or it expired (a conditional write)
+
+        Returns:
+            reponse  (dict): message, {"error":"message"} or
+                             {"error":"message","conflict":True} if if_absent and the entry exists
+        """
+        raise NotImplementedError
+
+    async def migrateHistory(self,session_id:str,legacy_table_name:str,table_name:str) -> list:
+        """
+        Copy the legacy single-blob history of a session to the turns,
+        only DynamoDb has a legacy table
+
+        Returns:
+            turns (list): the migrated turns, [] if there is nothing to migrate
+                          or {"error":"message"}
+        """
+        return []
+
+    async def getTableStatus(self,table_name:str) -> dict:
+        """
+        Status of the history table
+
+        Returns:
+            json: {"status": "..."} or {"error": "message"}
+        """
+        return {"status": "ACTIVE"}
+
+    async def checkTable(self,table_name:str,max_age:float=30) -> dict:
+        """
+        Readiness check of the history table, cheap enough to be probed
+        every few seconds (a store may answer from what it already knows
+        when it was reached less than max_age seconds ago)
+
+        Returns:
+            json: {"status": "..."} or {"error": "message"}
+        """
+        return await self.getTableStatus(table_name)
+
+    def close(self) -> None:
+        """
+        Release the resources of the store
+        """
+        return None
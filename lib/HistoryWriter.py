@@ -0,0 +1,184 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter:
+    """
+    Write-behind queue for history turns.
+
+    Turns are queued by submit and written by a background task with
+    HistoryStore.writeTurns (conditional writes, a turn already written
+    by another node is appended after it), the turns queued while a batch
+    is being written are grouped in the next batch.
+    Failed batches are retried with a backoff, the turns of a batch
+    failing after max_retries are dropped and counted. The queue is
+    flushed on stop.
+
+    Example:
+        >>> writer = HistoryWriter(history_store)
+        >>> writer.start()
+        >>> writer.submit(session_id,turn,messages,table_name)
+        >>> await writer.stop()
+    """
+
+    #Turns written per batch
+    BATCH_SIZE = 25
+
+    def __init__(self,history_store,max_queue:int=10000,max_retries:int=3,retry_delay:float=0.1,flush_callback=None):
+        """
+        Ctor
+
+        Args:
+            history_store (HistoryStore): store used to write the batches
+            max_queue (int): maximum number of queued turns
+            max_retries (int): number of retries of a failed batch before dropping it
+            retry_delay (float): delay before the first retry in seconds, doubled on each retry
+            flush_callback: optional, called with (count,start,ok) after each batch,
+                            start being time.perf_counter() before the first attempt
+        """
+        self.history_store = history_store
+        self.flush_callback = flush_callback
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.task = None
+        self.queued = 0
+        self.rejected = 0
+        self.written = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = 0
+        self.merged = 0
+
+    def start(self) -> None:
+        """
+        Start the background task, must be called from the event loop
+        """
+        self.task = asyncio.create_task(self.run())
+
+    def submit(self,session_id:str,turn:int,messages:list,table_name:str,callback=None) -> bool:
+        """
+        Queue a turn to write
+
+        Args:
+            session_id (str): the session id relate to the history
+            turn (int): the turn number
+            messages (list): the messages of the turn
+            table_name (str): the per-turn history table
+            callback: optional, called with (session_id,turn,ok,written_turn) once the turn
+                      is written (ok=True) or dropped (ok=False), written_turn is the
+                      number it was written at (None if dropped)
+
+        Returns:
+            bool: True if queued, False if the queue is full or the writer is stopped
+        """
+        if self.task == None or self.task.done():
+            self.rejected += 1
+            return False
+        try:
+            self.queue.put_nowait((table_name,session_id,turn,messages,callback))
+            self.queued += 1
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def run(self) -> None:
+        """
+        Background task, write the queued turns by batch
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def flush(self,batch:list) -> None:
+        """
+        Write a batch of turns, retry on failure
+
+        Args:
+            batch (list): [(table_name,session_id,turn,messages,callback),...]
+        """
+        turns = [(table_name,session_id,turn,messages) for table_name, session_id, turn, messages, _ in batch]
+
+        ok = False
+        written = [None]*len(batch)
+        start = time.perf_counter()
+        for attempt in range(self.max_retries+1):
+            try:
+                written = await self.history_store.writeTurns(turns)
+                ok = True
+                break
+            except Exception as e:
+                logger.warning("HistoryWriter::flush -> attempt %d failed : %s",attempt+1,e)
+                if attempt < self.max_retries:
+                    self.retried += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+        self.batches += 1
+        if ok:
+            self.written += len(batch)
+        else:
+            self.dropped += len(batch)
+            logger.error("HistoryWriter::flush -> %d turns dropped",len(batch))
+        if self.flush_callback != None:
+            self.flush_callback(len(batch),start,ok)
+
+        for (_, session_id, turn, _, callback), written_turn in zip(batch,written):
+            if written_turn != None and written_turn != turn:
+                self.merged += 1
+            if callback != None:
+                callback(session_id,turn,ok,written_turn)
+
+    async def stop(self,timeout:float=10) -> None:
+        """
+        Flush the queue then stop the background task
+
+        Args:
+            timeout (float): maximum time to wait for the queue to be flushed in seconds
+        """
+        if self.task == None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(),timeout)
+        except asyncio.TimeoutError:
+            self.dropped += self.queue.qsize()
+            logger.error("HistoryWriter::stop -> %d turns not flushed",self.queue.qsize())
+        self.task.cancel()
+        self.task = None
+
+    def stats(self) -> dict:
+        """
+        Writer counters
+
+        Returns:
+            json: Format
+            {
+                "queue_size": ..., "queued": ..., "rejected": ..., "written": ...,
+                "retried": ..., "dropped": ..., "batches": ..., "merged": ...
+            }
+        """
+        return {
+            "queue_size": self.queue.qsize(),
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "written": self.written,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "merged": self.merged,
+        }
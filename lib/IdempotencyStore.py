@@ -0,0 +1,269 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """
+    Raised when an idempotency key can't be served: reused with another
+    request (422), or still running on another node after the wait (409,
+    retry after retry_after seconds)
+    """
+
+    def __init__(self,reason:str,status_code:int,retry_after:int=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class IdempotencyStore:
+    """
+    Results of the requests sent with an idempotency key, so a retried
+    request gets the result of the first one instead of running again.
+
+    While a request is running, the duplicates received by this process
+    wait for its result (the call runs in its own task, a client going
+    away doesn't cancel it for the others). On another node, the key is
+    claimed in the store with a conditional write: a duplicate finding a
+    claim polls the store until the result is written, for max_wait seconds.
+
+    A completed result is kept ttl seconds in memory (LRU) and in the store
+    table. Only successful results are kept, after a failure the claim is
+    released so a retry runs the request again.
+
+    Example:
+        >>> idempotency = IdempotencyStore(ttl=3600,history_store=history_store,table_name="ChatIdempotency")
+        >>> key = IdempotencyStore.key(session_id,idempotency_key)
+        >>> (result, replayed) = await idempotency.run(key,IdempotencyStore.fingerprint(request),call)
+    """
+
+    def __init__(self,ttl:int=3600,max_entries:int=10000,max_wait:float=30,pending_ttl:int=120,
+                 poll_interval:float=0.5,history_store=None,table_name:str=None):
+        """
+        Ctor
+
+        Args:
+            ttl (int): time a result is kept in seconds
+            max_entries (int): maximum number of results in memory
+            max_wait (float): maximum wait for a request running on another node in seconds
+            pending_ttl (int): time a claim is kept if its node never writes the result (crash) in seconds
+            poll_interval (float): interval of the reads of a claim of another node in seconds
+            history_store (HistoryStore): optional, to share the keys between nodes
+            table_name (str): the table of the keys (cache_key hash key on DynamoDb, see getCachedResponse)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_wait = max_wait
+        self.pending_ttl = pending_ttl
+        self.poll_interval = poll_interval
+        self.history_store = history_store
+        self.table_name = table_name
+        #key -> ({"fingerprint": ..., "result": ...}, expires_at)
+        self.entries = OrderedDict()
+        #key -> (fingerprint, task) of the requests running in this process
+        self.running = {}
+        self.calls = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.remote_waits = 0
+        self.conflicts = 0
+
+    @staticmethod
+    def key(scope:str,idempotency_key:str) -> str:
+        """
+        Key of a request, the idempotency key of the client is scoped (e.g. by session)
+
+        Returns:
+            str: sha256 of the scope and the idempotency key
+        """
+        return "idempotency:" + hashlib.sha256(f"{scope}\n{idempotency_key}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(request:dict) -> str:
+        """
+        Fingerprint of the body of a request, a key reused with another body is refused
+        """
+        return hashlib.sha256(json.dumps(request,sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def run(self,key:str,fingerprint:str,call,succeeded=None) -> tuple:
+        """
+        Run a call once per key
+
+        Args:
+            key (str): the key of the request (see key)
+            fingerprint (str): the fingerprint of the request (see fingerprint)
+            call: function returning the awaitable of the request, its result must be json serializable
+            succeeded: optional, function telling if a result is kept (all results by default)
+
+        Returns:
+            (result, replayed) (tuple): the result and True if it comes from a previous request
+
+        Raises:
+            IdempotencyConflict: 422 if the key was used with another request,
+                                 409 if the request is still running on another node
+        """
+        self.calls += 1
+        entry = self.entries.get(key)
+        if entry != None and entry[1] <= time.time():
+            del self.entries[key]
+            entry = None
+        if entry != None:
+            self.entries.move_to_end(key)
+            return self.replay(entry[0],fingerprint), True
+
+        if key in self.running:
+            running_fingerprint, task = self.running[key]
+            self.check(running_fingerprint,fingerprint)
+            self.coalesced += 1
+            result, _ = await asyncio.shield(task)
+            return result, True
+
+        task = asyncio.ensure_future(self.execute(key,fingerprint,call,succeeded or (lambda result: True)))
+        self.running[key] = (fingerprint,task)
+        task.add_done_callback(lambda task: self.done(key,task))
+        return await asyncio.shield(task)
+
+    def done(self,key:str,task:asyncio.Task) -> None:
+        """
+        Remove a finished request, its error is retrieved even if every caller went away
+        """
+        self.running.pop(key,None)
+        if not task.cancelled() and task.exception() != None:
+            logger.debug("IdempotencyStore::done -> error : %s",task.exception())
+
+    async def execute(self,key:str,fingerprint:str,call,succeeded) -> tuple:
+        """
+        Claim the key in the store (or wait for the node holding it) then run the call
+        """
+        if self.history_store != None and self.table_name:
+            item = await self.claim(key,fingerprint)
+            if item != None:
+                return self.replay(item,fingerprint), True
+
+        try:
+            result = await call()
+        except BaseException:
+            await self.release(key,fingerprint)
+            raise
+
+        if not succeeded(result):
+            await self.release(key,fingerprint)
+            return result, False
+        item = {"fingerprint": fingerprint, "result": result}
+        expires_at = int(time.time()+self.ttl)
+        self.store(key,item,expires_at)
+        await self.write(key,item,expires_at)
+        return result, False
+
+    async def claim(self,key:str,fingerprint:str) -> dict:
+        """
+        Claim a key in the store, or wait for the result of the node holding it
+
+        Returns:
+            item (dict): {"fingerprint": ..., "result": ...} written by another node, None once claimed
+
+        Raises:
+            IdempotencyConflict: 409 if the claim of another node is still there after max_wait
+        """
+        deadline = time.monotonic()+self.max_wait
+        waited = False
+        while True:
+            claim = {"fingerprint": fingerprint, "pending": True}
+            response = await self.history_store.putCachedResponse(key,json.dumps(claim),int(time.time()+self.pending_ttl),
+                                                                  self.table_name,if_absent=True)
+            if not response.get("error"):
+                return None
+            if not response.get("conflict"):
+                #The store is unavailable, run without the claim
+                logger.warning("IdempotencyStore::claim -> error : %s",response["error"])
+                return None
+
+            stored = await self.history_store.getCachedResponse(key,self.table_name)
+            if isinstance(stored,dict) and stored.get("response") != None:
+                item = json.loads(stored["response"])
+                self.check(item["fingerprint"],fingerprint)
+                if not item.get("pending"):
+                    self.store(key,item,stored["expires_at"])
+                    return item
+
+            if not waited:
+                waited = True
+                self.remote_waits += 1
+            remaining = deadline-time.monotonic()
+            if remaining <= 0:
+                self.conflicts += 1
+                raise IdempotencyConflict("request_in_progress",409,max(1,math.ceil(self.poll_interval)))
+            await asyncio.sleep(min(self.poll_interval,remaining))
+
+    async def release(self,key:str,fingerprint:str) -> None:
+        """
+        Release the claim of a key after a failure, a retry can run the request
+        """
+        if self.history_store != None and self.table_name:
+            #An expired claim can be taken again
+            await self.history_store.putCachedResponse(key,json.dumps({"fingerprint": fingerprint, "pending": True}),
+                                                       0,self.table_name)
+
+    async def write(self,key:str,item:dict,expires_at:int) -> None:
+        """
+        Write a result to the store
+        """
+        if self.history_store != None and self.table_name:
+            await self.history_store.putCachedResponse(key,json.dumps(item),expires_at,self.table_name)
+
+    def replay(self,item:dict,fingerprint:str):
+        """
+        Result of a previous request, if it had the same fingerprint
+        """
+        self.check(item["fingerprint"],fingerprint)
+        self.replayed += 1
+        return item["result"]
+
+    def check(self,stored_fingerprint:str,fingerprint:str) -> None:
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict("key_reused",422)
+
+    def store(self,key:str,item:dict,expires_at:float) -> None:
+        """
+        Put a result in memory then evict the least recently used ones
+        """
+        self.entries.pop(key,None)
+        self.entries[key] = (item,expires_at)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Idempotency counters, coalesced requests waited for a request running in this
+        process, remote_waits for a request running on another node
+
+        Returns:
+            json: Format
+            {
+                "entries": ..., "running": ..., "calls": ..., "replayed": ...,
+                "coalesced": ..., "remote_waits": ..., "conflicts": ...
+            }
+        """
+        return {
+            "entries": len(self.entries),
+            "running": len(self.running),
+            "calls": self.calls,
+            "replayed": self.replayed,
+            "coalesced": self.coalesced,
+            "remote_waits": self.remote_waits,
+            "conflicts": self.conflicts,
+        }
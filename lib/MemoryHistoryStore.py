@@ -0,0 +1,79 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import time
+
+from lib.HistoryStore import HistoryStore
+
+
+class MemoryHistoryStore(HistoryStore):
+    """
+    History kept in the process memory, for single-node deployments,
+    local runs and benchmarks. Nothing is persisted: the histories are
+    lost on restart and are not shared between nodes.
+
+    The messages are stored as given, they must not be modified afterwards.
+
+    Example:
+        >>> history_store = MemoryHistoryStore()
+        >>> await history_store.putTurn(session_id,1,messages,table_name)
+    """
+
+    def __init__(self):
+        """
+        Ctor
+        """
+        #(table_name,session_id) -> {turn: messages}
+        self.turns = {}
+        #(table_name,session_id) -> {"summary": "...", "summary_turn": N}
+        self.summaries = {}
+        #(table_name,cache_key) -> {"response": "...", "expires_at": N}
+        self.responses = {}
+
+    async def getTurns(self,session_id:str,table_name:str,limit:int=None,after_turn:int=0) -> list:
+        session = self.turns.get((table_name,session_id),{})
+        numbers = sorted(turn for turn in session if turn > after_turn)
+        if limit:
+            numbers = numbers[-limit:]
+        return [{"turn": turn, "messages": session[turn]} for turn in numbers]
+
+    async def getLastTurn(self,session_id:str,table_name:str) -> int:
+        return max(self.turns.get((table_name,session_id),{}),default=0)
+
+    async def putTurn(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        session = self.turns.setdefault((table_name,session_id),{})
+        if turn in session:
+            return {"error": "Turn already exists", "conflict": True}
+        session[turn] = messages
+        return {"message": "Turn saved successfully!", "last_turn": turn}
+
+    async def putTurns(self,session_id:str,turns:list,table_name:str,first_turn:int=1) -> dict:
+        session = self.turns.setdefault((table_name,session_id),{})
+        for turn, messages in enumerate(turns, start=first_turn):
+            session[turn] = messages
+        return {"message": "Turns saved successfully!", "last_turn": first_turn+len(turns)-1}
+
+    async def getSummary(self,session_id:str,table_name:str) -> dict:
+        summary = self.summaries.get((table_name,session_id))
+        return dict(summary) if summary != None else None
+
+    async def putSummary(self,session_id:str,summary:str,summary_turn:int,table_name:str) -> dict:
+        self.summaries[(table_name,session_id)] = {"summary": summary, "summary_turn": summary_turn}
+        return {"message": "Summary saved successfully!"}
+
+    async def getCachedResponse(self,cache_key:str,table_name:str) -> dict:
+        item = self.responses.get((table_name,cache_key))
+        if item != None and item["expires_at"] <= time.time():
+            del self.responses[(table_name,cache_key)]
+            return None
+        return dict(item) if item != None else None
+
+    async def putCachedResponse(self,cache_key:str,response:str,expires_at:int,table_name:str,if_absent:bool=False) -> dict:
+        item = self.responses.get((table_name,cache_key))
+        if if_absent and item != None and item["expires_at"] > time.time():
+            return {"error": "Response already exists", "conflict": True}
+        self.responses[(table_name,cache_key)] = {"response": response, "expires_at": int(expires_at)}
+        return {"message": "Response cached successfully!"}
@@ -0,0 +1,180 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import GaugeMetricFamily
+from starlette.routing import Match
+import time
+
+
+class Metrics:
+    """
+    Prometheus metrics of the API, in a registry of their own.
+
+    Phases of a request (history read, chat init, Gemini, history save...)
+    are recorded in one histogram labelled by phase, model and status.
+    The counters of the caches and of the write-behind queue are read
+    when the metrics are scraped.
+
+    Example:
+        >>> metrics = Metrics("gemini-2.0-flash")
+        >>> start = time.perf_counter()
+        >>> ...
+        >>> metrics.observePhase("history_read",start)
+        >>> metrics.addStats("history_cache",history_cache.stats)
+        >>> body = metrics.export()
+    """
+
+    NAMESPACE = "gemini_api"
+    CONTENT_TYPE = CONTENT_TYPE_LATEST
+    LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+    SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+    TURN_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+    def __init__(self,model_name:str=""):
+        """
+        Ctor
+
+        Args:
+            model_name (str): value of the "model" label, can be changed once the model is known
+        """
+        self.model_name = model_name
+        self.registry = CollectorRegistry()
+        #name -> StatsCollector
+        self.collectors = {}
+        self.phases = Histogram("phase_seconds","Duration of the phases of a request",
+                                ["phase","model","status"],namespace=self.NAMESPACE,
+                                buckets=self.LATENCY_BUCKETS,registry=self.registry)
+        self.requests = Counter("requests","HTTP requests",["endpoint","method","status"],
+                                namespace=self.NAMESPACE,registry=self.registry)
+        self.request_seconds = Histogram("request_seconds","Duration of the HTTP requests, until the end of the body",
+                                         ["endpoint","method"],namespace=self.NAMESPACE,
+                                         buckets=self.LATENCY_BUCKETS,registry=self.registry)
+        self.in_flight = Gauge("requests_in_flight","HTTP requests being processed",["endpoint"],
+                               namespace=self.NAMESPACE,registry=self.registry)
+        self.errors = Counter("errors","Errors by cause",["cause"],
+                              namespace=self.NAMESPACE,registry=self.registry)
+        self.response_size = Histogram("response_size_bytes","Size of the Gemini replies",["model"],
+                                       namespace=self.NAMESPACE,buckets=self.SIZE_BUCKETS,registry=self.registry)
+        self.history_turns = Histogram("history_turns","Number of turns of the history sent to Gemini",["model"],
+                                       namespace=self.NAMESPACE,buckets=self.TURN_BUCKETS,registry=self.registry)
+        self.history_size = Histogram("history_size_bytes","Size of the history sent to Gemini",["model"],
+                                      namespace=self.NAMESPACE,buckets=self.SIZE_BUCKETS,registry=self.registry)
+
+    def observePhase(self,phase:str,start:float,status:str="ok") -> None:
+        """
+        Record the duration of a phase
+
+        Args:
+            phase (str): the phase, e.g. "history_read", "gemini", "history_save"
+            start (float): time.perf_counter() at the start of the phase
+            status (str): "ok" or "error"
+        """
+        self.phases.labels(phase,self.model_name,status).observe(time.perf_counter()-start)
+
+    def observeError(self,cause:str) -> None:
+        """
+        Count an error, e.g. "history_read", "chat_init", "gemini", "client_disconnect"
+        """
+        self.errors.labels(cause).inc()
+
+    def observeResponse(self,response:str) -> None:
+        """
+        Record the size of a reply
+        """
+        self.response_size.labels(self.model_name).observe(len(response.encode("utf-8")))
+
+    def observeHistory(self,history:list) -> None:
+        """
+        Record the number of turns and the size of the history sent to Gemini
+        """
+        history = history or []
+        self.history_turns.labels(self.model_name).observe(len(history)//2)
+        self.history_size.labels(self.model_name).observe(sum(len(message.get("parts") or "") for message in history))
+
+    def addStats(self,name:str,stats) -> None:
+        """
+        Export the counters of a component, read on each scrape
+
+        Args:
+            name (str): prefix of the metrics, e.g. "history_cache"
+            stats: function returning a flat dict of numbers (e.g. HistoryCache.stats),
+                   the nested dicts are ignored
+        """
+        if name in self.collectors:
+            self.registry.unregister(self.collectors[name])
+        self.collectors[name] = StatsCollector(f"{self.NAMESPACE}_{name}",stats)
+        self.registry.register(self.collectors[name])
+
+    def export(self) -> bytes:
+        """
+        Metrics in the Prometheus text format
+        """
+        return generate_latest(self.registry)
+
+
+class StatsCollector:
+    """
+    Prometheus collector exporting the values of a stats() function as gauges
+    """
+
+    def __init__(self,prefix:str,stats):
+        self.prefix = prefix
+        self.stats = stats
+
+    def describe(self) -> list:
+        #Metric names depend on the stats, don't check them on register
+        return []
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if isinstance(value,(int,float)) and not isinstance(value,bool):
+                family = GaugeMetricFamily(f"{self.prefix}_{key}",f"{self.prefix} {key}")
+                family.add_metric([],value)
+                yield family
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting the HTTP requests, the requests in flight
+    and their duration until the last byte of the body is sent (streams included).
+    The endpoint label is the path of the matched route, e.g. /get-item/{session_id}
+    """
+
+    def __init__(self,app,metrics:Metrics,router):
+        self.app = app
+        self.metrics = metrics
+        self.router = router
+
+    def endpoint(self,scope:dict) -> str:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route,"path",scope["path"])
+        return "unmatched"
+
+    async def __call__(self,scope,receive,send):
+        if scope["type"] != "http":
+            await self.app(scope,receive,send)
+            return
+
+        endpoint = self.endpoint(scope)
+        status = {"code": 500}
+
+        async def sendMessage(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = self.metrics.in_flight.labels(endpoint)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope,receive,sendMessage)
+        finally:
+            in_flight.dec()
+            self.metrics.request_seconds.labels(endpoint,scope["method"]).observe(time.perf_counter()-start)
+            self.metrics.requests.labels(endpoint,scope["method"],str(status["code"])).inc()
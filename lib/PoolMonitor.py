@@ -0,0 +1,112 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from aiobotocore.httpsession import AIOHTTPSession
+import time
+
+
+class PoolMonitor:
+    """
+    Usage of the connection pool of an aiobotocore client: connections in
+    use, requests waiting for a connection and the time spent getting one
+    (waiting for a free connection when the pool is full, or opening one).
+
+    The client must be created with the http session class of the monitor.
+
+    Example:
+        >>> monitor = PoolMonitor(max_connections=64)
+        >>> config = AioConfig(max_pool_connections=64,http_session_cls=monitor.sessionClass())
+        >>> async with session.create_client("dynamodb",config=config) as client:
+        >>>     ...
+        >>> monitor.stats()
+    """
+
+    def __init__(self,max_connections:int,wait_callback=None):
+        """
+        Ctor
+
+        Args:
+            max_connections (int): size of the pool (max_pool_connections of the client)
+            wait_callback: optional function called with the start time (time.perf_counter)
+                           of each connection request once it got its connection
+        """
+        self.max_connections = max_connections
+        self.wait_callback = wait_callback
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.queued = 0
+        self.wait_seconds = 0.0
+
+    def sessionClass(self):
+        """
+        Http session class of the client (AioConfig http_session_cls)
+        recording the use of its connection pool in this monitor
+        """
+        monitor = self
+
+        class MonitoredHttpSession(AIOHTTPSession):
+
+            def _create_connector(self,proxy_url):
+                return monitor.watch(super()._create_connector(proxy_url))
+
+        return MonitoredHttpSession
+
+    def watch(self,connector):
+        """
+        Record the connections given by an aiohttp connector
+
+        Returns:
+            connector: the connector
+        """
+        connect = connector.connect
+
+        async def monitoredConnect(req,traces,timeout):
+            start = time.perf_counter()
+            if self.in_use >= self.max_connections:
+                self.queued += 1
+            self.waiting += 1
+            try:
+                connection = await connect(req,traces,timeout)
+            finally:
+                self.waiting -= 1
+                self.wait_seconds += time.perf_counter()-start
+            self.acquired += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use,self.in_use)
+            connection.add_callback(self.released)
+            if self.wait_callback != None:
+                self.wait_callback(start)
+            return connection
+
+        connector.connect = monitoredConnect
+        return connector
+
+    def released(self) -> None:
+        self.in_use -= 1
+
+    def stats(self) -> dict:
+        """
+        Pool counters, queued is the number of requests that found the pool full
+
+        Returns:
+            json: Format
+            {
+                "size": ..., "in_use": ..., "peak_in_use": ..., "utilization": ..., "waiting": ...,
+                "acquired": ..., "queued": ..., "wait_seconds": ...
+            }
+        """
+        return {
+            "size": self.max_connections,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "utilization": round(self.in_use/self.max_connections,3) if self.max_connections else 0,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "queued": self.queued,
+            "wait_seconds": round(self.wait_seconds,3),
+        }
@@ -0,0 +1,167 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import time
+
+
+class ResponseCache:
+    """
+    Exact-match cache of Gemini replies.
+
+    The key is a hash of the model name, the generation config and the
+    normalized history and prompt. Entries expire after a TTL and the
+    least recently used ones are evicted when the limits are reached.
+    With a table in a shared store (DynamoDb), the entries are shared between nodes.
+
+    Example:
+        >>> response_cache = ResponseCache(ttl=3600)
+        >>> key = ResponseCache.key("gemini-2.0-flash",None,history,prompt)
+        >>> response = await response_cache.get(key)
+        >>> await response_cache.put(key,response)
+    """
+
+    def __init__(self,ttl:int=3600,max_entries:int=10000,max_bytes:int=32*1024*1024,history_store=None,table_name:str=None):
+        """
+        Ctor
+
+        Args:
+            ttl (int): time to live of an entry in seconds
+            max_entries (int): maximum number of entries in memory
+            max_bytes (int): maximum size of the replies in memory
+            history_store (HistoryStore): optional, to share the entries between nodes
+            table_name (str): the table of the entries (cache_key hash key on DynamoDb)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.history_store = history_store
+        self.table_name = table_name
+        #key -> (response, expires_at)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(text:str) -> str:
+        """
+        Normalize a text for the key: trimmed and with single spaces
+        """
+        return re.sub(r"\s+"," ",text or "").strip()
+
+    @staticmethod
+    def key(model_name:str,generation_config:dict,history:list,prompt:str) -> str:
+        """
+        Build the key of a request
+
+        Args:
+            model_name (str): the model name
+            generation_config (dict): the generation config or None
+            history (list): the history sent with the prompt or None
+            prompt (str): the prompt
+
+        Returns:
+            str: sha256 of the request
+        """
+        request = {
+            "model": model_name,
+            "config": generation_config or {},
+            "history": [[message.get("role"),ResponseCache.normalize(message.get("parts"))] for message in history or []],
+            "prompt": ResponseCache.normalize(prompt),
+        }
+        return hashlib.sha256(json.dumps(request,sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def get(self,key:str) -> str:
+        """
+        Get a cached reply, from memory then from the store
+
+        Args:
+            key (str): the key of the request
+
+        Returns:
+            str: the reply or None
+        """
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry != None:
+            if entry[1] > now:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[0]
+            self.remove(key)
+
+        if self.history_store != None and self.table_name:
+            item = await self.history_store.getCachedResponse(key,self.table_name)
+            #The deletion of the expired items is lazy (DynamoDb TTL), check the expiration
+            if isinstance(item,dict) and item.get("response") != None and item["expires_at"] > now:
+                self.remote_hits += 1
+                self.store(key,item["response"],item["expires_at"])
+                return item["response"]
+
+        self.misses += 1
+        return None
+
+    async def put(self,key:str,response:str) -> None:
+        """
+        Cache a reply
+
+        Args:
+            key (str): the key of the request
+            response (str): the reply
+        """
+        if not response:
+            return
+        expires_at = int(time.time()+self.ttl)
+        self.store(key,response,expires_at)
+        if self.history_store != None and self.table_name:
+            await self.history_store.putCachedResponse(key,response,expires_at,self.table_name)
+
+    def store(self,key:str,response:str,expires_at:float) -> None:
+        """
+        Put an entry in memory then evict the least recently used
+        entries until the limits are respected
+        """
+        self.remove(key)
+        self.entries[key] = (response,expires_at)
+        self.size += len(response)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            evicted_key = next(iter(self.entries))
+            self.remove(evicted_key)
+            self.evictions += 1
+
+    def remove(self,key:str) -> None:
+        """
+        Remove an entry from memory
+        """
+        entry = self.entries.pop(key,None)
+        if entry != None:
+            self.size -= len(entry[0])
+
+    def stats(self) -> dict:
+        """
+        Cache counters
+
+        Returns:
+            json: Format
+            {
+                "entries": ..., "bytes": ..., "hits": ..., "remote_hits": ...,
+                "misses": ..., "evictions": ...
+            }
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "remote_hits": self.remote_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
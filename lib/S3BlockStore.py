@@ -0,0 +1,154 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class S3BlockStore:
+    """
+    Immutable blocks in an S3 bucket, used to offload the history turns
+    too large for a DynamoDb item (400 KB). The item only keeps a pointer.
+
+    Keys are content addressed (sha256 of the block): a block is never
+    modified once written, so the downloaded blocks are kept in a bounded
+    LRU cache without any invalidation, and retried writes are idempotent.
+    Blocks are downloaded in parallel, max_concurrency at a time.
+
+    Example:
+        >>> block_store = S3BlockStore(s3,"chat-history-overflow")
+        >>> key = block_store.blockKey(data,table_name,session_id,"12")
+        >>> await block_store.put(key,data)
+        >>> blocks = await block_store.getMany([pointer,...])
+    """
+
+    def __init__(self,s3,bucket:str,prefix:str="history/",max_bytes:int=32*1024*1024,max_concurrency:int=8):
+        """
+        Ctor
+
+        Args:
+            s3: aiobotocore "s3" client
+            bucket (str): the bucket of the blocks
+            prefix (str): prefix of the keys
+            max_bytes (int): maximum size of the cached blocks
+            max_concurrency (int): maximum number of downloads running at the same time
+        """
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        #key -> bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uploaded = 0
+        self.uploaded_bytes = 0
+        self.downloaded_bytes = 0
+
+    def blockKey(self,data:bytes,*parts:str) -> str:
+        """
+        Key of a block: prefix, the given parts (e.g. table, session, turn) and the block hash
+        """
+        return self.prefix + "/".join(parts+(hashlib.sha256(data).hexdigest(),))
+
+    async def put(self,key:str,data:bytes) -> dict:
+        """
+        Upload a block, it is also cached since it is likely read soon
+
+        Returns:
+            pointer (dict): {"bucket": ..., "key": ..., "bytes": ...}
+
+        Raises:
+            ClientError: if the upload fails
+        """
+        await self.s3.put_object(Bucket=self.bucket,Key=key,Body=data)
+        self.uploaded += 1
+        self.uploaded_bytes += len(data)
+        self.store(key,data)
+        return {"bucket": self.bucket, "key": key, "bytes": len(data)}
+
+    async def get(self,pointer:dict) -> bytes:
+        """
+        Get a block, from the cache or from S3
+
+        Args:
+            pointer (dict): {"bucket": ..., "key": ...}, the bucket is optional
+
+        Raises:
+            ClientError: if the download fails
+        """
+        key = pointer["key"]
+        data = self.entries.get(key)
+        if data != None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        async with self.semaphore:
+            try:
+                response = await self.s3.get_object(Bucket=pointer.get("bucket") or self.bucket,Key=key)
+                async with response["Body"] as body:
+                    data = await body.read()
+            except ClientError as e:
+                logger.error("S3BlockStore::get -> error : %s, key : %s",e.response['Error']['Message'],key)
+                raise
+        self.downloaded_bytes += len(data)
+        self.store(key,data)
+        return data
+
+    async def getMany(self,pointers:list) -> list:
+        """
+        Get blocks in parallel
+
+        Returns:
+            blocks (list): the blocks, in the order of the pointers
+        """
+        return await asyncio.gather(*(self.get(pointer) for pointer in pointers))
+
+    def store(self,key:str,data:bytes) -> None:
+        """
+        Put a block in the cache then evict the least recently used
+        blocks until the limit is respected
+        """
+        if key in self.entries or len(data) > self.max_bytes:
+            return
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Cache and transfer counters
+
+        Returns:
+            json: Format
+            {
+                "entries": ..., "bytes": ..., "hits": ..., "misses": ..., "evictions": ...,
+                "uploaded": ..., "uploaded_bytes": ..., "downloaded_bytes": ...
+            }
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "uploaded": self.uploaded,
+            "uploaded_bytes": self.uploaded_bytes,
+            "downloaded_bytes": self.downloaded_bytes,
+        }
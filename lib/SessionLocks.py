@@ -0,0 +1,109 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SessionLocks:
+    """
+    One lock per session so the requests of a session run one after the
+    other in this process (asyncio locks are fair, the waiting requests
+    get the lock in their arrival order). A lock only exists while a
+    request holds or waits for it.
+
+    A request waiting longer than timeout runs without the lock, the
+    conditional writes of the store still keep every turn (see
+    HistoryStore.appendTurn).
+
+    Example:
+        >>> session_locks = SessionLocks(timeout=60)
+        >>> release = await session_locks.acquire(session_id)
+        >>> try:
+        >>>     ...
+        >>> finally:
+        >>>     release()
+    """
+
+    def __init__(self,timeout:float=60):
+        """
+        Ctor
+
+        Args:
+            timeout (float): maximum wait for the lock in seconds, 0 to wait forever
+        """
+        self.timeout = timeout
+        #session_id -> [lock, number of requests holding or waiting for it]
+        self.locks = {}
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+
+    async def acquire(self,session_id:str):
+        """
+        Wait for the lock of a session
+
+        Returns:
+            release: function releasing the lock, it can be called several times
+        """
+        entry = self.locks.get(session_id)
+        if entry == None:
+            entry = self.locks[session_id] = [asyncio.Lock(),0]
+        entry[1] += 1
+        if entry[0].locked():
+            self.contended += 1
+
+        try:
+            if self.timeout:
+                await asyncio.wait_for(entry[0].acquire(),self.timeout)
+            else:
+                await entry[0].acquire()
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("SessionLocks::acquire -> timeout, running without the lock",extra={"session_id": session_id})
+            self.leave(session_id,entry)
+            return lambda: None
+        except BaseException:
+            self.leave(session_id,entry)
+            raise
+        self.acquired += 1
+
+        released = False
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                entry[0].release()
+                self.leave(session_id,entry)
+        return release
+
+    def leave(self,session_id:str,entry:list) -> None:
+        """
+        Drop the lock of a session once no request holds or waits for it
+        """
+        entry[1] -= 1
+        if entry[1] == 0 and self.locks.get(session_id) is entry:
+            del self.locks[session_id]
+
+    def stats(self) -> dict:
+        """
+        Lock counters
+
+        Returns:
+            json: Format
+            {
+                "sessions": ..., "waiting": ..., "acquired": ..., "contended": ..., "timeouts": ...
+            }
+        """
+        return {
+            "sessions": len(self.locks),
+            "waiting": sum(count - lock.locked() for lock, count in self.locks.values()),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "timeouts": self.timeouts,
+        }
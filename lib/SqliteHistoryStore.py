@@ -0,0 +1,257 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import sqlite3
+import time
+
+from lib.AsyncLogging import getPayloadLogger
+from lib.HistoryCodec import HistoryCodec
+from lib.HistoryStore import HistoryStore
+
+logger = logging.getLogger(__name__)
+payload_logger = getPayloadLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    table_name TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    messages NOT NULL,
+    PRIMARY KEY (table_name, session_id, turn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    table_name TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    summary_turn INTEGER NOT NULL,
+    PRIMARY KEY (table_name, session_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS responses (
+    table_name TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    response TEXT NOT NULL,
+    expires_at INTEGER NOT NULL,
+    PRIMARY KEY (table_name, cache_key)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteHistoryStore(HistoryStore):
+    """
+    History kept in a SQLite file, for single-node deployments.
+
+    The database is in WAL mode with synchronous=NORMAL: a write is one
+    append to the log, readers don't block the writer, and a committed
+    turn survives a crash of the process (the last turns may be lost on
+    a power failure). The connection is used by a single thread, the
+    queries run there so the event loop is never blocked. The messages
+    are json text or compressed blobs (see HistoryCodec).
+
+    Example:
+        >>> history_store = SqliteHistoryStore("history.db")
+        >>> await history_store.putTurn(session_id,1,messages,table_name)
+        >>> history_store.close()
+    """
+
+    def __init__(self,path:str="history.db",busy_timeout:int=5000,codec:HistoryCodec=None):
+        """
+        Open (or create) the database
+
+        Args:
+            path (str): the database file
+            busy_timeout (int): wait for a lock held by another process, in ms
+            codec (HistoryCodec): optional, encoding of the messages (json text by default)
+        """
+        self.path = path
+        self.codec = codec if codec != None else HistoryCodec()
+        self.busy_timeout = busy_timeout
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1,thread_name_prefix="sqlite")
+        self.executor.submit(self.connect).result()
+
+    def connect(self) -> None:
+        #Autocommit, the writes of several rows open their own transaction
+        self.connection = sqlite3.connect(self.path,isolation_level=None,check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        self.connection.executescript(SCHEMA)
+
+    async def run(self,function,*args):
+        """
+        Run a function on the thread of the connection
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor,function,*args)
+
+    def selectTurns(self,session_id:str,table_name:str,limit:int,after_turn:int) -> list:
+        #Newest first to apply the limit, -1 is no limit
+        rows = self.connection.execute(
+            "SELECT turn, messages FROM turns WHERE table_name=? AND session_id=? AND turn>?"
+            " ORDER BY turn DESC LIMIT ?",
+            (table_name,session_id,after_turn,limit or -1)).fetchall()
+        return [{"turn": turn, "messages": self.codec.decode(messages)} for turn, messages in reversed(rows)]
+
+    def insertTurns(self,rows:list,replace:bool=True) -> None:
+        #Without replace the whole batch fails if one turn already exists
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany(
+                f"INSERT {'OR REPLACE ' if replace else ''}INTO turns (table_name, session_id, turn, messages)"
+                " VALUES (?,?,?,?)",rows)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def execute(self,sql:str,parameters:tuple) -> list:
+        return self.connection.execute(sql,parameters).fetchall()
+
+    async def getTurns(self,session_id:str,table_name:str,limit:int=None,after_turn:int=0) -> list:
+        try:
+            turns = await self.run(self.selectTurns,session_id,table_name,limit,after_turn)
+            payload_logger.debug("SqliteHistoryStore::getTurns -> turns : %s",turns,extra={"session_id": session_id})
+            return turns
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getTurns -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def getLastTurn(self,session_id:str,table_name:str) -> int:
+        try:
+            rows = await self.run(self.execute,
+                "SELECT MAX(turn) FROM turns WHERE table_name=? AND session_id=?",(table_name,session_id))
+            return rows[0][0] or 0
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getLastTurn -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def putTurn(self,session_id:str,turn:int,messages:list,table_name:str) -> dict:
+        try:
+            await self.run(self.execute,
+                "INSERT INTO turns (table_name, session_id, turn, messages) VALUES (?,?,?,?)",
+                (table_name,session_id,turn,self.codec.encode(messages)))
+            return {"message": "Turn saved successfully!", "last_turn": turn}
+        except sqlite3.IntegrityError:
+            logger.info("SqliteHistoryStore::putTurn -> turn %s already exists",turn,extra={"session_id": session_id})
+            return {"error": "Turn already exists", "conflict": True}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::putTurn -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def putTurns(self,session_id:str,turns:list,table_name:str,first_turn:int=1) -> dict:
+        rows = [(table_name,session_id,turn,self.codec.encode(messages))
+                for turn, messages in enumerate(turns, start=first_turn)]
+        try:
+            await self.run(self.insertTurns,rows)
+            return {"message": "Turns saved successfully!", "last_turn": first_turn+len(turns)-1}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::putTurns -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def writeTurns(self,turns:list) -> list:
+        #One transaction for the batch, turn by turn (merge) if a turn already exists
+        rows = [(table_name,session_id,turn,self.codec.encode(messages))
+                for table_name, session_id, turn, messages in turns]
+        try:
+            await self.run(self.insertTurns,rows,False)
+            return [turn for _, _, turn, _ in turns]
+        except sqlite3.IntegrityError:
+            return await super().writeTurns(turns)
+
+    async def getSummary(self,session_id:str,table_name:str) -> dict:
+        try:
+            rows = await self.run(self.execute,
+                "SELECT summary, summary_turn FROM summaries WHERE table_name=? AND session_id=?",
+                (table_name,session_id))
+            if len(rows) == 0:
+                return None
+            return {"summary": rows[0][0], "summary_turn": rows[0][1]}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getSummary -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def getSummaries(self,session_ids:list,table_name:str) -> dict:
+        try:
+            summaries = {}
+            session_ids = list(dict.fromkeys(session_ids))
+            #SQLite limits the number of parameters of a query
+            for i in range(0,len(session_ids),500):
+                chunk = session_ids[i:i+500]
+                rows = await self.run(self.execute,
+                    "SELECT session_id, summary, summary_turn FROM summaries WHERE table_name=?"
+                    f" AND session_id IN ({','.join('?'*len(chunk))})",
+                    (table_name,*chunk))
+                summaries.update({session_id: {"summary": summary, "summary_turn": summary_turn}
+                                  for session_id, summary, summary_turn in rows})
+            return summaries
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getSummaries -> error : %s",e)
+            return {"error": str(e)}
+
+    async def putSummary(self,session_id:str,summary:str,summary_turn:int,table_name:str) -> dict:
+        try:
+            await self.run(self.execute,
+                "INSERT OR REPLACE INTO summaries (table_name, session_id, summary, summary_turn) VALUES (?,?,?,?)",
+                (table_name,session_id,summary,summary_turn))
+            return {"message": "Summary saved successfully!"}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::putSummary -> error : %s",e,extra={"session_id": session_id})
+            return {"error": str(e)}
+
+    async def getCachedResponse(self,cache_key:str,table_name:str) -> dict:
+        try:
+            rows = await self.run(self.execute,
+                "SELECT response, expires_at FROM responses WHERE table_name=? AND cache_key=?",
+                (table_name,cache_key))
+            if len(rows) == 0:
+                return None
+            if rows[0][1] <= time.time():
+                await self.run(self.execute,
+                    "DELETE FROM responses WHERE table_name=? AND cache_key=?",(table_name,cache_key))
+                return None
+            return {"response": rows[0][0], "expires_at": rows[0][1]}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getCachedResponse -> error : %s",e)
+            return {"error": str(e)}
+
+    async def putCachedResponse(self,cache_key:str,response:str,expires_at:int,table_name:str,if_absent:bool=False) -> dict:
+        try:
+            if if_absent:
+                #Only replaces an expired row, the statements of the connection thread run one at a time
+                rows = await self.run(self.execute,
+                    "INSERT INTO responses (table_name, cache_key, response, expires_at) VALUES (?,?,?,?)"
+                    " ON CONFLICT (table_name, cache_key) DO UPDATE SET response=excluded.response, expires_at=excluded.expires_at"
+                    " WHERE responses.expires_at <= ? RETURNING 1",
+                    (table_name,cache_key,response,int(expires_at),int(time.time())))
+                if len(rows) == 0:
+                    return {"error": "Response already exists", "conflict": True}
+                return {"message": "Response cached successfully!"}
+            await self.run(self.execute,
+                "INSERT OR REPLACE INTO responses (table_name, cache_key, response, expires_at) VALUES (?,?,?,?)",
+                (table_name,cache_key,response,int(expires_at)))
+            return {"message": "Response cached successfully!"}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::putCachedResponse -> error : %s",e)
+            return {"error": str(e)}
+
+    async def getTableStatus(self,table_name:str) -> dict:
+        try:
+            await self.run(self.execute,"SELECT 1 FROM turns LIMIT 1",())
+            return {"status": "ACTIVE"}
+        except sqlite3.Error as e:
+            logger.error("SqliteHistoryStore::getTableStatus -> error : %s",e)
+            return {"error": str(e)}
+
+    def close(self) -> None:
+        """
+        Close the connection (the WAL is checkpointed) and stop its thread
+        """
+        if self.connection != None:
+            self.executor.submit(self.connection.close).result()
+            self.connection = None
+        self.executor.shutdown()
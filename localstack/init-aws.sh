@@ -13,7 +13,75 @@ output=$(aws dynamodb create-table \
 
 echo "$output"
 
-#Put item into the table
+TABLE_HISTORY_TURNS="${TABLE_HISTORY_TURNS:-ChatHistoryTurns}"
+echo "Start creating '$TABLE_HISTORY_TURNS' with endpoint '$DYNAMODB_ENDPOINT' from '$AWS_DEFAULT_REGION'"
+# Create the per-turn history table, session_id as the hash key and turn as the sort key
+output=$(aws dynamodb create-table \
+    --table-name "$TABLE_HISTORY_TURNS" \
+    --attribute-definitions AttributeName=session_id,AttributeType=S AttributeName=turn,AttributeType=N \
+    --key-schema AttributeName=session_id,KeyType=HASH AttributeName=turn,KeyType=RANGE \
+    --billing-mode PAY_PER_REQUEST \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+TABLE_RESPONSE_CACHE="${TABLE_RESPONSE_CACHE:-ChatResponseCache}"
+echo "Start creating '$TABLE_RESPONSE_CACHE' with endpoint '$DYNAMODB_ENDPOINT' from '$AWS_DEFAULT_REGION'"
+# Create the shared response cache table, entries expire with the expires_at TTL attribute
+output=$(aws dynamodb create-table \
+    --table-name "$TABLE_RESPONSE_CACHE" \
+    --attribute-definitions AttributeName=cache_key,AttributeType=S \
+    --key-schema AttributeName=cache_key,KeyType=HASH \
+    --billing-mode PAY_PER_REQUEST \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+output=$(aws dynamodb update-time-to-live \
+    --table-name "$TABLE_RESPONSE_CACHE" \
+    --time-to-live-specification Enabled=true,AttributeName=expires_at \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+TABLE_IDEMPOTENCY="${TABLE_IDEMPOTENCY:-ChatIdempotency}"
+echo "Start creating '$TABLE_IDEMPOTENCY' with endpoint '$DYNAMODB_ENDPOINT' from '$AWS_DEFAULT_REGION'"
+# Create the idempotency keys table, keys expire with the expires_at TTL attribute
+output=$(aws dynamodb create-table \
+    --table-name "$TABLE_IDEMPOTENCY" \
+    --attribute-definitions AttributeName=cache_key,AttributeType=S \
+    --key-schema AttributeName=cache_key,KeyType=HASH \
+    --billing-mode PAY_PER_REQUEST \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+output=$(aws dynamodb update-time-to-live \
+    --table-name "$TABLE_IDEMPOTENCY" \
+    --time-to-live-specification Enabled=true,AttributeName=expires_at \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+HISTORY_OVERFLOW_BUCKET="${HISTORY_OVERFLOW_BUCKET:-chat-history-overflow}"
+echo "Start creating bucket '$HISTORY_OVERFLOW_BUCKET' with endpoint '$DYNAMODB_ENDPOINT' from '$AWS_DEFAULT_REGION'"
+# Create the bucket of the turns too large for a DynamoDB item
+output=$(aws s3api create-bucket \
+    --bucket "$HISTORY_OVERFLOW_BUCKET" \
+    --create-bucket-configuration LocationConstraint="$AWS_DEFAULT_REGION" \
+    --endpoint-url "$DYNAMODB_ENDPOINT" \
+    --region "$AWS_DEFAULT_REGION")
+
+echo "$output"
+
+#Put a legacy single-blob item into the table,
+#it is migrated to '$TABLE_HISTORY_TURNS' on first read
+
 echo "Start putting item into '$TABLE_HISTORY'"
 output=$(aws dynamodb put-item \
     --table-name "$TABLE_HISTORY" \
@@ -0,0 +1,67 @@
+"""
+  Copyright (c) 2025 Alexandre Kavadias
+
+  This project is licensed under the Educational and Non-Commercial Use License.
+  See the LICENSE file for details.
+
+  Migrate the single-blob histories of TABLE_HISTORY to the per-turn
+  table TABLE_HISTORY_TURNS. Sessions that already have turns are skipped,
+  the script can be run several times.
+
+  Usage:
+      docker exec gemini-api python localstack/migrate-history.py
+"""
+import os
+import sys
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lib.DynamoWrapper import DynamoWrapper
+
+
+TABLE_HISTORY=os.getenv('TABLE_HISTORY', "ChatHistory")
+TABLE_HISTORY_TURNS=os.getenv('TABLE_HISTORY_TURNS', "ChatHistoryTurns")
+
+dynamodb = boto3.resource(
+    "dynamodb",
+    endpoint_url= os.getenv('DYNAMODB_ENDPOINT', 'http://localhost:4566'),
+    region_name=os.getenv("AWS_DEFAULT_REGION","us-west-2"))
+#To read the turns offloaded to S3 (HISTORY_OVERFLOW_BUCKET)
+s3 = boto3.client(
+    "s3",
+    endpoint_url= os.getenv('S3_ENDPOINT', os.getenv('DYNAMODB_ENDPOINT', 'http://localhost:4566')),
+    region_name=os.getenv("AWS_DEFAULT_REGION","us-west-2"))
+dynamodb_wrapper = DynamoWrapper(dynamodb,s3=s3)
+
+migrated = skipped = errors = 0
+scan = {}
+while True:
+    response = dynamodb.Table(TABLE_HISTORY).scan(**scan)
+    for item in response["Items"]:
+        session_id = item["session_id"]
+        existing = dynamodb_wrapper.getTurns(session_id,TABLE_HISTORY_TURNS,1)
+        if not isinstance(existing,list):
+            #Not known to be migrated, left for the next run
+            print(f"migrate-history:: {session_id} -> {existing['error']}")
+            errors += 1
+            continue
+        if len(existing) > 0:
+            skipped += 1
+            continue
+        #Same path as the app: json string or Binary (HISTORY_COMPRESSION=zlib),
+        #inline or offloaded to S3 (overflow pointer)
+        try:
+            result = dynamodb_wrapper.migrateHistory(session_id,TABLE_HISTORY,TABLE_HISTORY_TURNS)
+        except Exception as e:
+            result = {"error": str(e)}
+        if not isinstance(result,list):
+            print(f"migrate-history:: {session_id} -> {result['error']}")
+            errors += 1
+            continue
+        migrated += 1
+    if "LastEvaluatedKey" not in response:
+        break
+    scan["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+print(f"migrate-history:: {migrated} sessions migrated, {skipped} already migrated, {errors} errors (run again)")